@@ -1,7 +1,75 @@
 from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils.exceptions import RetryAfter
 
 from . import settings
+from .db.fsm import SQLiteStorage
+from .metrics import REGISTRY
+from .middlewares import HandlerMetricsMiddleware, ProfilingMiddleware
 
-bot = Bot(token=settings.BOT_TOKEN)
-dispatcher = Dispatcher(bot, storage=MemoryStorage())
+MessagesSent = REGISTRY.counter(
+    "bot_messages_sent_total",
+    "Messages sent by the bot.",
+    ("chat_class",),
+)
+MessagesFailed = REGISTRY.counter(
+    "bot_messages_failed_total",
+    "Messages telegram refused or failed to accept.",
+    ("chat_class", "error"),
+)
+ApiThrottled = REGISTRY.counter(
+    "bot_api_throttled_total",
+    "Bot API requests answered with 429 Too Many Requests.",
+    ("method",),
+)
+
+
+def chat_class(chat_id: int | str | None) -> str:
+    """Kind of chat by its id: `private`, `group`,
+    `supergroup` (channels included) or `channel` for usernames."""
+    if chat_id is None:
+        return "unknown"
+    chat_id = str(chat_id)
+    if chat_id.startswith("@"):
+        return "channel"
+    if chat_id.startswith("-100"):
+        return "supergroup"
+    if chat_id.startswith("-"):
+        return "group"
+    return "private"
+
+
+def is_message_method(method: str) -> bool:
+    return (
+        method.startswith("send") and method != "sendChatAction"
+    ) or method in ("copyMessage", "forwardMessage")
+
+
+class InstrumentedBot(Bot):
+    """Bot which counts sent and failed messages by chat class
+    and requests throttled by telegram."""
+
+    async def request(self, method: str, data: dict = None, *args, **kwargs):
+        try:
+            result = await super().request(method, data, *args, **kwargs)
+        except Exception as e:
+            if isinstance(e, RetryAfter):
+                ApiThrottled.inc(method=method)
+            if is_message_method(method):
+                MessagesFailed.inc(
+                    chat_class=chat_class((data or {}).get("chat_id")),
+                    error=type(e).__name__,
+                )
+            raise
+        if is_message_method(method):
+            MessagesSent.inc(chat_class=chat_class(data.get("chat_id")))
+        return result
+
+
+bot = InstrumentedBot(
+    token=settings.BOT_TOKEN,
+    server=TelegramAPIServer.from_base(settings.BOT_API_URL),
+)
+dispatcher = Dispatcher(bot, storage=SQLiteStorage())
+dispatcher.middleware.setup(HandlerMetricsMiddleware())
+dispatcher.middleware.setup(ProfilingMiddleware())
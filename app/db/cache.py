@@ -0,0 +1,104 @@
+from collections import OrderedDict, defaultdict
+from threading import Lock
+from typing import Any, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import settings
+from app.metrics import REGISTRY
+
+CacheHits = REGISTRY.counter(
+    "db_query_cache_hits_total",
+    "Number of query results served from cache.",
+    ("table",),
+)
+CacheMisses = REGISTRY.counter(
+    "db_query_cache_misses_total",
+    "Number of query results fetched from db.",
+    ("table",),
+)
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of query results.
+
+    Every entry remembers generation of its table at the moment
+    the entry was stored. Bumping table generation with `invalidate`
+    makes all entries of the table stale at once,
+    so nothing has to be searched and removed.
+
+    :param maxsize: Maximum number of stored results.
+    """
+
+    # Generations are shared by all caches, so a write through
+    # any manager invalidates results cached by the others.
+    _generations: dict[str, int] = defaultdict(int)
+
+    def __init__(self, maxsize: int = settings.QUERY_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[int, Any]] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @classmethod
+    def invalidate(cls, tablename: str) -> None:
+        """Make all cached results of `tablename` table stale."""
+        cls._generations[tablename] += 1
+
+    @classmethod
+    def generation(cls, tablename: str) -> int:
+        """Number of times `tablename` table was invalidated."""
+        return cls._generations[tablename]
+
+    def get(self, tablename: str, key: Hashable) -> Any | None:
+        """Return cached result or None if it's missing or stale."""
+        generation = self._generations[tablename]
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] == generation:
+                self._data.move_to_end(key)
+                self.hits += 1
+                CacheHits.inc(table=tablename)
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+        CacheMisses.inc(table=tablename)
+
+    def set(self, tablename: str, key: Hashable, value: Any) -> None:
+        """Store result and evict least recently used ones if cache is full."""
+        generation = self._generations[tablename]
+        with self._lock:
+            self._data[key] = (generation, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self) -> dict[str, int]:
+        """Cache statistics."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+@event.listens_for(Session, "after_flush")
+def invalidate_flushed_tables(session: Session, _) -> None:
+    """Invalidate tables changed through ORM unit of work,
+    e.g. by `session.add` or `session.delete`."""
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if tablename := getattr(instance, "__tablename__", None):
+            QueryCache.invalidate(tablename)
@@ -0,0 +1,269 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from itertools import islice
+from logging.config import fileConfig
+
+from aiogram.dispatcher.storage import BaseStorage
+from sqlalchemy import Engine, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import settings
+
+from .models import FSMState
+from .shared import db_engine as prod_db_engine
+from .shared import get_session
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+Address = tuple[str, str]
+VALUE_COLUMNS = ("state", "data", "bucket", "updated")
+
+
+class StateEntry:
+    """State, data and bucket of one user in one chat."""
+
+    __slots__ = ("state", "data", "bucket", "updated")
+
+    def __init__(
+        self,
+        state: str = None,
+        data: dict = None,
+        bucket: dict = None,
+        updated: float = 0,
+    ) -> None:
+        self.state = state
+        self.data = data or {}
+        self.bucket = bucket or {}
+        self.updated = updated
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data and not self.bucket
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage which keeps dialogue states in memory
+    and persists them to `FSMState` table, so dialogues
+    survive bot restarts.
+
+    Reads are served from memory, db is queried only for
+    users not seen since start. Changes are written to db
+    in batches, once per `flush_interval` seconds.
+    States not changed for `ttl` seconds are dropped
+    from memory and db. Memory holds at most `max_entries`
+    states, least recently used ones are evicted after
+    they have been written.
+
+    :param engine: Engine of db with `FSMState` table.
+    :param ttl: Number of seconds idle state is kept.
+    :param flush_interval: Number of seconds to collect changes
+        for one write.
+    :param max_entries: Maximum number of states kept in memory.
+    """
+
+    def __init__(
+        self,
+        engine: Engine = None,
+        ttl: float = settings.FSM_STATE_TTL,
+        flush_interval: float = settings.FSM_FLUSH_INTERVAL,
+        max_entries: int = settings.FSM_MAX_ENTRIES,
+    ) -> None:
+        self.engine = engine or prod_db_engine
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Address, StateEntry] = OrderedDict()
+        self._dirty: set[Address] = set()
+        self._flusher: asyncio.Task = None
+
+    def __len__(self) -> int:
+        """Number of states kept in memory."""
+        return len(self._entries)
+
+    async def close(self) -> None:
+        """Write pending changes to db."""
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        self.flush()
+
+    async def wait_closed(self) -> None:
+        pass
+
+    async def get_state(
+        self, *, chat=None, user=None, default: str = None
+    ) -> str | None:
+        entry = self._resolve(chat, user)
+        if entry.state is None:
+            return self.resolve_state(default)
+        return entry.state
+
+    async def get_data(self, *, chat=None, user=None, default=None) -> dict:
+        return copy.deepcopy(self._resolve(chat, user).data)
+
+    async def set_state(self, *, chat=None, user=None, state=None) -> None:
+        key = self._address(chat, user)
+        self._get(key).state = self.resolve_state(state)
+        self._changed(key)
+
+    async def set_data(self, *, chat=None, user=None, data: dict = None):
+        key = self._address(chat, user)
+        self._get(key).data = copy.deepcopy(data or {})
+        self._changed(key)
+
+    async def update_data(
+        self, *, chat=None, user=None, data: dict = None, **kwargs
+    ) -> None:
+        key = self._address(chat, user)
+        self._get(key).data.update(data or {}, **kwargs)
+        self._changed(key)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._address(chat, user)
+        entry = self._get(key)
+        entry.state = None
+        if with_data:
+            entry.data = {}
+        self._changed(key)
+
+    def has_bucket(self) -> bool:
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None) -> dict:
+        return copy.deepcopy(self._resolve(chat, user).bucket)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket: dict = None):
+        key = self._address(chat, user)
+        self._get(key).bucket = copy.deepcopy(bucket or {})
+        self._changed(key)
+
+    async def update_bucket(
+        self, *, chat=None, user=None, bucket: dict = None, **kwargs
+    ) -> None:
+        key = self._address(chat, user)
+        self._get(key).bucket.update(bucket or {}, **kwargs)
+        self._changed(key)
+
+    def flush(self) -> int:
+        """Write changed states to db in one transaction
+        and delete expired ones.
+
+        :returns: Number of written states.
+        """
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for key in keys:
+            entry = self._entries[key]
+            if entry.is_empty():
+                deletes.append(key)
+                continue
+            upserts.append(
+                {
+                    "chat": key[0],
+                    "user": key[1],
+                    "state": entry.state,
+                    "data": json.dumps(entry.data),
+                    "bucket": json.dumps(entry.bucket),
+                    "updated": entry.updated,
+                }
+            )
+
+        expired_before = time.time() - self.ttl
+        written = False
+        with get_session(self.engine) as session:
+            try:
+                for chat, user in deletes:
+                    session.execute(
+                        delete(FSMState).filter_by(chat=chat, user=user)
+                    )
+                if upserts:
+                    query = sqlite_insert(FSMState).values(upserts)
+                    query = query.on_conflict_do_update(
+                        index_elements=["chat", "user"],
+                        set_={
+                            column: query.excluded[column]
+                            for column in VALUE_COLUMNS
+                        },
+                    )
+                    session.execute(query)
+                session.execute(
+                    delete(FSMState).filter(FSMState.updated < expired_before)
+                )
+                session.commit()
+                written = True
+            except SQLAlchemyError as e:
+                logger.error(f"<SQLiteStorage> flush [FAILURE!]: {e}")
+                session.rollback()
+
+        if not written:
+            # Keep changes for the next attempt.
+            self._dirty |= keys
+            return 0
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if entry.updated < expired_before and key not in self._dirty
+        ]:
+            del self._entries[key]
+        self._evict()
+        return len(upserts) + len(deletes)
+
+    def _address(self, chat, user) -> Address:
+        chat, user = map(str, self.check_address(chat=chat, user=user))
+        return chat, user
+
+    def _resolve(self, chat, user) -> StateEntry:
+        return self._get(self._address(chat, user))
+
+    def _get(self, key: Address) -> StateEntry:
+        """Entry of `key` from memory or db. Expired entry
+        is replaced with an empty one."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._evict(room=1)
+            entry = self._entries[key] = self._load(key)
+        else:
+            self._entries.move_to_end(key)
+        if entry.updated < time.time() - self.ttl and not entry.is_empty():
+            entry.state, entry.data, entry.bucket = None, {}, {}
+            self._changed(key)
+        return entry
+
+    def _load(self, key: Address) -> StateEntry:
+        entry = None
+        with get_session(self.engine) as session:
+            if row := session.get(FSMState, key):
+                entry = StateEntry(
+                    row.state,
+                    json.loads(row.data),
+                    json.loads(row.bucket),
+                    row.updated,
+                )
+        # Users without saved state are remembered too,
+        # so they don't hit db on every update.
+        return entry or StateEntry(updated=time.time())
+
+    def _changed(self, key: Address) -> None:
+        self._entries[key].updated = time.time()
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self.flush()
+
+    def _evict(self, room: int = 0) -> None:
+        """Drop least recently used written entries, so that
+        `room` more entries fit into `self.max_entries`."""
+        excess = len(self._entries) + room - self.max_entries
+        if excess <= 0:
+            return
+        clean = (key for key in self._entries if key not in self._dirty)
+        for key in list(islice(clean, excess)):
+            del self._entries[key]
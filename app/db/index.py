@@ -0,0 +1,193 @@
+import datetime as dt
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Iterable, NamedTuple
+
+from app import settings
+from app.utils import normalize_name
+
+# Days of year are counted in a leap year,
+# so 29 of February has its own day.
+LEAP_YEAR = 2000
+DAYS_IN_YEAR = 366
+CALENDAR = [
+    dt.date(LEAP_YEAR, 1, 1) + dt.timedelta(days=i)
+    for i in range(DAYS_IN_YEAR)
+]
+
+
+class DateRecord(NamedTuple):
+    """Name and birth date of a row without ORM overhead."""
+
+    name: str
+    month: int
+    day: int
+
+
+def day_of_year(month: int, day: int) -> int:
+    """Zero based number of the day in a leap year."""
+    return dt.date(LEAP_YEAR, month, day).timetuple().tm_yday - 1
+
+
+class DayIndex:
+    """
+    In-memory index of birthdays sorted by day of year.
+
+    Data is kept in parallel compact arrays: days of year
+    and offsets of names in one joined string.
+    Any date window, including one crossing new year,
+    is two bisects and a slice.
+
+    `generation` is set by the owner of the index to tell
+    which version of the table the index was built from.
+    """
+
+    def __init__(self) -> None:
+        self.generation: int = None
+        self._days = array("H")
+        self._offsets = array("I", [0])
+        self._names = ""
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def build(self, records: Iterable[DateRecord], generation: int) -> None:
+        """Replace index content with `records`."""
+        entries = sorted(
+            (day_of_year(record.month, record.day), record.name)
+            for record in records
+        )
+        self._days = array("H", (day for day, _ in entries))
+        self._offsets = array("I", [0])
+        for _, name in entries:
+            self._offsets.append(self._offsets[-1] + len(name))
+        self._names = "".join(name for _, name in entries)
+        self.generation = generation
+
+    def between(self, start: dt.date, end: dt.date) -> list[DateRecord]:
+        """Records with birthdays between `start` and `end` inclusive,
+        regardless of the year, ordered from `start`."""
+        if end < start:
+            return []
+        first = day_of_year(start.month, start.day)
+        last = day_of_year(end.month, end.day)
+        left = bisect_left(self._days, first)
+        if (end - start).days >= DAYS_IN_YEAR - 1:
+            # Window covers the whole year.
+            return self._slice(left, len(self)) + self._slice(0, left)
+        if first <= last and start.year == end.year:
+            return self._slice(left, bisect_right(self._days, last))
+        return self._slice(left, len(self)) + self._slice(
+            0, bisect_right(self._days, last)
+        )
+
+    def _slice(self, start: int, stop: int) -> list[DateRecord]:
+        names, offsets, days = self._names, self._offsets, self._days
+        return [
+            DateRecord(
+                names[offsets[i] : offsets[i + 1]],
+                CALENDAR[days[i]].month,
+                CALENDAR[days[i]].day,
+            )
+            for i in range(start, stop)
+        ]
+
+
+def trigrams(word: str) -> set[str]:
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+class NameIndex:
+    """
+    In-memory index of birthdays for search by name.
+
+    Words of at least 3 chars are looked up by trigrams,
+    shorter words are treated as prefixes of name words
+    and looked up by bisect in the sorted list of all words.
+    Results of recent queries are cached until the next `build`.
+
+    :param cache_size: Maximum number of cached query results.
+    """
+
+    def __init__(self, cache_size: int = settings.QUERY_CACHE_SIZE) -> None:
+        self.generation: int = None
+        self.cache_size = cache_size
+        self._records: list[DateRecord] = []
+        self._normalized: list[str] = []
+        self._trigrams: dict[str, set[int]] = {}
+        self._words: list[tuple[str, int]] = []
+        self._cache: OrderedDict[tuple, list[DateRecord]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def build(self, records: Iterable[DateRecord], generation: int) -> None:
+        """Replace index content with `records`."""
+        entries = sorted(
+            (normalize_name(record.name), record) for record in records
+        )
+        self._normalized = [normalized for normalized, _ in entries]
+        self._records = [record for _, record in entries]
+        self._trigrams = {}
+        self._words = []
+        for i, normalized in enumerate(self._normalized):
+            for trigram in trigrams(normalized):
+                self._trigrams.setdefault(trigram, set()).add(i)
+            self._words.extend((word, i) for word in normalized.split())
+        self._words.sort()
+        self._cache.clear()
+        self.generation = generation
+
+    def search(self, query: str, limit: int = 20) -> list[DateRecord]:
+        """Records which names contain all words of `query`,
+        ordered by name."""
+        words = tuple(normalize_name(query).split())
+        if not words:
+            return []
+        key = (words, limit)
+        if (found := self._cache.get(key)) is not None:
+            self._cache.move_to_end(key)
+            return found
+
+        candidates = None
+        for word in sorted(words, key=len, reverse=True):
+            ids = self._lookup(word)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                break
+        found = [
+            self._records[i]
+            for i in sorted(candidates)
+            if self._matches(i, words)
+        ][:limit]
+
+        self._cache[key] = found
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return found
+
+    def _lookup(self, word: str) -> set[int]:
+        """Ids of records which may contain `word`."""
+        if len(word) < 3:
+            start = bisect_left(self._words, (word,))
+            ids = set()
+            for other, i in self._words[start:]:
+                if not other.startswith(word):
+                    break
+                ids.add(i)
+            return ids
+        postings = [self._trigrams.get(t, set()) for t in trigrams(word)]
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+    def _matches(self, i: int, words: tuple[str, ...]) -> bool:
+        """Trigrams only preselect records, check words for real."""
+        normalized = self._normalized[i]
+        name_words = normalized.split()
+        return all(
+            word in normalized
+            if len(word) >= 3
+            else any(other.startswith(word) for other in name_words)
+            for word in words
+        )
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from logging.config import fileConfig
+from typing import Awaitable, Callable
+
+from sqlalchemy import Engine, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import settings
+
+from .models import LeaderLease
+from .shared import db_engine as prod_db_engine
+from .shared import get_session
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+OnChange = Callable[[bool], Awaitable[None]]
+
+
+def default_holder() -> str:
+    """Name of this bot instance, unique across hosts and processes."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaderElection:
+    """
+    Lease-based election of one leader among bot instances
+    sharing the db. The lease is a `LeaderLease` row, which
+    the leader renews every `heartbeat` seconds. Other instances
+    try to take it over at the same pace and succeed once
+    the lease is `ttl` seconds old, so failover takes at most
+    `ttl + heartbeat` seconds.
+
+    Leader which fails to renew the lease steps down at once.
+    `on_change` callback learns about it only on the next round,
+    so work started by it must check `is_leader` itself,
+    which turns False as soon as the lease expires.
+
+    :param engine: Engine of db with `LeaderLease` table.
+    :param name: Name of the lease.
+    :param holder: Name of this instance, see `default_holder`.
+    :param ttl: Number of seconds lease is valid without renewal.
+    :param heartbeat: Number of seconds between renewals.
+    """
+
+    def __init__(
+        self,
+        engine: Engine = None,
+        name: str = "scheduler",
+        holder: str = None,
+        ttl: float = settings.LEADER_LEASE_TTL,
+        heartbeat: float = settings.LEADER_HEARTBEAT,
+    ) -> None:
+        self.engine = engine or prod_db_engine
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        # Time the lease held by this instance is valid until.
+        self.expires: float = 0
+        self._leading = False
+        self._on_change: OnChange = None
+        self._task: asyncio.Task = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leading and time.time() < self.expires
+
+    def acquire(self) -> bool:
+        """Take the lease if it's free or expired,
+        or renew it if it's held by this instance.
+
+        :returns: True if this instance holds the lease.
+        """
+        now = time.time()
+        expires = now + self.ttl
+        acquired = False
+        with get_session(self.engine) as session:
+            try:
+                query = sqlite_insert(LeaderLease).values(
+                    name=self.name, holder=self.holder, expires=expires
+                )
+                query = query.on_conflict_do_update(
+                    index_elements=["name"],
+                    set_={
+                        "holder": query.excluded.holder,
+                        "expires": query.excluded.expires,
+                    },
+                    where=(LeaderLease.holder == self.holder)
+                    | (LeaderLease.expires < now),
+                )
+                session.execute(query)
+                holder = session.scalar(
+                    select(LeaderLease.holder).filter_by(name=self.name)
+                )
+                session.commit()
+                acquired = holder == self.holder
+            except SQLAlchemyError as e:
+                logger.error(f"<LeaderElection> acquire [FAILURE!]: {e}")
+                session.rollback()
+        self.expires = expires if acquired else 0
+        return acquired
+
+    def release(self) -> None:
+        """Give the lease up, so another instance
+        takes it over without waiting for expiry."""
+        self.expires = 0
+        with get_session(self.engine) as session:
+            session.execute(
+                delete(LeaderLease).filter_by(
+                    name=self.name, holder=self.holder
+                )
+            )
+            session.commit()
+
+    async def start(self, on_change: OnChange) -> None:
+        """Run the first election round and keep running
+        them in background.
+
+        :param on_change: Coroutine function called with True
+            when this instance becomes leader and with False
+            when it steps down.
+        """
+        self._on_change = on_change
+        await self._elect()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop election rounds and release the lease."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self._leading:
+            self._leading = False
+            self.release()
+            logger.info(f"{self.holder} released {self.name} lease")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await self._elect()
+
+    async def _elect(self) -> None:
+        leading = self.acquire()
+        if leading == self._leading:
+            return
+        self._leading = leading
+        logger.info(
+            f"{self.holder} {'took' if leading else 'lost'} "
+            f"{self.name} lease"
+        )
+        try:
+            await self._on_change(leading)
+        except Exception as e:
+            logger.error(f"<LeaderElection> on_change [FAILURE!]: {e}")
+
+
+Leader = LeaderElection()
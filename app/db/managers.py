@@ -1,20 +1,27 @@
 import datetime as dt
 import logging
 from logging.config import fileConfig
-from typing import Any, Sequence, Type
+from typing import Any, Iterator, Sequence, Type
 
-from sqlalchemy import func, select
+from sqlalchemy import Row, Select, extract, func, select
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
+from app import settings
 from app.utils import today as today_
 
+from .cache import QueryCache
+from .index import DateRecord, DayIndex
+from .search import search, similar
 from .shared import Base
 from .shared import Session as session_
 
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
+# Result of date window queries: model instances, or rows
+# with model column values if results are cached.
+Instances = list[Type[Base]] | list[Row]
 
 
 class QueryManagerBase:
@@ -55,6 +62,41 @@ class QueryManagerBase:
 
 
 class DateQueryManager(QueryManagerBase):
+    """
+    Query manager for models with `date` attribute.
+
+    :param model: Model class to query.
+    :param cache: Optional `QueryCache` for date window queries.
+        Cached results are lightweight rows with model column values
+        as attributes, not model instances.
+    :param index: Optional `DayIndex` for `*_records` queries.
+        Rebuilt from the table on first query after each table update.
+    """
+
+    def __init__(
+        self,
+        model: Type[Base],
+        cache: QueryCache = None,
+        index: DayIndex = None,
+    ) -> None:
+        super().__init__(model)
+        self.cache = cache
+        self.index = index
+
+    def search(
+        self, session: Session, query: str, limit: int = 20
+    ) -> list[Type[Base]]:
+        """Fetch instances of `model` which names contain all words
+        of `query` regardless of case, word order and `ё`/`е` spelling."""
+        return search(session, self.model, query, limit)
+
+    def similar(
+        self, session: Session, name: str, limit: int = 5
+    ) -> list[Type[Base]]:
+        """Fetch instances of `model` which names contain all words
+        of `name` or consist of its words only."""
+        return similar(session, self.model, name, limit)
+
     def last(self, session: Session) -> Type[Base]:
         """Fetch last added instance of `model`."""
         return session.scalar(
@@ -69,7 +111,7 @@ class DateQueryManager(QueryManagerBase):
 
     def between(
         self, session: Session, start: dt.date | str, end: dt.date | str
-    ) -> list[Type[Base]]:
+    ) -> Instances:
         """
         Fetch all instances of `model` which have
         `date` attribute between given date borders.
@@ -77,27 +119,49 @@ class DateQueryManager(QueryManagerBase):
         Arguments for `start` and `end` may be passed as strings.
         In this case arguments must follow ISO format `yyyy-mm-dd'.
         If not, borders will be replaced with current year period.
+        Rows are returned instead of instances if `self.cache` is set.
         """
-        if isinstance(start, str):
-            try:
-                start = dt.date.fromisoformat(start)
-            except ValueError:
-                start = dt.date.fromisoformat(f"{today_().year}-01-01")
-        if isinstance(end, str):
-            try:
-                end = dt.date.fromisoformat(end)
-            except ValueError:
-                end = dt.date.fromisoformat(f"{today_().year}-12-31")
-
-        return session.scalars(
+        start, end = self._date_borders(start, end)
+        query = (
             select(self.model)
             .filter(self.model.date.between(start, end))
             .order_by(self.model.date, self.model.name)
-        ).all()
+        )
+        return self._fetch(session, query, "between", start, end)
+
+    def between_records(
+        self, session: Session, start: dt.date | str, end: dt.date | str
+    ) -> list[DateRecord]:
+        """
+        Fetch name, month and day of instances as lightweight
+        `DateRecord`s for birthdays between given date borders.
+
+        Unlike `between`, year of `date` is ignored, so
+        a window crossing new year includes birthdays of January.
+        Records are ordered by day starting from `start`.
+        Uses `self.index` if available, otherwise queries db.
+        """
+        start, end = self._date_borders(start, end)
+        if self._index_is_current(session):
+            return self.index.between(start, end)
+
+        if end < start:
+            return []
+        if (end - start).days >= 365:
+            # Window covers the whole year.
+            end = start - dt.timedelta(days=1)
+        elif end.year == start.year:
+            return self._month_day_records(session, start, end)
+        if (end.month, end.day) == (12, 31):
+            return self._month_day_records(session, start, end)
+        # Window crossing new year is fetched in two parts.
+        return self._month_day_records(
+            session, start, dt.date(1, 12, 31)
+        ) + self._month_day_records(session, dt.date(1, 1, 1), end)
 
     def today(
         self, session: Session, today: dt.date = None
-    ) -> list[Type[Base]]:
+    ) -> Instances:
         """
         Fetch all instances of `model` which have
         `date` attribute equal to today.
@@ -106,8 +170,11 @@ class DateQueryManager(QueryManagerBase):
         return self.between(session, today, today)
 
     def future(
-        self, session: Session, today: dt.date = None, delta: int = 3
-    ) -> list[Type[Base]]:
+        self,
+        session: Session,
+        today: dt.date = None,
+        delta: int = settings.FUTURE_SCOPE,
+    ) -> Instances:
         """Fetch all instances of `model` from db
         which have `date` attribute between tomorrow and delta."""
         today = today or today_()
@@ -115,15 +182,145 @@ class DateQueryManager(QueryManagerBase):
         end = today + dt.timedelta(days=delta)
         return self.between(session, start, end)
 
+    def today_records(
+        self, session: Session, today: dt.date = None
+    ) -> list[DateRecord]:
+        """Same as `today`, but returns `DateRecord`s."""
+        today = today or today_()
+        return self.between_records(session, today, today)
+
+    def future_records(
+        self,
+        session: Session,
+        today: dt.date = None,
+        delta: int = settings.FUTURE_SCOPE,
+    ) -> list[DateRecord]:
+        """Same as `future`, but returns `DateRecord`s."""
+        today = today or today_()
+        start = today + dt.timedelta(days=1)
+        end = today + dt.timedelta(days=delta)
+        return self.between_records(session, start, end)
+
     def future_all(
         self, session: Session, today: dt.date = None
-    ) -> list[Type[Base]]:
+    ) -> Instances:
         """Fetch all instances of `model` from db
         which have `date` attribute greater than today."""
         today = today or today_()
-        return session.scalars(
-            select(self.model).filter(self.model.date > today)
-        ).all()
+        query = select(self.model).filter(self.model.date > today)
+        return self._fetch(session, query, "future_all", today)
+
+    def stream_records(
+        self, session: Session, chunk_size: int = settings.EXPORT_CHUNK_SIZE
+    ) -> Iterator[DateRecord]:
+        """Iterate over records of all instances of `model`
+        ordered by month, day and name. Rows are fetched from db
+        in chunks of `chunk_size`, so memory use doesn't depend
+        on the size of the table. Uses `sqlite` specific syntax."""
+        query = (
+            select(
+                self.model.name,
+                extract("month", self.model.date),
+                extract("day", self.model.date),
+            )
+            .order_by(func.strftime("%m-%d", self.model.date), self.model.name)
+            .execution_options(yield_per=chunk_size)
+        )
+        for row in session.execute(query):
+            yield DateRecord._make(row)
+
+    def _month_day_records(
+        self, session: Session, start: dt.date, end: dt.date
+    ) -> list[DateRecord]:
+        """Fetch records with month and day of `date`
+        between month and day of `start` and `end`.
+        Uses `sqlite` specific syntax."""
+        month_day = func.strftime("%m-%d", self.model.date)
+        query = (
+            select(
+                self.model.name,
+                extract("month", self.model.date),
+                extract("day", self.model.date),
+            )
+            .filter(month_day.between(f"{start:%m-%d}", f"{end:%m-%d}"))
+            .order_by(month_day, self.model.name)
+        )
+        return self._fetch(
+            session,
+            query,
+            "month_day_records",
+            (start.month, start.day),
+            (end.month, end.day),
+            project=True,
+        )
+
+    def _index_is_current(self, session: Session) -> bool:
+        """Rebuild `self.index` if the table changed since last build.
+
+        :returns: False if there is no index or it couldn't be built.
+        """
+        if self.index is None:
+            return False
+        generation = QueryCache.generation(self.model.__tablename__)
+        if self.index.generation == generation:
+            return True
+        query = select(
+            self.model.name,
+            extract("month", self.model.date),
+            extract("day", self.model.date),
+        )
+        try:
+            records = map(DateRecord._make, session.execute(query))
+            self.index.build(records, generation)
+        except SQLAlchemyError as e:
+            logger.error(f"<DateQueryManager> build index [FAILURE!]: {e}")
+            return False
+        return True
+
+    @staticmethod
+    def _date_borders(
+        start: dt.date | str, end: dt.date | str
+    ) -> tuple[dt.date, dt.date]:
+        """Convert string date borders to dates.
+        Invalid strings are replaced with current year period."""
+        if isinstance(start, str):
+            try:
+                start = dt.date.fromisoformat(start)
+            except ValueError:
+                start = dt.date.fromisoformat(f"{today_().year}-01-01")
+        if isinstance(end, str):
+            try:
+                end = dt.date.fromisoformat(end)
+            except ValueError:
+                end = dt.date.fromisoformat(f"{today_().year}-12-31")
+        return start, end
+
+    def _fetch(
+        self, session: Session, query: Select, *key: Any, project: bool = False
+    ) -> Instances | list[DateRecord]:
+        """Execute `query` or take its result from `self.cache`.
+        Model instances can't outlive their session, so if `self.cache`
+        is set, rows with model column values are returned instead.
+
+        :param key: Method name and arguments the result is cached by.
+        :param project: If True, `query` selects `DateRecord` fields.
+        """
+        if self.cache is None and not project:
+            return session.scalars(query).all()
+
+        tablename = self.model.__tablename__
+        rows = None
+        if self.cache is not None:
+            rows = self.cache.get(tablename, key)
+        if rows is None:
+            if project:
+                rows = tuple(map(DateRecord._make, session.execute(query)))
+            else:
+                columns = self.model.__table__.columns
+                rows = tuple(session.execute(query.with_only_columns(*columns)))
+            if self.cache is not None:
+                self.cache.set(tablename, key, rows)
+        return list(rows)
 
 
 class BirthdayManipulationManager:
@@ -157,6 +354,7 @@ class BirthdayManipulationManager:
             session.bulk_insert_mappings(self.model, mappings)
             session.commit()
             num_inserted = len(mappings)
+            QueryCache.invalidate(self.model.__tablename__)
         except SQLAlchemyError as e:
             logger.error(
                 f"Refresh {self.model.__class__} table [FAILURE]!"
@@ -168,11 +366,49 @@ class BirthdayManipulationManager:
 
         return num_inserted
 
+    def upsert_mappings(
+        self, mappings: Sequence[dict[str, Any]], session: Session = None
+    ) -> int:
+        """Insert model mappings into `self.model` table in one statement.
+        Rows with already existing `name` get their `date` updated.
+        Uses `sqlite` specific syntax.
+
+        :param mappings: Sequence of `dict`s that implement
+            mappings of values to model attributes.
+        :param session: SQLAlchemy session to provide insert operations.
+
+        :returns: Number of upserted rows (0 if nothing was upserted)."""
+        if not mappings:
+            return 0
+        if session is None:
+            session = session_
+        insert_stmt = sqlite_insert(self.model.__table__).values(
+            list(mappings)
+        )
+        upsert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=("name",),
+            set_={"date": insert_stmt.excluded.date},
+        )
+        num_upserted = 0
+        try:
+            session.execute(upsert_stmt)
+            session.commit()
+            num_upserted = len(mappings)
+            QueryCache.invalidate(self.model.__tablename__)
+        except SQLAlchemyError as e:
+            logger.error(
+                f"Upsert into {self.model.__tablename__} table [FAILURE]! "
+                f"Aborted with error: {e}"
+            )
+            session.rollback()
+        return num_upserted
+
     def bulk_save_objects(
         self, session: Session, birthdays: Sequence[Type[Base]]
     ) -> None:
         """Saves new 'model' instances to db."""
         session.bulk_save_objects(birthdays)
+        QueryCache.invalidate(self.model.__tablename__)
 
     def sqlite_upsert(
         self,
@@ -193,6 +429,7 @@ class BirthdayManipulationManager:
             set_=dict(name=name, date=date),
         )
         session.execute(on_duplicate_update_stmt)
+        QueryCache.invalidate(self.model.__tablename__)
 
     def sqlite_insert_ignore_duplicate(
         self, session: Session, name: str, date: dt.date
@@ -210,3 +447,4 @@ class BirthdayManipulationManager:
             index_elements=("name", "date")
         )
         session.execute(do_nothing_stmt)
+        QueryCache.invalidate(self.model.__tablename__)
@@ -2,25 +2,54 @@ import datetime as dt
 from functools import cache
 from typing import Any
 
-from sqlalchemy import Date, String
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import (
+    BigInteger,
+    Date,
+    Engine,
+    String,
+    Text,
+    event,
+    inspect,
+    text,
+)
+from sqlalchemy.orm import Mapped, mapped_column, validates
+
+from app.utils import normalize_name
 
 from .managers import BirthdayManipulationManager, DateQueryManager
+from .search import create_search_index
 from .shared import Base
 
 
+def normalized_name_default(context) -> str:
+    # Core inserts bypass `Birthday.validate_name`, but always have name.
+    return normalize_name(context.get_current_parameters()["name"])
+
+
 class Birthday(Base):
     __tablename__ = "birthday"
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(128), unique=True)
     date: Mapped[dt.date] = mapped_column(Date)
+    # Filled from `name`, used for search and duplicate detection.
+    normalized_name: Mapped[str] = mapped_column(
+        String(128),
+        index=True,
+        default=normalized_name_default,
+    )
 
     def __repr__(self) -> str:
         return (
             f"{self.__class__.__name__}({self.id}, {self.name}, {self.date})"
         )
 
+    @validates("name")
+    def validate_name(self, _, name: str) -> str:
+        """Keep `normalized_name` in sync with `name`."""
+        self.normalized_name = normalize_name(name)
+        return name
+
     def to_dict(self) -> dict[str, Any]:
         """Returns dict of instance attributes."""
         return {"id": self.id, "name": self.name, "date": self.date}
@@ -38,3 +67,168 @@ class Birthday(Base):
     def operations(cls) -> BirthdayManipulationManager:
         """Setup data manipulation manager."""
         return BirthdayManipulationManager(cls)
+
+
+event.listen(Birthday.__table__, "after_create", create_search_index)
+
+
+def upgrade_birthday_table(engine: Engine) -> bool:
+    """Drop `birthday` table created before `normalized_name` column
+    was added, so `create_all` builds it again with search index.
+    Table content is restored by the next load from remote file.
+
+    :returns: True if the table was dropped.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(Birthday.__tablename__):
+        return False
+    columns = inspector.get_columns(Birthday.__tablename__)
+    if any(column["name"] == "normalized_name" for column in columns):
+        return False
+    Birthday.__table__.drop(engine)
+    return True
+
+
+class PendingBirthday(Base):
+    """New birthday accepted from user, but not written
+    to remote excel file yet. Survives bot restarts."""
+
+    __tablename__ = "pending_birthday"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[int]
+    month: Mapped[str] = mapped_column(String(16))
+    name: Mapped[str] = mapped_column(String(128))
+    user_id: Mapped[int]
+    chat_id: Mapped[int]
+    message_id: Mapped[int]
+    # Bot instance which enqueued the birthday for writing and
+    # unix time it did so, see `toolbox.birthdays.claim_pending_birthdays`.
+    owner: Mapped[str | None] = mapped_column(String(128))
+    claimed: Mapped[float | None]
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.id}, {self.name}, "
+            f"{self.day} {self.month})"
+        )
+
+    @property
+    def row(self) -> list[str | int]:
+        """Values to be appended to excel file columns.
+
+        This depends heavily on the structure of your excel file.
+        In our case we only add data to the first 4 columns,
+        where 3-rd column is not currently in use, that's why it's empty str.
+        """
+        return [self.day, self.month, "", self.name]
+
+
+class MessageSnapshot(Base):
+    """Last formatted birthday messages with their timestamp
+    and fingerprint of remote file they were built from.
+    Lets the bot serve messages right after restart."""
+
+    __tablename__ = "message_snapshot"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    today: Mapped[str | None] = mapped_column(Text)
+    future: Mapped[str | None] = mapped_column(Text)
+    warning: Mapped[str | None] = mapped_column(Text)
+    ts: Mapped[float | None]
+    fingerprint: Mapped[str | None] = mapped_column(String(32))
+    # Bumped on every save, so bot instances and workers know
+    # that birthdays changed since they built their caches.
+    version: Mapped[int] = mapped_column(default=1)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.ts}, {self.fingerprint}, "
+            f"{self.version})"
+        )
+
+
+def upgrade_message_snapshot_table(engine: Engine) -> bool:
+    """Drop `message_snapshot` table created before `version` column
+    was added. Snapshot is saved again by the next load.
+
+    :returns: True if the table was dropped.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(MessageSnapshot.__tablename__):
+        return False
+    columns = inspector.get_columns(MessageSnapshot.__tablename__)
+    if any(column["name"] == "version" for column in columns):
+        return False
+    MessageSnapshot.__table__.drop(engine)
+    return True
+
+
+class ChatSettings(Base):
+    """Birthday messages preferences of a telegram chat."""
+
+    __tablename__ = "chat_settings"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    window: Mapped[int]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.chat_id}, {self.window})"
+
+
+class FSMState(Base):
+    """Dialogue state and data of a user in a telegram chat."""
+
+    __tablename__ = "fsm_state"
+
+    chat: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user: Mapped[str] = mapped_column(String(32), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(128))
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    bucket: Mapped[str] = mapped_column(Text, default="{}")
+    # Unix timestamp of the last change, used for expiry.
+    updated: Mapped[float] = mapped_column(index=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.chat}, {self.user}, {self.state})"
+        )
+
+
+class LeaderLease(Base):
+    """Lease held by the bot instance which runs scheduled jobs.
+    Holder renews `expires` while alive, other instances
+    take the lease over once it expires."""
+
+    __tablename__ = "leader_lease"
+
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    # Unix timestamp the lease is valid until.
+    expires: Mapped[float]
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.name}, {self.holder}, "
+            f"{self.expires})"
+        )
+
+
+def upgrade_pending_birthday_table(engine: Engine) -> bool:
+    """Add `owner` and `claimed` columns to `pending_birthday` table
+    created before they existed. Pending birthdays are kept.
+
+    :returns: True if columns were added.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(PendingBirthday.__tablename__):
+        return False
+    columns = inspector.get_columns(PendingBirthday.__tablename__)
+    if any(column["name"] == "owner" for column in columns):
+        return False
+    with engine.begin() as connection:
+        for column in ("owner VARCHAR(128)", "claimed FLOAT"):
+            connection.execute(
+                text(f"ALTER TABLE pending_birthday ADD COLUMN {column}")
+            )
+    return True
@@ -0,0 +1,198 @@
+"""
+Full text search over birthday names.
+
+Names are searched in `normalized_name` column of `birthday` table
+through SQLite FTS5 table with trigram tokenizer, which is kept
+in sync with `birthday` table by triggers.
+If FTS5 is not available, search falls back to `LIKE` queries.
+"""
+import logging
+from itertools import permutations
+from logging.config import fileConfig
+from typing import Any, Type
+
+from sqlalchemy import Connection, Table, or_, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.utils import normalize_name
+
+from .shared import Base
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# Trigram tokenizer can't match terms shorter than 3 chars.
+MIN_TERM_LENGTH = 3
+
+
+def search_table(table: Table) -> str:
+    return f"{table.name}_fts"
+
+
+def create_search_index(target: Table, connection: Connection, **_) -> None:
+    """Create FTS5 table over `normalized_name` column of `target` table
+    and triggers that keep it up to date. Fired after `target` creation.
+    """
+    fts, table = search_table(target), target.name
+    statements = (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"normalized_name, content='{table}', content_rowid='id', "
+        "tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {table} "
+        f"BEGIN INSERT INTO {fts}(rowid, normalized_name) "
+        "VALUES (new.id, new.normalized_name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {table} "
+        f"BEGIN INSERT INTO {fts}({fts}, rowid, normalized_name) "
+        "VALUES ('delete', old.id, old.normalized_name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE ON {table} "
+        f"BEGIN INSERT INTO {fts}({fts}, rowid, normalized_name) "
+        "VALUES ('delete', old.id, old.normalized_name); "
+        f"INSERT INTO {fts}(rowid, normalized_name) "
+        "VALUES (new.id, new.normalized_name); END",
+    )
+    try:
+        with connection.begin_nested():
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+    except SQLAlchemyError as e:
+        logger.warning(f"<create_search_index> FTS5 is unavailable: {e}")
+
+
+def match_expression(query: str, operator: str = "AND") -> str | None:
+    """Build FTS5 query that matches names containing all words
+    of `query`, or any of them if `operator` is "OR".
+    Returns None if no word is long enough."""
+    terms = [
+        term for term in normalize_name(query).split()
+        if len(term) >= MIN_TERM_LENGTH
+    ]
+    if not terms:
+        return
+    return f" {operator} ".join(
+        '"{}"'.format(term.replace('"', '""')) for term in terms
+    )
+
+
+def search(
+    session: Session, model: Type[Base], query: str, limit: int = 20
+) -> list[Any]:
+    """Find instances of `model` which names contain all words of `query`.
+
+    :param session: SQLAlchemy session.
+    :param model: Model with `name` and `normalized_name` columns.
+    :param query: Words to search for, in any case and order.
+    :param limit: Maximum number of instances to return.
+    """
+    expression = match_expression(query)
+    if expression is not None:
+        table, fts = model.__tablename__, search_table(model.__table__)
+        # Words too short for trigram tokenizer are checked one by one,
+        # so results are the same as of `LIKE` queries below.
+        short_words = [
+            word
+            for word in normalize_name(query).split()
+            if len(word) < MIN_TERM_LENGTH
+        ]
+        short_filter = "".join(
+            f" AND instr({table}.normalized_name, :short_{i}) > 0"
+            for i in range(len(short_words))
+        )
+        statement = select(model).from_statement(
+            text(
+                f"SELECT {table}.* FROM {table} "
+                f"JOIN {fts} ON {fts}.rowid = {table}.id "
+                f"WHERE {fts} MATCH :expression{short_filter} "
+                f"ORDER BY {fts}.rank, {table}.name LIMIT :limit"
+            )
+        )
+        params = {"expression": expression, "limit": limit}
+        params.update(
+            {f"short_{i}": word for i, word in enumerate(short_words)}
+        )
+        try:
+            return session.scalars(statement, params).all()
+        except SQLAlchemyError as e:
+            logger.warning(f"<search> FTS query [FAILURE!]: {e}")
+            session.rollback()
+
+    words = normalize_name(query).split()
+    if not words:
+        return []
+    statement = (
+        select(model)
+        .where(*(model.normalized_name.contains(word) for word in words))
+        .order_by(model.name)
+        .limit(limit)
+    )
+    return session.scalars(statement).all()
+
+
+def similar(
+    session: Session, model: Type[Base], name: str, limit: int = 5
+) -> list[Any]:
+    """Find instances of `model` which may be the same person as `name`:
+    names containing all words of `name` or made of its words only,
+    e.g. `Иванов Иван` and `Иванов Иван Петрович` are similar
+    either way round.
+
+    :param session: SQLAlchemy session.
+    :param model: Model with `name` and `normalized_name` columns.
+    :param name: Name to compare with.
+    :param limit: Maximum number of instances to return.
+    """
+    found = {
+        instance.id: instance for instance in search(session, model, name)
+    }
+    words = set(normalize_name(name).split())
+    if words:
+        for instance in candidates(session, model, name):
+            if set(instance.normalized_name.split()) <= words:
+                found.setdefault(instance.id, instance)
+    return sorted(found.values(), key=lambda instance: instance.name)[:limit]
+
+
+def candidates(session: Session, model: Type[Base], name: str) -> list[Any]:
+    """Find instances of `model` which names may be made of the words
+    of `name`: names containing any of its words long enough for
+    trigram tokenizer, found by full text index, and names made
+    of its shorter words only, found by `normalized_name` index.
+    """
+    normalized = normalize_name(name)
+    short_words = {
+        word for word in normalized.split() if len(word) < MIN_TERM_LENGTH
+    }
+    exact = [
+        " ".join(words)
+        for size in range(1, len(short_words) + 1)
+        for words in permutations(short_words, size)
+    ]
+    found = []
+    if exact:
+        found = session.scalars(
+            select(model).where(model.normalized_name.in_(exact))
+        ).all()
+
+    expression = match_expression(name, "OR")
+    if expression is None:
+        return found
+    table, fts = model.__tablename__, search_table(model.__table__)
+    statement = select(model).from_statement(
+        text(
+            f"SELECT {table}.* FROM {table} "
+            f"JOIN {fts} ON {fts}.rowid = {table}.id "
+            f"WHERE {fts} MATCH :expression"
+        )
+    )
+    params = {"expression": expression}
+    try:
+        return [*found, *session.scalars(statement, params)]
+    except SQLAlchemyError as e:
+        logger.warning(f"<candidates> FTS query [FAILURE!]: {e}")
+        session.rollback()
+
+    words = normalized.split()
+    statement = select(model).where(
+        or_(*(model.normalized_name.contains(word) for word in words))
+    )
+    return session.scalars(statement).all()
@@ -1,9 +1,18 @@
+import time
 from contextlib import contextmanager
 
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, event
 from sqlalchemy.orm import DeclarativeBase, scoped_session, sessionmaker
 
 from app import settings
+from app.metrics import REGISTRY
+
+QueryDuration = REGISTRY.histogram(
+    "db_query_duration_seconds",
+    "Time spent in db queries by statement kind.",
+    ("statement",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+)
 
 
 class Base(DeclarativeBase):
@@ -35,3 +44,24 @@ def get_session(engine: Engine = db_engine):
         Session.rollback()
     finally:
         Session.close()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    # Start time lives and dies with the execution context,
+    # so failed statements leave nothing behind.
+    if context is not None:
+        context.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def observe_query_duration(
+    conn, cursor, statement, parameters, context, executemany
+) -> None:
+    start = getattr(context, "query_start", None)
+    if start is None:
+        return
+    kind = statement.lstrip().split(" ", 1)[0].lower()
+    QueryDuration.observe(time.perf_counter() - start, statement=kind)
@@ -1,20 +1,30 @@
-from aiogram import Dispatcher
+from aiogram import Dispatcher, types
 
+from app import settings
 from app.states import AddBirthday
 
 from .birthdays import (
     cmd_add_chat_to_birthday_mailing,
+    cmd_export_birthdays,
+    cmd_find_birthday,
+    cmd_month_birthdays,
     cmd_new_birthday,
+    cmd_range_birthdays,
     cmd_remove_chat_from_birthday_mailing,
     cmd_send_birthday_messages,
+    cmd_set_chat_window,
     cmd_verify_confirm_code,
+    flip_birthday_page,
     get_confirm_code,
+    import_birthdays_document,
+    inline_birthday_search,
     new_birthday_complete,
     new_birthday_day,
     new_birthday_month,
     new_birthday_name,
 )
 from .common import cmd_cancel, cmd_start
+from .manager import cmd_profile, cmd_stats
 
 
 def register_common_handlers(dp: Dispatcher):
@@ -25,6 +35,21 @@ def register_common_handlers(dp: Dispatcher):
     )
 
 
+def register_manager_handlers(dp: Dispatcher):
+    dp.register_message_handler(
+        cmd_stats,
+        commands=["stats"],
+        user_id=settings.BOT_MANAGER_TELEGRAM_ID,
+        state="*",
+    )
+    dp.register_message_handler(
+        cmd_profile,
+        commands=["profile"],
+        user_id=settings.BOT_MANAGER_TELEGRAM_ID,
+        state="*",
+    )
+
+
 def register_birthday_handlers(dp: Dispatcher):
     dp.register_message_handler(
         cmd_add_chat_to_birthday_mailing, commands=["addchat"]
@@ -36,6 +61,20 @@ def register_birthday_handlers(dp: Dispatcher):
     dp.register_message_handler(
         cmd_send_birthday_messages, commands=["sendbdays"]
     )
+    dp.register_message_handler(cmd_set_chat_window, commands=["setwindow"])
+    dp.register_message_handler(cmd_find_birthday, commands=["find"])
+    dp.register_message_handler(cmd_export_birthdays, commands=["export"])
+    dp.register_message_handler(cmd_month_birthdays, commands=["month"])
+    dp.register_message_handler(cmd_range_birthdays, commands=["range"])
+    dp.register_callback_query_handler(
+        flip_birthday_page, text_startswith="page:"
+    )
+    dp.register_inline_handler(inline_birthday_search)
+    dp.register_message_handler(
+        import_birthdays_document,
+        content_types=types.ContentType.DOCUMENT,
+        chat_type=types.ChatType.PRIVATE,
+    )
     dp.register_message_handler(cmd_verify_confirm_code, commands=["code"])
     dp.register_callback_query_handler(get_confirm_code, text="confirm_code")
 
@@ -1,25 +1,53 @@
+import asyncio
+import datetime as dt
+import hashlib
 import logging
+import tempfile
 from logging.config import fileConfig
+from pathlib import Path
 
 import yadisk_async
 from aiogram import types
 from aiogram.dispatcher import FSMContext
 
 from app import settings
+from app.db.index import LEAP_YEAR
 from app.db.models import Birthday
 from app.db.shared import get_session
 from app.scheduler import Scheduler
 from app.states import AddBirthday
 from app.toolbox.birthdays import (
     Messages,
-    add_birthday,
     dispatch_birthday_messages_to_chat,
+    import_birthdays,
+    refresh_messages,
+    save_birthday,
+    set_chat_window,
+)
+from app.toolbox.birthdays.export import EXPORT_FORMATS, export_birthdays
+from app.toolbox.birthdays.importer import IMPORT_EXTENSIONS
+from app.toolbox.birthdays.messageformat import (
+    convert_month,
+    decline_month,
+    declined_months,
+    format_birthday_sequence,
+    plural_days,
+    record_to_message,
+    string_to_int_mapping,
 )
-from app.toolbox.birthdays.messageformat import decline_month
 from app.utils import (
-    days_grid_reply_kb,
+    CANCEL_BUTTON,
+    COMPLETE_KB,
+    DAYS_KB,
+    MONTHS_KB,
+    NAME_KB,
+    REMOVE_KB,
+    RESTART_BUTTON,
+    SAVE_BUTTON,
+    Clock,
     days_in_month,
-    months_grid_reply_kb,
+    normalize_name,
+    pages_inline_kb,
     set_inline_button,
     update_envar,
 )
@@ -30,12 +58,108 @@ fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
 
+WINDOW_HINT = (
+    f"❗Укажите количество дней от 1 до {settings.MAX_FUTURE_SCOPE}, "
+    "например: /{command} 7"
+)
+
+
+def parse_window(args: str) -> int | None:
+    """Convert command argument to number of upcoming days.
+
+    :returns: None if argument is not a number in allowed range.
+    """
+    if not args.isdecimal():
+        return
+    window = int(args)
+    if 1 <= window <= settings.MAX_FUTURE_SCOPE:
+        return window
+
+
+def parse_month(args: str) -> int | None:
+    """Convert command argument, name or number of a month,
+    to month number.
+
+    :returns: None if argument is not a month.
+    """
+    args = args.strip().lower()
+    if args.isdecimal() and 1 <= int(args) <= 12:
+        return int(args)
+    if args in string_to_int_mapping:
+        return convert_month(args)
+
+
+def parse_day_month(text: str) -> dt.date | None:
+    """Convert `DD.MM` string to date of a leap year.
+
+    :returns: None if string is not a valid date.
+    """
+    try:
+        day, month = map(int, text.split("."))
+        return dt.date(LEAP_YEAR, month, day)
+    except ValueError:
+        return
+
+
+async def answer_birthday_pages(
+    message: types.Message, key: str | None
+) -> None:
+    """Send first page of birthday list with buttons to flip pages."""
+    page = key and Messages.page(key)
+    if not page:
+        await message.reply(
+            "Не удалось получить список.\nПопробуйте позднее.",
+            disable_notification=True,
+        )
+        return
+    text, total = page
+    await message.answer(
+        text,
+        reply_markup=pages_inline_kb(key, 0, total),
+        disable_notification=True,
+    )
+
+
 async def cmd_send_birthday_messages(message: types.Message):
-    """Command for requesting birthday info."""
+    """Command for requesting birthday info.
+    Number of upcoming days may be passed as argument: `/sendbdays 7`.
+    """
+    window = None
+    if args := message.get_args():
+        if (window := parse_window(args)) is None:
+            await message.reply(
+                WINDOW_HINT.format(command="sendbdays"),
+                disable_notification=True,
+            )
+            return
     if not Messages.is_fresh(minutes=30):
-        await Messages.load()
+        await refresh_messages()
         logger.info("load birthday messages via request from user")
-    await dispatch_birthday_messages_to_chat(message.chat.id)
+    await dispatch_birthday_messages_to_chat(message.chat.id, window)
+
+
+async def cmd_set_chat_window(message: types.Message):
+    """Command for setting default number of upcoming days
+    for /sendbdays and daily mailing of the chat."""
+    window = parse_window(message.get_args() or "")
+    if window is None:
+        await message.reply(
+            WINDOW_HINT.format(command="setwindow"),
+            disable_notification=True,
+        )
+    elif set_chat_window(message.chat.id, window):
+        logger.info(f"Chat[{message.chat.id}] window set to {window} days")
+        await message.answer(
+            f"Теперь в списке ближайших дней рождения будут партнеры, "
+            f"у которых день рождения в ближайшие {window} "
+            f"{plural_days(window)}.",
+            disable_notification=True,
+        )
+    else:
+        await message.answer(
+            "Не удалось сохранить настройку.\nПопробуйте позднее.",
+            disable_notification=True,
+        )
 
 
 async def cmd_add_chat_to_birthday_mailing(message: types.Message):
@@ -84,6 +208,171 @@ async def cmd_remove_chat_from_birthday_mailing(message: types.Message):
         )
 
 
+async def cmd_export_birthdays(message: types.Message):
+    """Command for getting all birthdays as a file:
+    `/export` for excel file or `/export csv`.
+    Available to `settings.EXPORT_USER_IDS` only."""
+    if message.from_user.id not in settings.EXPORT_USER_IDS:
+        await message.reply(
+            "❗У вас нет прав на выгрузку дней рождения.",
+            disable_notification=True,
+        )
+        return
+    fmt = (message.get_args() or "xlsx").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.reply(
+            "❗Укажите формат файла: /export xlsx или /export csv",
+            disable_notification=True,
+        )
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir) / f"birthdays_{Clock.today():%Y_%m_%d}.{fmt}"
+        # Export is blocking, so it's run in a thread.
+        num_rows = await asyncio.to_thread(
+            export_birthdays, filepath.as_posix(), fmt
+        )
+        if num_rows is None:
+            await message.reply(
+                "Не удалось выгрузить дни рождения.\nПопробуйте позднее.",
+                disable_notification=True,
+            )
+            return
+        await message.answer_document(
+            types.InputFile(filepath.as_posix(), filename=filepath.name),
+            caption=f"📄 Дней рождения в файле: {num_rows}",
+            disable_notification=True,
+        )
+
+
+async def import_birthdays_document(message: types.Message):
+    """Import birthdays from .xlsx or .csv file sent to the bot
+    in private chat. Other documents are ignored."""
+    filename = message.document.file_name or ""
+    if not filename.lower().endswith(IMPORT_EXTENSIONS):
+        return
+    if message.from_user.id not in settings.IMPORT_USER_IDS:
+        await message.reply(
+            "❗У вас нет прав на загрузку файлов с днями рождения.",
+            disable_notification=True,
+        )
+        return
+
+    status_message = await message.reply(
+        "⏳Проверяю файл...", disable_notification=True
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = Path(tmpdir) / Path(filename).name.lower()
+        await message.document.download(destination_file=filepath)
+        report = await import_birthdays(
+            filepath.as_posix(), message.from_user.id
+        )
+    await status_message.edit_text(report.to_message())
+
+
+async def cmd_find_birthday(message: types.Message):
+    """Command for searching partners by name: `/find Иванов`."""
+    query = message.get_args()
+    if not query:
+        await message.reply(
+            "Введите команду /find, добавьте пробел и напишите "
+            "ФИО партнера или его часть.",
+            disable_notification=True,
+        )
+        return
+
+    birthdays = []
+    with get_session() as session:
+        birthdays = Birthday.queries.search(
+            session, query, limit=settings.SEARCH_LIMIT + 1
+        )
+    if not birthdays:
+        await message.reply(
+            f"🔍 По запросу `{query}` никого не найдено.",
+            disable_notification=True,
+        )
+        return
+
+    text = format_birthday_sequence(birthdays[: settings.SEARCH_LIMIT])
+    if len(birthdays) > settings.SEARCH_LIMIT:
+        text += "\n...\nУточните запрос, чтобы увидеть остальных."
+    await message.reply(
+        f"🔍 Найдено по запросу `{query}`:\n{text}",
+        disable_notification=True,
+    )
+
+
+async def cmd_month_birthdays(message: types.Message):
+    """Command for listing birthdays of a month: `/month май`."""
+    month = parse_month(message.get_args() or "")
+    if month is None:
+        await message.reply(
+            "❗Укажите месяц названием или номером, например: /month май",
+            disable_notification=True,
+        )
+        return
+    await answer_birthday_pages(message, Messages.month_pages(month))
+
+
+async def cmd_range_birthdays(message: types.Message):
+    """Command for listing birthdays between two dates:
+    `/range 01.05 15.06`. Both dates are included,
+    range may cross new year: `/range 20.12 10.01`."""
+    dates = [parse_day_month(arg) for arg in message.get_args().split()]
+    if len(dates) != 2 or None in dates:
+        await message.reply(
+            "❗Укажите начальную и конечную даты в формате ДД.ММ, "
+            "например: /range 01.05 15.06",
+            disable_notification=True,
+        )
+        return
+
+    start, end = dates
+    if end < start:
+        # Range crosses new year. Start is moved to the previous year
+        # unless it's 29 of February, which that year doesn't have.
+        if (start.month, start.day) == (2, 29):
+            end = end.replace(year=LEAP_YEAR + 1)
+        else:
+            start = start.replace(year=LEAP_YEAR - 1)
+    await answer_birthday_pages(message, Messages.range_pages(start, end))
+
+
+async def flip_birthday_page(call: types.CallbackQuery):
+    """Show another page of /month or /range list.
+    Callback data: `page:<key>:<number>`."""
+    _, key, number = call.data.split(":")
+    page = Messages.page(key, int(number))
+    if page is None:
+        await call.answer("Список устарел, запросите его заново.")
+        return
+    text, total = page
+    await call.message.edit_text(
+        text, reply_markup=pages_inline_kb(key, int(number), total)
+    )
+    await call.answer()
+
+
+async def inline_birthday_search(inline_query: types.InlineQuery):
+    """Inline search of partners by name: `@bot Иванов`.
+    Results are served from in-memory name index of `Messages`."""
+    records = Messages.search(inline_query.query)
+    results = [
+        types.InlineQueryResultArticle(
+            id=hashlib.md5(record.name.encode()).hexdigest(),
+            title=record.name,
+            description=f"{record.day} {declined_months[record.month]}",
+            input_message_content=types.InputTextMessageContent(
+                f"🎂 {record_to_message(record)}"
+            ),
+        )
+        for record in records
+    ]
+    await inline_query.answer(
+        results, cache_time=settings.INLINE_CACHE_TIME, is_personal=False
+    )
+
+
 async def cmd_verify_confirm_code(message: types.Message):
     """Command for Yandex.Disk confirmation code verification.
     If code valid, sets new token to yadisk_async.YaDisk instance.
@@ -145,7 +434,7 @@ async def get_confirm_code(call: types.CallbackQuery):
 async def cmd_new_birthday(message: types.Message, state: FSMContext):
     await message.answer(
         "1/3 ➡️ Выберите месяц 📅, воспользовавшись интерактивной клавиатурой",
-        reply_markup=months_grid_reply_kb(),
+        reply_markup=MONTHS_KB,
         disable_notification=True,
     )
     await state.set_state(AddBirthday.month.state)
@@ -153,7 +442,7 @@ async def cmd_new_birthday(message: types.Message, state: FSMContext):
 
 async def new_birthday_month(message: types.Message, state: FSMContext):
     month = message.text.lower()
-    if month == "❌ отмена":
+    if month == CANCEL_BUTTON:
         await cmd_cancel(message, state)
         return
     elif month not in settings.MONTHS:
@@ -168,7 +457,7 @@ async def new_birthday_month(message: types.Message, state: FSMContext):
     await state.set_state(AddBirthday.day.state)
     await message.answer(
         "2/3 ➡️ Выберите день 🔢, воспользовавшись интерактивной клавиатурой.",
-        reply_markup=days_grid_reply_kb(month),
+        reply_markup=DAYS_KB[month],
         disable_notification=True,
     )
 
@@ -177,10 +466,10 @@ async def new_birthday_day(message: types.Message, state: FSMContext):
     user_data = await state.get_data()
     max_days = days_in_month(user_data.get("month"))
     day = message.text
-    if day == "❌ отмена":
+    if day == CANCEL_BUTTON:
         await cmd_cancel(message, state)
         return
-    elif day == "🔄 начать заново":
+    elif day == RESTART_BUTTON:
         await state.reset_state()
         await cmd_new_birthday(message, state)
         return
@@ -194,13 +483,11 @@ async def new_birthday_day(message: types.Message, state: FSMContext):
     await state.update_data(day=day)
 
     await state.set_state(AddBirthday.name.state)
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=5)
-    kb.row("❌ отмена", "🔄 начать заново")
     await message.answer(
         "3/3 ➡️ Введите ФИО партнера, используя в том числе "
         "заглавные буквы и пробелы\n."
         "ФИО должно содержать не менее 5-ти символов и 1-го пробела.",
-        reply_markup=kb,
+        reply_markup=NAME_KB,
         disable_notification=True,
     )
 
@@ -208,10 +495,10 @@ async def new_birthday_day(message: types.Message, state: FSMContext):
 async def new_birthday_name(message: types.Message, state: FSMContext):
     user_data = await state.get_data()
     name = message.text.strip()
-    if name == "❌ отмена":
+    if name == CANCEL_BUTTON:
         await cmd_cancel(message, state)
         return
-    elif name == "🔄 начать заново":
+    elif name == RESTART_BUTTON:
         await state.reset_state()
         await cmd_new_birthday(message, state)
         return
@@ -224,8 +511,10 @@ async def new_birthday_name(message: types.Message, state: FSMContext):
         return
 
     # Check if partner already exists.
+    similar = []
     with get_session() as session:
-        if Birthday.queries.get(session, name=name):
+        normalized_name = normalize_name(name)
+        if Birthday.queries.get(session, normalized_name=normalized_name):
             await message.answer(
                 f"❗Партнер с ФИО `{name}` уже существует."
                 "\nУбедитесь, что вы добвляете ФИО нового партнера.\n"
@@ -234,6 +523,7 @@ async def new_birthday_name(message: types.Message, state: FSMContext):
                 disable_notification=True,
             )
             return
+        similar = Birthday.queries.similar(session, name, limit=5)
 
     await state.update_data(name=name)
     await state.set_state(AddBirthday.complete.state)
@@ -241,63 +531,48 @@ async def new_birthday_name(message: types.Message, state: FSMContext):
     month = user_data.get("month")
     day = user_data.get("day")
 
-    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    kb.row("❌ отмена", "🔄 начать заново", "💾 сохранить")
+    warning = ""
+    if similar:
+        warning = (
+            "\n\n⚠️ Похожие партнеры уже есть в списке:\n"
+            f"{format_birthday_sequence(similar)}\n"
+            "Убедитесь, что вы добавляете нового партнера."
+        )
 
     await message.answer(
         "Вы ввели день рождения партнера:\n"
         f"💎 {day} {decline_month(month)}, {name}."
         "\nВы можете сохранить 💾, отменить ❌ или ввести "
         "день рождения заново 🔄, воспользовавшись "
-        "соответствующими кнопками на интерактивной клавиатуре.",
-        reply_markup=kb,
+        f"соответствующими кнопками на интерактивной клавиатуре.{warning}",
+        reply_markup=COMPLETE_KB,
         disable_notification=True,
     )
 
 
 async def new_birthday_complete(message: types.Message, state: FSMContext):
     command = message.text
-    if command == "❌ отмена":
+    if command == CANCEL_BUTTON:
         await cmd_cancel(message, state)
         return
-    elif command == "🔄 начать заново":
+    elif command == RESTART_BUTTON:
         await state.reset_state()
         await cmd_new_birthday(message, state)
         return
-    elif command == "💾 сохранить":
+    elif command == SAVE_BUTTON:
         user_data = await state.get_data()
         month, day, name = user_data.values()
 
-        # This depends heavily on the structure of your excel file.
-        # In our case we only add data to the first 4 columns,
-        # where 3-rd column is not currently in use, that's why it's empty str.
-        # The order of values in birtday_data list is CRUCIAL!
-        birthday_data = [int(day), month, "", name]
-
-        await message.answer(
-            "⏳Обновляю файл на Яндекс Диске...",
+        # Birthday is saved in background, user gets the result
+        # in the status message once remote file is updated.
+        status_message = await message.answer(
+            "⏳Сохраняю день рождения партнера:\n"
+            f"{day} {decline_month(month)}, {name}\n"
+            "Результат появится в этом сообщении.",
             disable_notification=True,
-            reply_markup=types.ReplyKeyboardRemove(),
+            reply_markup=REMOVE_KB,
         )
-        if await add_birthday(message, birthday_data):
-            await message.answer(
-                "👍Вы добавили день рождения нового партнера:\n"
-                f"{day} {decline_month(month)}, {name}",
-                disable_notification=True,
-            )
-
-            # Refresh messages in database.
-            await Messages.load()
-            logger.info(
-                "load birthday messages after remote file update by user"
-            )
-        else:
-            await message.answer(
-                "🔌Не удалось обновить файл на Яндекс Диске.\n"
-                "Менеджер бота уже в курсе проблемы и работает над решением.\n"
-                "Попробуйте повторить попытку позднее.",
-                disable_notification=True,
-            )
+        save_birthday(int(day), month, name, message.from_id, status_message)
         await state.finish()
     else:
         await message.answer(
@@ -1,7 +1,7 @@
 from aiogram import types
 from aiogram.dispatcher import FSMContext
 
-from app.utils import message_or_call
+from app.utils import REMOVE_KB, message_or_call
 
 START_MESSAGE = (
     "Привет!👋 Я бот-помощник!\n"
@@ -13,7 +13,7 @@ async def cmd_start(message: types.Message, state: FSMContext):
     await state.finish()
     await message.answer(
         text=START_MESSAGE,
-        reply_markup=types.ReplyKeyboardRemove(),
+        reply_markup=REMOVE_KB,
         disable_notification=True,
     )
 
@@ -25,6 +25,6 @@ async def cmd_cancel(
     await state.finish()
     await message.answer(
         "Команда отменена",
-        reply_markup=types.ReplyKeyboardRemove(),
+        reply_markup=REMOVE_KB,
         disable_notification=True,
     )
@@ -0,0 +1,88 @@
+from aiogram import types
+
+from app import settings
+from app.middlewares import handler_stats
+from app.profiling import MODES, Profiling, send_report
+from app.toolbox.birthdays import Messages
+
+
+def format_handler_stats(stats: list[dict]) -> str:
+    if not stats:
+        return "📊 Обработчики еще не вызывались."
+    lines = ["📊 Обработчики по общему времени работы:"]
+    for row in stats:
+        name = row["handler"]
+        if row["state"]:
+            name += f" [{row['state']}]"
+        lines.append(
+            f"{name}: вызовов {row['count']}, ошибок {row['errors']:g}, "
+            f"сейчас {row['running']:g}, "
+            f"среднее {row['mean'] * 1000:.0f} мс, "
+            f"p95 {row['p95'] * 1000:.0f} мс"
+        )
+    return "\n".join(lines)
+
+
+async def cmd_stats(message: types.Message):
+    """Command for the bot manager to see timing of handlers
+    since start of the bot and stages of the last birthdays load."""
+    text = format_handler_stats(handler_stats())
+    if (trace := Messages.traces.last()) is not None:
+        text += f"\n\n⏱ Последняя загрузка дней рождения:\n{trace.summary()}"
+    await message.answer(text, disable_notification=True)
+
+
+PROFILE_HINT = (
+    "🔬 Профилирование загрузки дней рождения и обработчиков: "
+    f"/profile {'|'.join(MODES)} [секунды] или /profile stop.\n"
+    "cpu - cProfile, sample - выборка стеков, "
+    "memory - tracemalloc при разборе Excel файла. "
+    f"Не дольше {settings.PROFILE_MAX_SECONDS} секунд."
+)
+
+
+def parse_profile_args(args: str) -> tuple[str, float] | None:
+    """Parse `mode [seconds]` arguments of /profile command.
+
+    :returns: Mode and number of seconds or None if invalid.
+    """
+    mode, *rest = args.split() or [""]
+    if mode not in MODES or len(rest) > 1:
+        return None
+    seconds = settings.PROFILE_SECONDS
+    if rest:
+        try:
+            seconds = float(rest[0])
+        except ValueError:
+            return None
+    if not 0 < seconds <= settings.PROFILE_MAX_SECONDS:
+        return None
+    return mode, seconds
+
+
+async def cmd_profile(message: types.Message):
+    """Command for the bot manager to profile the running bot
+    for a while, e.g. `/profile cpu 60`. Report is sent
+    to the bot manager once time is up or on `/profile stop`."""
+    args = (message.get_args() or "").strip().lower()
+    if args == "stop":
+        report = Profiling.stop()
+        if report is None:
+            await message.answer("🔬 Профилирование не запущено.")
+            return
+        await send_report(message.bot, report)
+        return
+    if (parsed := parse_profile_args(args)) is None:
+        await message.answer(PROFILE_HINT, disable_notification=True)
+        return
+    mode, seconds = parsed
+    try:
+        Profiling.start(mode, seconds, message.bot)
+    except RuntimeError as e:
+        await message.answer(f"🔬 Уже запущено: {e}.")
+        return
+    await message.answer(
+        f"🔬 Профилирование {mode} запущено на {seconds:g} с. "
+        "Отчет придет файлом, остановить раньше - /profile stop.",
+        disable_notification=True,
+    )
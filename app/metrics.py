@@ -0,0 +1,237 @@
+"""
+Minimal in-process metrics registry.
+Metrics are rendered in Prometheus text exposition format.
+"""
+import functools
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Iterator
+
+LabelValues = tuple[str, ...]
+# Upper bounds of histogram buckets in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    """Base class for metrics with optional labels.
+
+    :param name: Metric name, e.g. `bot_messages_sent_total`.
+    :param documentation: Short description of the metric.
+    :param labelnames: Names of labels metric values are split by.
+    """
+
+    type_ = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[LabelValues, float] = defaultdict(float)
+        self._lock = Lock()
+
+    def _key(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def get(self, **labels: str) -> float:
+        """Current value for given labels."""
+        return self._values.get(self._key(labels), 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[tuple[str, LabelValues, float]]:
+        """Yield `(sample_name, label_values, value)` tuples."""
+        for key, value in list(self._values.items()):
+            yield self.name, key, value
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_}",
+        ]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{self._format_labels(key)} {value:g}")
+        return "\n".join(lines)
+
+    def _format_labels(
+        self, key: LabelValues, extra: dict[str, str] = None
+    ) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        labels = ",".join(f'{name}="{value}"' for name, value in pairs)
+        return f"{{{labels}}}"
+
+
+class Counter(Metric):
+    """Monotonically increasing value."""
+
+    type_ = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] += amount
+
+
+class Gauge(Metric):
+    """Value which goes up and down."""
+
+    type_ = "gauge"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] += amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. durations,
+    counted in buckets with upper bounds `buckets`.
+
+    :param buckets: Upper bounds of buckets, `+Inf` bucket is implied.
+    """
+
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Non-cumulative counts per bucket, the last one is `+Inf`.
+        self._counts: dict[LabelValues, list[int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] += value
+
+    def get(self, **labels: str) -> int:
+        """Number of observed values for given labels."""
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def sum(self, **labels: str) -> float:
+        """Sum of observed values for given labels."""
+        return self._values.get(self._key(labels), 0)
+
+    def quantile(self, q: float, **labels: str) -> float:
+        """Estimate `q` quantile by linear interpolation inside
+        the bucket it falls into, like `histogram_quantile` does.
+        Values above the last bucket are estimated as its bound."""
+        counts = self._counts.get(self._key(labels))
+        if not counts:
+            return 0
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts[:-1]):
+            if seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0
+                share = (rank - seen) / count if count else 0
+                return lower + (self.buckets[i] - lower) * share
+            seen += count
+        return self.buckets[-1]
+
+    def labelsets(self) -> list[dict[str, str]]:
+        """Label sets with observed values."""
+        return [dict(zip(self.labelnames, key)) for key in list(self._counts)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._counts.clear()
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_}",
+        ]
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        for key, counts in list(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = self._format_labels(key, {"le": bound})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = self._format_labels(key)
+            lines.append(f"{self.name}_sum{labels} {self._values[key]:g}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines)
+
+
+class Registry:
+    """Keeps all metrics of the application."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add metric to the registry or return already registered one."""
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(
+            Histogram(name, documentation, labelnames, buckets)
+        )
+
+    def get(self, name: str) -> Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format."""
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+def timed(histogram: Histogram, **labels: str) -> Callable:
+    """Decorator observing duration of coroutine function calls
+    in `histogram`, including calls which raised."""
+
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+REGISTRY = Registry()
@@ -0,0 +1,113 @@
+import sys
+import time
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from app.metrics import REGISTRY
+from app.profiling import Profiling
+
+HandlerDuration = REGISTRY.histogram(
+    "bot_handler_duration_seconds",
+    "Time spent in update handlers.",
+    ("handler", "state"),
+)
+HandlerErrors = REGISTRY.counter(
+    "bot_handler_errors_total",
+    "Update handlers which raised an exception.",
+    ("handler", "state"),
+)
+HandlersInProgress = REGISTRY.gauge(
+    "bot_handlers_in_progress",
+    "Update handlers running right now.",
+    ("handler",),
+)
+# Key of `data` the middleware keeps handler timing under.
+DATA_KEY = "_handler_metrics"
+# Key of `data` the middleware keeps profile of handler under.
+PROFILE_KEY = "_handler_profile"
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Record duration, errors and number of running handlers
+    per handler and FSM state of messages, callback
+    and inline queries."""
+
+    async def on_process_message(self, _, data: dict) -> None:
+        # Handler and state are known only after filters passed.
+        if DATA_KEY in data:
+            # Previous handler raised `SkipHandler`.
+            HandlersInProgress.dec(handler=data[DATA_KEY][0])
+        handler = current_handler.get()
+        name = getattr(handler, "__name__", str(handler))
+        HandlersInProgress.inc(handler=name)
+        state = data.get("raw_state")
+        if state is None and "state" in data:
+            # Handlers registered with `state="*"` get no raw state.
+            state = await data["state"].get_state()
+        data[DATA_KEY] = (name, state, time.perf_counter())
+
+    async def on_post_process_message(self, _, __, data: dict) -> None:
+        if DATA_KEY not in data:
+            return
+        name, state, started = data.pop(DATA_KEY)
+        state = state or ""
+        HandlerDuration.observe(
+            time.perf_counter() - started, handler=name, state=state
+        )
+        HandlersInProgress.dec(handler=name)
+        # Post process is called from `finally`, so exception
+        # raised by handler is still being handled here.
+        if sys.exc_info()[0] is not None:
+            HandlerErrors.inc(handler=name, state=state)
+
+    on_process_callback_query = on_process_message
+    on_post_process_callback_query = on_post_process_message
+    on_process_inline_query = on_process_message
+    on_post_process_inline_query = on_post_process_message
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Run handlers of messages, callback and inline queries
+    under profiler while profiling window is open."""
+
+    async def on_process_message(self, _, data: dict) -> None:
+        if PROFILE_KEY in data:
+            # Previous handler raised `SkipHandler`.
+            Profiling.exit(data.pop(PROFILE_KEY))
+        if Profiling.active:
+            data[PROFILE_KEY] = Profiling.enter()
+
+    async def on_post_process_message(self, _, __, data: dict) -> None:
+        if PROFILE_KEY in data:
+            Profiling.exit(data.pop(PROFILE_KEY))
+
+    on_process_callback_query = on_process_message
+    on_post_process_callback_query = on_post_process_message
+    on_process_inline_query = on_process_message
+    on_post_process_inline_query = on_post_process_message
+
+
+def handler_stats(limit: int = 20) -> list[dict[str, str | float]]:
+    """Handlers with the most total time spent, slowest first.
+
+    :returns: Dicts with handler, state, count, errors,
+        running, total time, mean and 95th percentile in seconds.
+    """
+    stats = []
+    for labels in HandlerDuration.labelsets():
+        count = HandlerDuration.get(**labels)
+        total = HandlerDuration.sum(**labels)
+        stats.append(
+            {
+                **labels,
+                "count": count,
+                "errors": HandlerErrors.get(**labels),
+                "running": HandlersInProgress.get(handler=labels["handler"]),
+                "total": total,
+                "mean": total / count if count else 0,
+                "p95": HandlerDuration.quantile(0.95, **labels),
+            }
+        )
+    stats.sort(key=lambda row: row["total"], reverse=True)
+    return stats[:limit]
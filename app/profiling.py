@@ -0,0 +1,405 @@
+"""
+On-demand profiling of the running bot.
+
+The bot manager opens a profiling window of a few minutes at most,
+while it's open code wrapped into `Profiling.section` - birthday
+loads and update handlers - runs under the chosen profiler:
+
+- `cpu`: deterministic `cProfile`, report is a `pstats` dump,
+  e.g. for `python -m pstats` or `snakeviz`;
+- `sample`: background thread sampling stacks of sections every
+  `PROFILE_SAMPLE_INTERVAL` seconds, report is folded stacks
+  for `flamegraph.pl` or speedscope;
+- `memory`: `tracemalloc` snapshots around every pandas ingest
+  (`ExcelParser.run`), report lists the biggest allocations.
+
+When the window closes, the report is sent to the bot manager
+as a file. Outside of a window sections cost next to nothing.
+
+Sections of handlers and loads stay open across their `await`s,
+so `cpu` and `sample` reports also include other coroutines run
+by the event loop meanwhile. Time the loop spends idle waiting
+for IO is left out of report summaries and of sampled stacks.
+"""
+import abc
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from logging.config import fileConfig
+from typing import Iterator
+
+from aiogram import Bot, types
+
+from app import settings
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class Report:
+    """
+    Result of a profiling window.
+
+    :param filename: Name of the file sent to the bot manager.
+    :param data: Contents of the file.
+    :param summary: Short text describing the hottest spots.
+    """
+
+    def __init__(self, filename: str, data: bytes, summary: str) -> None:
+        self.filename = filename
+        self.data = data
+        self.summary = summary
+
+
+class Profile(abc.ABC):
+    """Base of profilers run in a window. Subclasses override
+    hooks called when the first section is entered, the last one
+    is exited and around pandas ingest."""
+
+    mode: str = ""
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.sections = 0
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def enter(self) -> None:
+        self.sections += 1
+        if self.sections == 1:
+            self.start_section()
+
+    def exit(self) -> None:
+        self.sections -= 1
+        if self.sections == 0:
+            self.stop_section()
+
+    def start_section(self) -> None:
+        pass
+
+    def stop_section(self) -> None:
+        pass
+
+    @contextmanager
+    def ingest(self, name: str) -> Iterator[None]:
+        yield
+
+    @abc.abstractmethod
+    def report(self) -> Report:
+        """Collect results once the window is closed."""
+
+    def filename(self, extension: str) -> str:
+        started = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        return f"profile-{self.mode}-{started}.{extension}"
+
+
+class CpuProfile(Profile):
+    mode = "cpu"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.profiler = cProfile.Profile()
+
+    def start_section(self) -> None:
+        self.profiler.enable()
+
+    def stop_section(self) -> None:
+        self.profiler.disable()
+
+    def close(self) -> None:
+        self.profiler.disable()
+
+    def report(self) -> Report:
+        self.profiler.create_stats()
+        if not self.profiler.stats:
+            return Report(self.filename("prof"), b"", "")
+        stats = pstats.Stats(self.profiler)
+        # Cumulative time is dominated by the event loop running
+        # other coroutines, so summary lists own time of functions.
+        stats.sort_stats(pstats.SortKey.TIME)
+        lines = []
+        for func in stats.fcn_list:
+            if is_idle(func[2]):
+                continue
+            _, _, own, _, _ = stats.stats[func]
+            lines.append(f"{own:.3f} с {pstats.func_std_string(func)}")
+            if len(lines) == settings.PROFILE_SUMMARY_LINES:
+                break
+        return Report(
+            self.filename("prof"),
+            # Same as `stats.dump_stats`, but without a file.
+            marshal.dumps(stats.stats),
+            "\n".join(lines),
+        )
+
+
+class SampleProfile(Profile):
+    mode = "sample"
+
+    def __init__(
+        self, interval: float = settings.PROFILE_SAMPLE_INTERVAL
+    ) -> None:
+        super().__init__()
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        # Threads with running sections.
+        self.threads: Counter[int] = Counter()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, name="profile-sampler", daemon=True
+        )
+
+    def open(self) -> None:
+        self._sampler.start()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._sampler.join()
+
+    def enter(self) -> None:
+        self.threads[threading.get_ident()] += 1
+
+    def exit(self) -> None:
+        self.threads[threading.get_ident()] -= 1
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, sections in list(self.threads.items()):
+                if sections > 0 and thread_id in frames:
+                    stack = fold_stack(frames[thread_id])
+                    if not is_idle(stack.rsplit(";", 1)[-1]):
+                        self.stacks[stack] += 1
+
+    def report(self) -> Report:
+        data = "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.items()
+        )
+        leaves: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values())
+        summary = "\n".join(
+            f"{count / total:.0%} {leaf}"
+            for leaf, count in leaves.most_common(
+                settings.PROFILE_SUMMARY_LINES
+            )
+        )
+        return Report(self.filename("folded"), data.encode(), summary)
+
+
+class MemoryProfile(Profile):
+    mode = "memory"
+
+    def __init__(self) -> None:
+        super().__init__()
+        # Name, peak size and allocations diff of every ingest.
+        self.ingests: list[tuple[str, int, list]] = []
+        self._started_tracing = False
+
+    def open(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(settings.PROFILE_MEMORY_FRAMES)
+            self._started_tracing = True
+
+    def close(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    @contextmanager
+    def ingest(self, name: str) -> Iterator[None]:
+        if not tracemalloc.is_tracing():
+            # Window was closed before the ingest.
+            yield
+            return
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            if tracemalloc.is_tracing():
+                after = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                diff = after.compare_to(before, "traceback")
+                self.ingests.append((name, peak, diff))
+
+    def report(self) -> Report:
+        lines, summary = [], []
+        for name, peak, diff in self.ingests:
+            grown = sum(stat.size_diff for stat in diff)
+            title = (
+                f"{name}: пик {format_bytes(peak)}, "
+                f"прирост {format_bytes(grown)}"
+            )
+            summary.append(title)
+            lines.append(title)
+            for stat in diff[: settings.PROFILE_REPORT_LINES]:
+                lines.append(
+                    f"  {format_bytes(stat.size_diff)} "
+                    f"в {stat.count_diff} блоках"
+                )
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+            lines.append("")
+        return Report(
+            self.filename("txt"),
+            "\n".join(lines).encode(),
+            "\n".join(summary[: settings.PROFILE_SUMMARY_LINES]),
+        )
+
+
+PROFILES: dict[str, type[Profile]] = {
+    profile.mode: profile
+    for profile in (CpuProfile, SampleProfile, MemoryProfile)
+}
+MODES = tuple(PROFILES)
+
+
+class Profiler:
+    """
+    Run one profiling window at a time and
+    send its report to the bot manager once it's closed.
+    """
+
+    def __init__(self) -> None:
+        self.profile: Profile | None = None
+        self._timer: asyncio.Task | None = None
+
+    @property
+    def active(self) -> bool:
+        return self.profile is not None
+
+    def start(self, mode: str, seconds: float, bot: Bot) -> None:
+        """Open profiling window for `seconds`,
+        which is closed and reported then.
+
+        :raises ValueError: if mode is unknown.
+        :raises RuntimeError: if another window is open.
+        """
+        if mode not in PROFILES:
+            raise ValueError(f"unknown profiling mode {mode!r}")
+        if self.active:
+            raise RuntimeError(f"{self.profile.mode} profiling is running")
+        self.profile = PROFILES[mode]()
+        self.profile.open()
+        self._timer = asyncio.create_task(self._close_after(seconds, bot))
+        logger.info(f"{mode} profiling started for {seconds:g}s")
+
+    def stop(self) -> Report | None:
+        """Close the window at once.
+
+        :returns: Report or None if no window is open.
+        """
+        if not self.active:
+            return None
+        if self._timer is not None and not self._timer.done():
+            if self._timer is not asyncio.current_task():
+                self._timer.cancel()
+        profile, self.profile = self.profile, None
+        profile.close()
+        logger.info(f"{profile.mode} profiling stopped")
+        return profile.report()
+
+    async def _close_after(self, seconds: float, bot: Bot) -> None:
+        await asyncio.sleep(seconds)
+        await send_report(bot, self.stop())
+
+    def enter(self) -> Profile | None:
+        """Start a section, e.g. in a middleware.
+
+        :returns: Profile to pass to `exit` or None
+            if there is no profiling window.
+        """
+        profile = self.profile
+        if profile is not None:
+            profile.enter()
+        return profile
+
+    def exit(self, profile: Profile | None) -> None:
+        if profile is not None:
+            profile.exit()
+
+    @contextmanager
+    def section(self) -> Iterator[None]:
+        """Profile the code wrapped into the context
+        if a window is open."""
+        profile = self.enter()
+        try:
+            yield
+        finally:
+            self.exit(profile)
+
+    @contextmanager
+    def ingest(self, name: str) -> Iterator[None]:
+        """Take memory snapshots around pandas ingest
+        if memory profiling window is open."""
+        if self.profile is None:
+            yield
+            return
+        with self.profile.ingest(name):
+            yield
+
+
+async def send_report(bot: Bot, report: Report | None) -> None:
+    """Send report to the bot manager as a file."""
+    if report is None:
+        return
+    try:
+        if not report.data:
+            await bot.send_message(
+                settings.BOT_MANAGER_TELEGRAM_ID,
+                "🔬 За время профилирования ничего не выполнялось.",
+            )
+            return
+        caption = f"🔬 {report.filename}"
+        if report.summary:
+            caption += f"\n{report.summary}"
+        await bot.send_document(
+            settings.BOT_MANAGER_TELEGRAM_ID,
+            types.InputFile(io.BytesIO(report.data), report.filename),
+            caption=caption[:1024],
+        )
+    except Exception as e:
+        logger.error(f"<Profiler> send_report [FAILURE!]: {e}")
+
+
+def fold_stack(frame) -> str:
+    """Stack of the frame as `outer;...;inner` function names."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        names.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def is_idle(function: str) -> bool:
+    """Whether the function is the event loop waiting for IO,
+    e.g. `select (selectors.py:451)` in sampled stacks or
+    `<method 'poll' of 'select.epoll' objects>` in `cProfile`."""
+    return "(selectors.py:" in function or "of 'select." in function
+
+
+def format_bytes(size: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
+
+
+Profiling = Profiler()
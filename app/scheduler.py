@@ -1,12 +1,33 @@
+import datetime as dt
+
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
 from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.job import Job
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.schedulers.base import STATE_RUNNING
 from apscheduler.triggers.cron import CronTrigger
 
 from app import settings
+from app.db.lease import Leader
 from app.db.shared import jobstore_engine
-from app.toolbox.birthdays import dispatch_birthday_messages_to_chat
+from app.metrics import REGISTRY
+from app.toolbox.birthdays import (
+    dispatch_birthday_messages_to_chat,
+    resume_pending_birthdays,
+)
+
+JobLag = REGISTRY.histogram(
+    "scheduler_job_lag_seconds",
+    "Delay of job submission after its scheduled run time.",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60),
+)
+
+
+def observe_job_lag(event: JobSubmissionEvent) -> None:
+    scheduled = event.scheduled_run_times[-1]
+    lag = dt.datetime.now(scheduled.tzinfo) - scheduled
+    JobLag.observe(lag.total_seconds())
 
 
 class BotScheduler(AsyncIOScheduler):
@@ -25,6 +46,25 @@ class BotScheduler(AsyncIOScheduler):
             kwargs={"chat_id": chat_id},
         )
 
+    def _start_timer(self, wait_seconds: float | None) -> None:
+        # Other bot instances add jobs to the shared jobstore
+        # without waking this scheduler up, so it looks there
+        # at least every `settings.JOBSTORE_POLL_INTERVAL` seconds.
+        if self.state == STATE_RUNNING and (
+            wait_seconds is None
+            or wait_seconds > settings.JOBSTORE_POLL_INTERVAL
+        ):
+            wait_seconds = settings.JOBSTORE_POLL_INTERVAL
+        super()._start_timer(wait_seconds)
+
+    def _process_jobs(self) -> float | None:
+        # Scheduler is paused only on the next election round after
+        # the lease is lost, so due jobs are run only while the lease
+        # is still valid, otherwise new leader may run them as well.
+        if not Leader.is_leader:
+            return None
+        return super()._process_jobs()
+
 
 Scheduler = BotScheduler(
     jobstores={"default": SQLAlchemyJobStore(engine=jobstore_engine)},
@@ -32,3 +72,16 @@ Scheduler = BotScheduler(
     executors={"default": AsyncIOExecutor()},
     job_defaults={"misfire_grace_time": 30, "coalesce": True},
 )
+Scheduler.add_listener(observe_job_lag, EVENT_JOB_SUBMITTED)
+
+
+async def on_leader_change(leading: bool) -> None:
+    """Run scheduled jobs only while this bot instance is the leader,
+    other instances keep scheduler paused, but may add and remove jobs.
+    New leader also resumes birthdays left pending by previous runs
+    or by gone instances, see `claim_pending_birthdays`."""
+    if leading:
+        Scheduler.resume()
+        resume_pending_birthdays()
+    else:
+        Scheduler.pause()
@@ -1,6 +1,6 @@
 from pathlib import Path
 
-from decouple import config
+from decouple import Csv, config
 from pytz import timezone
 
 BASE_DIR = Path(__name__).resolve().parent
@@ -15,9 +15,23 @@ YADISK_TEST_TOKEN = config("YADISK_TEST_TOKEN")
 YANDEX_APP_ID = config("YANDEX_APP_ID")
 YANDEX_SECRET_CLIENT = config("YANDEX_SECRET_CLIENT")
 YADISK_FILEPATH = config("YADISK_FILEPATH")
+YADISK_API_URL = config("YADISK_API_URL", default="https://cloud-api.yandex.net")
+BOT_API_URL = config("BOT_API_URL", default="https://api.telegram.org")
+# Public url of the bot server. Bot uses polling if it's not set.
+WEBHOOK_HOST = config("WEBHOOK_HOST", default="")
+WEBHOOK_PATH = config("WEBHOOK_PATH", default="/webhook")
+WEBHOOK_SECRET = config("WEBHOOK_SECRET", default="")
+WEBAPP_HOST = config("WEBAPP_HOST", default="127.0.0.1")
+WEBAPP_PORT = config("WEBAPP_PORT", default=8080, cast=int)
+# Number of worker processes handling updates, see `app.sharding`.
+WORKERS = config("WORKERS", default=1, cast=int)
+# Workers listen on local ports starting from this one.
+WORKER_BASE_PORT = config("WORKER_BASE_PORT", default=8100, cast=int)
 
 OUTPUT_FILE_NAME = "source.xlsx"
 TIME_API_URL = "http://worldtimeapi.org/api/timezone/Europe/Moscow"
+TIME_API_TIMEOUT = 2.0
+TIME_SYNC_INTERVAL = 6 * 60 * 60
 
 COLUMNS = {"Дата": int, "месяц": str, "ФИО": str}
 MONTHS = (
@@ -35,6 +49,65 @@ MONTHS = (
     "декабрь",
 )
 FUTURE_SCOPE = 3
+MAX_FUTURE_SCOPE = 31
+WRITE_QUEUE_WINDOW = 1.0
+UPLOAD_CONFLICT_RETRIES = 3
+# Seconds after which pending birthday claimed by another bot instance
+# is considered abandoned and may be written by the leader.
+PENDING_CLAIM_TTL = 600
+QUERY_CACHE_SIZE = 256
+# Dialogue states idle longer than this number of seconds are dropped.
+FSM_STATE_TTL = 24 * 60 * 60
+# Seconds to collect changed dialogue states before writing them to db.
+FSM_FLUSH_INTERVAL = 1.0
+# Max number of dialogue states kept in memory.
+FSM_MAX_ENTRIES = 10_000
+SEARCH_LIMIT = 20
+# Seconds telegram caches inline query results on its side.
+INLINE_CACHE_TIME = 300
+# Number of birthdays on one page of /month and /range lists.
+PAGE_SIZE = 20
+# Number of /range date ranges rendered pages are kept for.
+RANGE_PAGES_KEPT = 64
+# Number of rows fetched from db at once during /export.
+EXPORT_CHUNK_SIZE = 500
+# Telegram ids of users allowed to import files with birthdays.
+IMPORT_USER_IDS = config(
+    "IMPORT_USER_IDS", default=BOT_MANAGER_TELEGRAM_ID, cast=Csv(int)
+)
+# Telegram ids of users allowed to export all birthdays with /export.
+EXPORT_USER_IDS = config(
+    "EXPORT_USER_IDS", default=BOT_MANAGER_TELEGRAM_ID, cast=Csv(int)
+)
+# Max number of rejected rows listed in import report.
+IMPORT_REPORT_LINES = 30
+# Seconds leader lease is valid without renewal. Another bot instance
+# takes over scheduled mailings at most this long after leader is gone.
+LEADER_LEASE_TTL = 30
+# Seconds between leader lease renewals and takeover attempts.
+LEADER_HEARTBEAT = 10
+# Max seconds scheduler sleeps before checking jobstore for jobs
+# added by other bot instances.
+JOBSTORE_POLL_INTERVAL = 60
+# Number of last traces of birthday loads kept in memory.
+TRACES_KEPT = 20
+# Loads taking longer than this number of seconds
+# are reported to the bot manager with a breakdown by stage.
+SLOW_LOAD_THRESHOLD = 30
+# Seconds between event loop lag measurements.
+LOOP_LAG_INTERVAL = 1.0
+# Default and max length in seconds of profiling window
+# opened by the bot manager.
+PROFILE_SECONDS = 60
+PROFILE_MAX_SECONDS = 600
+# Seconds between stack samples of `sample` profiling.
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Number of frames kept by tracemalloc in `memory` profiling.
+PROFILE_MEMORY_FRAMES = 10
+# Number of hottest spots in profiling report caption and
+# of biggest allocations per ingest in memory report.
+PROFILE_SUMMARY_LINES = 5
+PROFILE_REPORT_LINES = 30
 TIME_ZONE = timezone("Europe/Moscow")
 
 DEBUG = False
@@ -0,0 +1,347 @@
+"""
+Multi-worker mode of the bot.
+
+Front process receives updates from telegram and routes them
+to worker processes by consistent hashing of chat id.
+Each worker runs all handlers behind a local webhook,
+so a slow handler delays only chats of its worker.
+Updates of one chat always go to the same worker, which keeps
+FSM state of the chat in one place. The next update of a chat is
+forwarded once the worker answered the previous one. Worker answers
+when handler is done or, if it runs longer, after webhook response
+timeout of aiogram (55 seconds), so only such slow handler may run
+at the same time as the next update of its chat.
+
+Front process has already answered telegram when it forwards
+an update, so forwards which didn't reach the worker are retried
+with backoff. Error responses and timeouts are not retried, since
+the handler may have run already, so updates are handled at most once.
+An update is lost if its worker fails handling it or stays down
+for all `FORWARD_RETRIES` attempts.
+"""
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+from bisect import bisect
+from collections import deque
+from logging.config import fileConfig
+from typing import Sequence
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import (
+    ClientConnectorError,
+    ClientError,
+    ClientSession,
+    ClientTimeout,
+)
+
+from app import settings
+from app.metrics import REGISTRY
+from app.web import SECRET_HEADER
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+WORKER_HOST = "127.0.0.1"
+WORKER_PATH = "/update"
+# Telegram waits for webhook response for about a minute.
+FORWARD_TIMEOUT = 60
+# Number of attempts to forward an update and delay before the first
+# retry in seconds, doubled after each failed attempt.
+FORWARD_RETRIES = 5
+FORWARD_RETRY_DELAY = 0.5
+ForwardFailures = REGISTRY.counter(
+    "shard_forward_failures_total",
+    "Failed attempts to deliver an update to a worker.",
+    ("worker",),
+)
+ForwardDropped = REGISTRY.counter(
+    "shard_forward_dropped_total",
+    "Updates dropped after all attempts to deliver them failed.",
+    ("worker",),
+)
+
+
+class HashRing:
+    """
+    Consistent hashing of keys to worker numbers.
+    Each worker owns `replicas` points on the ring,
+    so adding a worker moves only about 1/N of keys.
+
+    :param workers: Number of workers.
+    :param replicas: Number of ring points of each worker.
+    """
+
+    def __init__(self, workers: int, replicas: int = 100) -> None:
+        points = sorted(
+            (self._hash(f"{worker}:{replica}"), worker)
+            for worker in range(workers)
+            for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._workers = [worker for _, worker in points]
+
+    def get(self, key: int | str) -> int:
+        """Number of the worker owning `key`."""
+        i = bisect(self._hashes, self._hash(str(key)))
+        return self._workers[i % len(self._workers)]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def chat_of(update: types.Update) -> int:
+    """Id of the chat update belongs to. Updates without chat,
+    e.g. inline queries, belong to the private chat of the user."""
+    for event in (
+        update.message,
+        update.edited_message,
+        update.channel_post,
+        update.edited_channel_post,
+        update.my_chat_member,
+        update.chat_member,
+        update.chat_join_request,
+    ):
+        if event is not None:
+            return event.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    if update.poll_answer is not None:
+        return update.poll_answer.user.id
+    for event in (
+        update.inline_query,
+        update.chosen_inline_result,
+        update.shipping_query,
+        update.pre_checkout_query,
+    ):
+        if event is not None:
+            return event.from_user.id
+    return 0
+
+
+class ShardRouter:
+    """
+    Forward updates to workers. Updates of one chat are queued
+    and forwarded one after another, each waiting for the worker
+    to answer the previous one, see module docstring for when
+    it answers. Different chats are forwarded concurrently.
+    Forward which failed to connect to the worker is retried
+    before the next update of the chat is sent.
+
+    :param worker_urls: Webhook urls of workers.
+    :param retries: Number of attempts to forward an update.
+    :param retry_delay: Seconds before the first retry,
+        doubled after each failed attempt.
+    """
+
+    def __init__(
+        self,
+        worker_urls: Sequence[str],
+        retries: int = FORWARD_RETRIES,
+        retry_delay: float = FORWARD_RETRY_DELAY,
+    ) -> None:
+        self.worker_urls = list(worker_urls)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.ring = HashRing(len(self.worker_urls))
+        self._queues: dict[int, deque[types.Update]] = {}
+        self._senders: dict[int, asyncio.Task] = {}
+        self._session: ClientSession = None
+
+    def __len__(self) -> int:
+        """Number of updates waiting to be forwarded."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def route(self, update: types.Update) -> None:
+        """Put update into the queue of its chat without waiting."""
+        chat_id = chat_of(update)
+        self._queues.setdefault(chat_id, deque()).append(update)
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._send(chat_id))
+
+    async def join(self) -> None:
+        """Wait until all queued updates are forwarded."""
+        while self._senders:
+            await asyncio.gather(*self._senders.values())
+
+    async def close(self) -> None:
+        await self.join()
+        if self._session is not None:
+            await self._session.close()
+
+    async def _send(self, chat_id: int) -> None:
+        """Forward updates of the chat until its queue is empty."""
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                await self._deliver(self.ring.get(chat_id), queue[0])
+                queue.popleft()
+        finally:
+            del self._queues[chat_id]
+            del self._senders[chat_id]
+
+    async def _deliver(self, worker: int, update: types.Update) -> None:
+        """Forward update to the worker, retrying with backoff."""
+        delay = self.retry_delay
+        for attempt in range(1, self.retries + 1):
+            if await self._forward(worker, update):
+                return
+            if attempt < self.retries:
+                await asyncio.sleep(delay)
+                delay *= 2
+        ForwardDropped.inc(worker=worker)
+        logger.error(
+            f"<ShardRouter> update {update.update_id} dropped after "
+            f"{self.retries} attempts to forward it to worker {worker}"
+        )
+
+    async def _forward(self, worker: int, update: types.Update) -> bool:
+        """Post update to the worker once.
+
+        :returns: False if the update didn't reach the worker
+            and is worth retrying.
+        """
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                timeout=ClientTimeout(total=FORWARD_TIMEOUT)
+            )
+        headers = {}
+        if settings.WEBHOOK_SECRET:
+            headers[SECRET_HEADER] = settings.WEBHOOK_SECRET
+        try:
+            async with self._session.post(
+                self.worker_urls[worker],
+                json=update.to_python(),
+                headers=headers,
+            ) as response:
+                response.raise_for_status()
+        except ClientConnectorError as e:
+            ForwardFailures.inc(worker=worker)
+            logger.error(
+                f"<ShardRouter> forward update {update.update_id} "
+                f"to worker {worker} [FAILURE!]: {e}"
+            )
+            return False
+        except (ClientError, asyncio.TimeoutError) as e:
+            # Worker got the update and may have handled it partly,
+            # so it's not sent again to avoid repeated side effects.
+            ForwardFailures.inc(worker=worker)
+            logger.error(
+                f"<ShardRouter> update {update.update_id} failed "
+                f"on worker {worker}, not retried [FAILURE!]: {e!r}"
+            )
+        return True
+
+
+class RoutingDispatcher(Dispatcher):
+    """Dispatcher of the front process.
+    Instead of running handlers routes every update to a worker."""
+
+    def __init__(self, bot: Bot, router: ShardRouter, **kwargs) -> None:
+        super().__init__(bot, **kwargs)
+        self.router = router
+
+    async def process_update(self, update: types.Update) -> None:
+        self.router.route(update)
+
+
+def worker_url(number: int) -> str:
+    port = settings.WORKER_BASE_PORT + number
+    return f"http://{WORKER_HOST}:{port}{WORKER_PATH}"
+
+
+def run_worker(number: int) -> None:
+    """Entry point of a worker process: run all handlers
+    behind local webhook at `worker_url(number)`.
+
+    Scheduled jobs run only on the worker elected leader.
+    """
+    from aiohttp import web
+
+    from app.bot import dispatcher
+    from app.handlers import (
+        register_birthday_handlers,
+        register_common_handlers,
+        register_manager_handlers,
+    )
+    from app.db.lease import Leader
+    from app.scheduler import Scheduler, on_leader_change
+    from app.toolbox.birthdays import Messages
+    from app.utils import Clock
+    from app.web import create_web_app, watch_event_loop
+
+    # Workers download remote file to separate local copies.
+    settings.OUTPUT_FILE_NAME = f"source_{number}.xlsx"
+    Messages.download_kwargs["local_filepath"] = (
+        settings.BASE_DIR / settings.OUTPUT_FILE_NAME
+    ).as_posix()
+
+    async def on_startup(_: web.Application) -> None:
+        await Clock.start()
+        Scheduler.start(paused=True)
+        await Leader.start(on_leader_change)
+        dispatcher["loop_watcher"] = asyncio.create_task(watch_event_loop())
+        logger.info(f"worker {number} started at {worker_url(number)}")
+
+    async def on_shutdown(_: web.Application) -> None:
+        dispatcher["loop_watcher"].cancel()
+        await Leader.stop()
+        Scheduler.shutdown()
+        await Clock.stop()
+        await dispatcher.storage.close()
+        await (await dispatcher.bot.get_session()).close()
+
+    register_common_handlers(dispatcher)
+    register_manager_handlers(dispatcher)
+    register_birthday_handlers(dispatcher)
+    app = create_web_app(dispatcher, WORKER_PATH)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    web.run_app(
+        app,
+        host=WORKER_HOST,
+        port=settings.WORKER_BASE_PORT + number,
+        print=None,
+    )
+
+
+def start_workers(workers: int) -> list[multiprocessing.Process]:
+    """Start worker processes."""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(number,), daemon=True)
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+async def wait_for_workers(
+    urls: Sequence[str], timeout: float = 30
+) -> bool:
+    """Wait until health endpoints of all workers respond.
+
+    :returns: False if some worker didn't start in `timeout` seconds.
+    """
+    health_urls = [url.replace(WORKER_PATH, "/health") for url in urls]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    async with ClientSession(timeout=ClientTimeout(total=1)) as session:
+        for url in health_urls:
+            while True:
+                try:
+                    async with session.get(url) as response:
+                        if response.status == 200:
+                            break
+                except (ClientError, asyncio.TimeoutError):
+                    pass
+                if loop.time() > deadline:
+                    logger.error(f"worker at {url} didn't start")
+                    return False
+                await asyncio.sleep(0.2)
+    return True
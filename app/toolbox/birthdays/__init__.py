@@ -1,78 +1,361 @@
+import asyncio
 import logging
+import time
 from logging.config import fileConfig
+from typing import Sequence
 
 from aiogram import types
+from sqlalchemy import delete, select, update
 
 from app import settings
-from app.toolbox.birthdays.excelparser import append_excel
+from app.db.lease import Leader
+from app.db.models import Birthday, ChatSettings, PendingBirthday
+from app.db.shared import get_session
+from app.metrics import REGISTRY
+from app.toolbox.birthdays.excelparser import (
+    append_excel_rows,
+    df_row_to_birthday_mapping,
+)
+from app.toolbox.birthdays.messageformat import decline_month
 from app.toolbox.yandex_disk import YandexDisk
-from app.utils import get_bot
+from app.utils import file_md5, get_bot, normalize_name
 
+from .importer import ImportReport, parse_import_file
 from .messageloader import BirthdayMessageLoader
+from .writequeue import BirthdayWriteQueue
 
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 
 logger = logging.getLogger(__name__)
 Bot = get_bot()
 Messages = BirthdayMessageLoader.create()
+# Pending birthdays this instance claimed earlier are left by previous run.
+STARTED_AT = time.time()
+UploadConflicts = REGISTRY.counter(
+    "yadisk_upload_conflicts_total",
+    "Uploads retried because remote file changed since download.",
+)
 
 
-async def dispatch_birthday_messages_to_chat(chat_id: int) -> None:
+async def dispatch_birthday_messages_to_chat(
+    chat_id: int, window: int = None
+) -> None:
     """Sends preloaded birthday messages to a telegram chat.
 
     :param chat_id: A telegram chat id that requested message dispatch.
+    :param window: Number of upcoming days to include.
+        Chat default is used if not provided.
 
     :returns: None."""
     if Messages.is_empty() or not Messages.is_fresh(hours=6):
-        await Messages.load()
+        await refresh_messages()
         logger.info("load birthday messages via scheduler")
-    for message in Messages:
+    if window is None:
+        window = get_chat_window(chat_id)
+    for message in Messages.messages(window):
         await Bot.send_message(chat_id, message)
 
 
-async def add_birthday(
-    message: types.Message, birthday_data: list[str | int]
+async def refresh_messages() -> None:
+    """Load birthdays from remote file into db on the leader
+    bot instance. Other instances only read what leader loaded."""
+    if Leader.is_leader:
+        await Messages.load()
+    else:
+        Messages.sync()
+
+
+def get_chat_window(chat_id: int) -> int:
+    """Number of upcoming days chat receives birthdays for.
+
+    Read from db on every call, since the window may be
+    set by another worker or bot instance.
+    """
+    window = None
+    with get_session() as session:
+        window = session.scalar(
+            select(ChatSettings.window).filter_by(chat_id=chat_id)
+        )
+    return settings.FUTURE_SCOPE if window is None else window
+
+
+def set_chat_window(chat_id: int, window: int) -> bool:
+    """Save number of upcoming days chat receives birthdays for.
+
+    :returns: True if saved successfully.
+    """
+    saved = False
+    with get_session() as session:
+        session.merge(ChatSettings(chat_id=chat_id, window=window))
+        session.commit()
+        saved = True
+    return saved
+
+
+async def add_birthdays(
+    rows: Sequence[list[str | int]], user_ids: Sequence[int]
 ) -> bool:
-    """Add new row to the end of the excel file with birthdays.
+    """Add new rows to the end of the excel file with birthdays.
+    Remote file is downloaded and uploaded once for all rows.
 
-    :param message: instance of `aiogram.types.Message`
-    :param birthday_data: list of values to be appended to
+    Before upload remote file checksum is compared with checksum
+    of the downloaded copy. If remote file was changed meanwhile
+    (by another bot instance or by hand), rows are appended
+    to a fresh copy again, up to `settings.UPLOAD_CONFLICT_RETRIES` times.
+
+    :param rows: Sequence of lists of values to be appended to
         excel file columns.
+    :param user_ids: Ids of users who added the rows.
 
     :returns: boolean result of operation.
     """
-    user_id = message.from_id
-    local_filepath = settings.BASE_DIR / settings.OUTPUT_FILE_NAME
+    users = ", ".join(str(user_id) for user_id in set(user_ids))
+    local_filepath = (settings.BASE_DIR / settings.OUTPUT_FILE_NAME).as_posix()
     async with YandexDisk(token=settings.YADISK_TOKEN) as disk:
+        for attempt in range(1, settings.UPLOAD_CONFLICT_RETRIES + 1):
 
-        # Download latest remote file.
-        await disk.download_file(
-            settings.YADISK_FILEPATH, local_filepath.as_posix()
-        )
+            # Download latest remote file.
+            if not await disk.download_file(
+                settings.YADISK_FILEPATH, local_filepath
+            ):
+                await notify_manager(
+                    "#ошибка: при попытке добавить новое ДР "
+                    f"пользователем {users}:\n"
+                    "не удалось скачать файл с Яндекс Диска."
+                )
+                return False
+            downloaded_md5 = file_md5(local_filepath)
+
+            if not append_excel_rows(local_filepath, rows):
+                await notify_manager(
+                    "#ошибка: при попытке добавить новое ДР "
+                    f"пользователем {users}:\n"
+                    "не удалось обработать локальный excel файл."
+                )
+                return False
+
+            # Yandex.Disk has no conditional upload, so the check
+            # narrows the race window down to one request.
+            remote_md5 = await disk.get_md5(settings.YADISK_FILEPATH)
+            if remote_md5 is None:
+                await notify_manager(
+                    "#ошибка: при попытке добавить новое ДР "
+                    f"пользователем {users}:\n"
+                    "не удалось проверить файл на Яндекс Диске."
+                )
+                return False
+            if remote_md5 != downloaded_md5:
+                UploadConflicts.inc()
+                logger.warning(
+                    "<add_birthdays> remote file changed since download "
+                    f"[CONFLICT!] attempt {attempt} of "
+                    f"{settings.UPLOAD_CONFLICT_RETRIES}"
+                )
+                continue
 
-        if append_excel(local_filepath.as_posix(), birthday_data):
             if not await disk.upload_file(
-                local_filepath.as_posix(),
+                local_filepath,
                 settings.YADISK_FILEPATH,
                 overwrite=True,
             ):
-                await Bot.send_message(
-                    chat_id=settings.BOT_MANAGER_TELEGRAM_ID,
-                    text=(
-                        "#ошибка: при попытке добавить новое ДР "
-                        f"пользователем {user_id}:\n"
-                        "не удалось обновить файл на Яндекс Диске."
-                    ),
+                await notify_manager(
+                    "#ошибка: при попытке добавить новое ДР "
+                    f"пользователем {users}:\n"
+                    "не удалось обновить файл на Яндекс Диске."
                 )
                 return False
+            return True
+
+    await notify_manager(
+        "#ошибка: при попытке добавить новое ДР "
+        f"пользователем {users}:\n"
+        "файл на Яндекс Диске изменялся во время каждой попытки обновления."
+    )
+    return False
+
+
+async def notify_manager(text: str) -> None:
+    """Send notification to `BOT_MANAGER` telegram chat."""
+    await Bot.send_message(chat_id=settings.BOT_MANAGER_TELEGRAM_ID, text=text)
+
+
+async def insert_added_birthdays(rows: Sequence[list[str | int]]) -> None:
+    """Put rows just written to remote excel file straight into db,
+    instead of reloading the whole file."""
+    mappings = []
+    for day, month, _, name in rows:
+        try:
+            mappings.append(df_row_to_birthday_mapping((day, month, name)))
+        except Exception as e:
+            logger.warning(f"<insert_added_birthdays> skipped row {name}: {e}")
+    await Messages.add(mappings)
+
+
+WriteQueue = BirthdayWriteQueue(
+    add_birthdays, after_write=insert_added_birthdays
+)
+
+
+async def import_birthdays(filepath: str, user_id: int) -> ImportReport:
+    """Import birthdays from a local .xlsx or .csv file.
+
+    Rows are validated like the source file, rows with names
+    already present in db are rejected. All accepted rows are
+    written to remote excel file and db in one `WriteQueue` batch.
+
+    :param filepath: Path to local file.
+    :param user_id: Id of user who sent the file.
+    """
+    # Parsing is blocking, so it's run in a thread.
+    report = await asyncio.to_thread(parse_import_file, filepath)
+    if not report.accepted:
+        return report
+
+    names = [mapping["name"] for mapping in report.accepted.values()]
+    existing = []
+    with get_session() as session:
+        existing = session.scalars(
+            select(Birthday.normalized_name).filter(
+                Birthday.normalized_name.in_(map(normalize_name, names))
+            )
+        ).all()
+    report.reject_names(existing, "партнер уже есть в базе")
+
+    if report.accepted:
+        report.written = await WriteQueue.submit_many(report.rows(), user_id)
+        logger.info(
+            f"import {len(report.accepted)} birthdays by user {user_id}: "
+            f"written={report.written}"
+        )
+    return report
+
+
+def enqueue_pending_birthday(pending: PendingBirthday) -> None:
+    """Put pending birthday into `WriteQueue`.
+    Once its batch is written, user's status message is edited
+    with the result and pending record is deleted.
+
+    :param pending: An instance of `db.models.PendingBirthday`
+        with all attributes loaded.
+    """
+    pending_id, chat_id, message_id = (
+        pending.id,
+        pending.chat_id,
+        pending.message_id,
+    )
+    birthday = f"{pending.day} {decline_month(pending.month)}, {pending.name}"
+
+    def forget() -> None:
+        # Called right after upload, so the birthday is not
+        # resumed and appended again if the bot stops meanwhile.
+        if pending_id is None:
+            return
+        with get_session() as session:
+            session.execute(
+                delete(PendingBirthday).filter_by(id=pending_id)
+            )
+            session.commit()
+
+    async def report(written: bool) -> None:
+        if written:
+            text = f"👍Вы добавили день рождения нового партнера:\n{birthday}"
         else:
-            await Bot.send_message(
-                chat_id=settings.BOT_MANAGER_TELEGRAM_ID,
-                text=(
-                    "#ошибка: при попытке добавить  не удалосьновое ДР "
-                    f"пользователем {user_id}:\n"
-                    "не удалось обработать локальный excel файл."
-                ),
+            forget()
+            text = (
+                "🔌Не удалось обновить файл на Яндекс Диске.\n"
+                "Менеджер бота уже в курсе проблемы и работает над решением.\n"
+                "Попробуйте повторить попытку позднее."
             )
-            return False
-        return True
+        await Bot.edit_message_text(
+            text, chat_id=chat_id, message_id=message_id
+        )
+
+    WriteQueue.enqueue(
+        pending.row, pending.user_id, on_done=report, on_written=forget
+    )
+
+
+def save_birthday(
+    day: int,
+    month: str,
+    name: str,
+    user_id: int,
+    status_message: types.Message,
+) -> None:
+    """Persist new birthday and enqueue it for writing
+    to remote excel file. Returns immediately.
+
+    :param status_message: Message sent to user, which will be
+        edited with the result of writing.
+    """
+    pending = PendingBirthday(
+        day=day,
+        month=month,
+        name=name,
+        user_id=user_id,
+        chat_id=status_message.chat.id,
+        message_id=status_message.message_id,
+        owner=Leader.holder,
+        claimed=time.time(),
+    )
+    with get_session() as session:
+        session.add(pending)
+        session.commit()
+        session.refresh(pending)
+        session.expunge(pending)
+    enqueue_pending_birthday(pending)
+
+
+def claim_pending_birthdays(holder: str) -> list[PendingBirthday]:
+    """Mark pending birthdays nobody is writing as claimed by `holder`.
+
+    Birthdays enqueued by another bot instance are claimed only
+    `settings.PENDING_CLAIM_TTL` seconds later, when their owner
+    is considered gone. Birthdays of `holder` are claimed only if
+    they were enqueued before this process started.
+    Claim is made by one UPDATE, so each birthday
+    is claimed by one instance at a time.
+
+    :returns: Claimed birthdays detached from session.
+    """
+    now = time.time()
+    claimable = (
+        PendingBirthday.owner.is_(None)
+        | (
+            (PendingBirthday.owner != holder)
+            & (PendingBirthday.claimed < now - settings.PENDING_CLAIM_TTL)
+        )
+        | (
+            (PendingBirthday.owner == holder)
+            & (PendingBirthday.claimed < STARTED_AT)
+        )
+    )
+    pendings = []
+    with get_session() as session:
+        session.execute(
+            update(PendingBirthday)
+            .where(claimable)
+            .values(owner=holder, claimed=now)
+            .execution_options(synchronize_session=False)
+        )
+        pendings = session.scalars(
+            select(PendingBirthday).filter_by(owner=holder, claimed=now)
+        ).all()
+        session.commit()
+        session.expunge_all()
+    return pendings
+
+
+def resume_pending_birthdays() -> int:
+    """Enqueue birthdays left pending after previous bot run
+    or by bot instances which are gone.
+    Birthdays already enqueued by any live instance are skipped.
+
+    :returns: Number of resumed birthdays.
+    """
+    pendings = claim_pending_birthdays(Leader.holder)
+    for pending in pendings:
+        enqueue_pending_birthday(pending)
+    if pendings:
+        logger.info(f"resume {len(pendings)} pending birthdays")
+    return len(pendings)
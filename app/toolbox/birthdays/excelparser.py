@@ -1,6 +1,7 @@
 import dataclasses
 import datetime as dt
 import logging
+from functools import partial
 from logging.config import fileConfig
 from typing import Any, Callable, Sequence
 
@@ -10,6 +11,8 @@ from openpyxl import Workbook, load_workbook
 from pandas import ExcelFile
 
 from app import settings
+from app.profiling import Profiling
+from app.tracing import span
 from app.utils import is_fresh
 
 from .messageformat import convert_month
@@ -17,6 +20,16 @@ from .messageformat import convert_month
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+# Validation rules for files with birthdays of partners.
+BIRTHDAY_PARSER_OPTIONS = {
+    "columns": settings.COLUMNS,
+    "unique_fields": ("ФИО",),
+    "filter_set": {
+        "Дата": ["> 0", "< 32"],
+        "месяц": [f"in {settings.MONTHS}"],
+    },
+}
+
 
 @dataclasses.dataclass
 class ExcelParser:
@@ -41,6 +54,9 @@ class ExcelParser:
             must be greater that `0` and less than `32`.
     :param _model_mappings: Stores results of parsing excel file.
         initial state: empty list [].
+    :param _rejected_rows: Stores reasons of dropping rows
+        by dataframe index.
+        initial state: empty dict {}.
     """
 
     file_path: str | bytes | ExcelFile | Workbook
@@ -50,6 +66,7 @@ class ExcelParser:
     sort_by: list[str] = None
     filter_set: dict[str, Sequence[str]] = None
     _model_mappings: Sequence[dict[str, Any]] = None
+    _rejected_rows: dict[int, str] = None
 
     @property
     def model_mappings(self) -> list[dict[str, Any]]:
@@ -58,6 +75,13 @@ class ExcelParser:
 
         return self._model_mappings
 
+    @property
+    def rejected_rows(self) -> dict[int, str]:
+        if self._rejected_rows is None:
+            self._rejected_rows = {}
+
+        return self._rejected_rows
+
     def run(
         self, model_mapper: Callable[[pd.Series], dict[str, Any]]
     ) -> list[dict[str, Any]]:
@@ -70,22 +94,37 @@ class ExcelParser:
 
         Attention: raises no exceptions.
         """
+        # Memory is profiled only while the bot manager asked for it.
+        with Profiling.ingest("excel"):
+            return self._run(model_mapper)
+
+    def _run(
+        self, model_mapper: Callable[[pd.Series], dict[str, Any]]
+    ) -> list[dict[str, Any]]:
         # Clear previous mappings.
         self.model_mappings.clear()
+        self.rejected_rows.clear()
         try:
-            df = self.read_excel()
+            with span("read_excel") as stage:
+                df = self.read_excel()
+                stage.count(rows_out=len(df))
         except Exception as e:
             logger.error(f"read excel [FAILURE!]: {e}")
             return self.model_mappings
         try:
-            (
-                df.pipe(self.check_empty_columns)
-                .pipe(self.cast_numeric)
-                .pipe(self.check_unique)
-                .pipe(self.filter)
-                .pipe(self.sort)
-                .pipe(self.to_model_mappings, model_mapper)
-            )
+            for stage_func in (
+                self.check_empty_columns,
+                self.cast_numeric,
+                self.check_unique,
+                self.filter,
+                self.sort,
+            ):
+                with span(stage_func.__name__, rows_in=len(df)) as stage:
+                    df = stage_func(df)
+                    stage.count(rows_out=len(df))
+            with span("to_model_mappings", rows_in=len(df)) as stage:
+                self.to_model_mappings(df, model_mapper)
+                stage.count(rows_out=len(self.model_mappings))
         except Exception as e:
             logger.error(f"Exception occured during parsing excel file: {e}")
         return self.model_mappings
@@ -109,13 +148,16 @@ class ExcelParser:
                 if type_.__name__ == "str"
             }
 
+        if isinstance(self.file_path, str) and self.file_path.endswith(
+            ".csv"
+        ):
+            reader = partial(pd.read_csv, encoding="utf-8-sig")
+        else:
+            reader = partial(pd.read_excel, engine="openpyxl")
+
         try:
             df = pd.DataFrame(
-                pd.read_excel(
-                    self.file_path,
-                    engine="openpyxl",
-                    converters=converters,
-                ),
+                reader(self.file_path, converters=converters),
                 columns=columns,
             )
         except FileNotFoundError as e:
@@ -155,7 +197,9 @@ class ExcelParser:
                     df[column].replace(
                         "[^0-9]", np.nan, regex=True, inplace=True
                     )
+                    index = df.index
                     df.dropna(inplace=True)
+                    self._reject(index, df, "пустая ячейка или не число")
                     df[column] = df[column].astype(type_, copy=True)
                 except Exception as e:
                     logger.error(f"ExcelParser <cast_numeric> [FAILURE!]: {e}")
@@ -167,7 +211,9 @@ class ExcelParser:
         if self.unique_fields:
             for field in self.unique_fields:
                 if hasattr(df, field):
+                    index = df.index
                     df = df.drop_duplicates((field,))
+                    self._reject(index, df, f"повтор в колонке `{field}`")
         return df
 
     def filter(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -175,8 +221,12 @@ class ExcelParser:
         if self.filter_set:
             for field, filter_clause in self.filter_set.items():
                 expr = self._build_query_expression(field, filter_clause)
+                index = df.index
                 try:
                     df = df.query(expr)
+                    self._reject(
+                        index, df, f"недопустимое значение в колонке `{field}`"
+                    )
                 except Exception as e:
                     logger.error(
                         f"ExcelParser <filter> [FAILURE] for field: {field}: {e}"
@@ -215,10 +265,18 @@ class ExcelParser:
                     f"ExcelParser <convert_to model_mappings> [FAILURE]: {e}. "
                     f"Skipped row No: {i}"
                 )
+                self.rejected_rows[i] = "некорректная дата"
                 continue
             mappings.append(model_mapping)
         return mappings
 
+    def _reject(
+        self, index: pd.Index, df: pd.DataFrame, reason: str
+    ) -> None:
+        """Remember rows of `index` missing in `df` as rejected."""
+        for i in index.difference(df.index):
+            self.rejected_rows.setdefault(i, reason)
+
     @staticmethod
     def _build_query_expression(
         field_name: str, filter_clause: Sequence[str]
@@ -287,6 +345,21 @@ def append_excel(filename: str | bytes, row: list[str | int]) -> bool:
     :param filename: Path to local excel file or file-like object
     :param row: List of data to be appended to the workbook.
 
+    :returns: Boolean result of append operation:
+        `True` if no exception raised, `False` otherwise.
+    """
+    return append_excel_rows(filename, [row])
+
+
+def append_excel_rows(
+    filename: str | bytes, rows: Sequence[list[str | int]]
+) -> bool:
+    """Add several rows to excel workbook at once.
+    Workbook is loaded, backed up and saved only once for all rows.
+
+    :param filename: Path to local excel file or file-like object
+    :param rows: Sequence of data lists to be appended to the workbook.
+
     :returns: Boolean result of append operation:
         `True` if no exception raised, `False` otherwise.
     """
@@ -304,7 +377,8 @@ def append_excel(filename: str | bytes, row: list[str | int]) -> bool:
 
     ws = wb.active
     try:
-        ws.append(row)
+        for row in rows:
+            ws.append(row)
     except Exception as e:
         logger.error(f"<append_excel> update worksheet [FAILURE!]: {e}")
         return False
@@ -0,0 +1,89 @@
+import csv
+import logging
+from logging.config import fileConfig
+from typing import Iterable
+
+from openpyxl import Workbook
+from sqlalchemy import Engine
+
+from app import settings
+from app.db.index import DateRecord
+from app.db.models import Birthday
+from app.db.shared import db_engine as prod_db_engine
+from app.db.shared import get_session
+
+from .messageformat import convert_month
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("xlsx", "csv")
+
+
+def record_to_row(record: DateRecord) -> tuple[int, str, str]:
+    """Convert record to a row in the order of `settings.COLUMNS`,
+    so exported file can be used as a source file."""
+    return record.day, convert_month(record.month), record.name
+
+
+def write_xlsx(filename: str, records: Iterable[DateRecord]) -> int:
+    """Write records into excel file row by row.
+    Write-only workbook doesn't keep written rows in memory.
+
+    :returns: Number of written records.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(list(settings.COLUMNS))
+    num_rows = 0
+    for record in records:
+        ws.append(record_to_row(record))
+        num_rows += 1
+    wb.save(filename)
+    return num_rows
+
+
+def write_csv(filename: str, records: Iterable[DateRecord]) -> int:
+    """Write records into csv file row by row.
+
+    :returns: Number of written records.
+    """
+    num_rows = 0
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(settings.COLUMNS)
+        for record in records:
+            writer.writerow(record_to_row(record))
+            num_rows += 1
+    return num_rows
+
+
+def export_birthdays(
+    filename: str,
+    fmt: str = "xlsx",
+    db_engine: Engine = None,
+    chunk_size: int = settings.EXPORT_CHUNK_SIZE,
+) -> int | None:
+    """Export all birthdays from db into a file.
+    Rows are streamed from db in chunks of `chunk_size`,
+    so memory use stays flat regardless of the table size.
+
+    Function is blocking, run it in a thread from async code.
+
+    :param filename: Path to the resulting file.
+    :param fmt: One of `EXPORT_FORMATS`.
+
+    :returns: Number of exported birthdays or None on failure.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    write = write_csv if fmt == "csv" else write_xlsx
+    num_rows = None
+    with get_session(db_engine or prod_db_engine) as session:
+        try:
+            num_rows = write(
+                filename, Birthday.queries.stream_records(session, chunk_size)
+            )
+        except OSError as e:
+            logger.error(f"<export_birthdays> [FAILURE!]: {e}")
+    return num_rows
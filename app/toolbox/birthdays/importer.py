@@ -0,0 +1,118 @@
+import dataclasses
+from typing import Any, Iterable
+
+import pandas as pd
+
+from app import settings
+from app.utils import normalize_name
+
+from .excelparser import (
+    BIRTHDAY_PARSER_OPTIONS,
+    ExcelParser,
+    df_row_to_birthday_mapping,
+)
+from .messageformat import convert_month
+
+IMPORT_EXTENSIONS = (".xlsx", ".csv")
+
+
+def row_number(index: int) -> int:
+    """Number of the file row with dataframe `index`.
+    First row of the file is a header."""
+    return index + 2
+
+
+@dataclasses.dataclass
+class ImportReport:
+    """
+    Result of importing a file with birthdays.
+
+    :param accepted: Birthday mappings by row number.
+    :param rejected: Reasons of rejection by row number.
+    :param written: Whether accepted rows were saved.
+    """
+
+    accepted: dict[int, dict[str, Any]] = dataclasses.field(
+        default_factory=dict
+    )
+    rejected: dict[int, str] = dataclasses.field(default_factory=dict)
+    written: bool = False
+
+    def reject(self, number: int, reason: str) -> None:
+        self.accepted.pop(number, None)
+        self.rejected[number] = reason
+
+    def reject_names(self, names: Iterable[str], reason: str) -> None:
+        """Reject accepted rows with normalized name in `names`."""
+        names = set(names)
+        for number, mapping in list(self.accepted.items()):
+            if normalize_name(mapping["name"]) in names:
+                self.reject(number, reason)
+
+    def rows(self) -> list[list[str | int]]:
+        """Accepted birthdays as rows to be appended to excel file."""
+        return [
+            [
+                mapping["date"].day,
+                convert_month(mapping["date"].month),
+                "",
+                mapping["name"],
+            ]
+            for mapping in self.accepted.values()
+        ]
+
+    def to_message(self) -> str:
+        """Per-row report for the user who sent the file."""
+        if not self.accepted and not self.rejected:
+            return (
+                "❗Не удалось прочитать файл. Проверьте, что в нем есть "
+                f"колонки {', '.join(settings.COLUMNS)}."
+            )
+        if not self.accepted:
+            lines = ["Ни одна строка не добавлена."]
+        elif self.written:
+            lines = [f"✅ Добавлено дней рождения: {len(self.accepted)}"]
+        else:
+            lines = [
+                f"🔌 Не удалось сохранить {len(self.accepted)} дней рождения.",
+                "Попробуйте повторить попытку позднее.",
+            ]
+        if self.rejected:
+            lines.append(f"❌ Отклонено строк: {len(self.rejected)}")
+            rejected = sorted(self.rejected.items())
+            for number, reason in rejected[: settings.IMPORT_REPORT_LINES]:
+                lines.append(f"строка {number}: {reason}")
+            if len(rejected) > settings.IMPORT_REPORT_LINES:
+                lines.append(
+                    f"...и еще {len(rejected) - settings.IMPORT_REPORT_LINES}"
+                )
+        return "\n".join(lines)
+
+
+def parse_import_file(filepath: str) -> ImportReport:
+    """Validate rows of a file with the same rules as the source file.
+
+    Function is blocking, run it in a thread from async code.
+
+    :param filepath: Path to local .xlsx or .csv file.
+    """
+    report = ImportReport()
+
+    def mapper(row: pd.Series) -> dict[str, Any]:
+        mapping = df_row_to_birthday_mapping(row)
+        report.accepted[row_number(row.name)] = mapping
+        return mapping
+
+    parser = ExcelParser(filepath, **BIRTHDAY_PARSER_OPTIONS)
+    parser.run(mapper)
+    for index, reason in parser.rejected_rows.items():
+        report.reject(row_number(index), reason)
+
+    # Same name written differently is a duplicate too.
+    seen = set()
+    for number, mapping in sorted(report.accepted.items()):
+        name = normalize_name(mapping["name"])
+        if name in seen:
+            report.reject(number, "повтор в колонке `ФИО`")
+        seen.add(name)
+    return report
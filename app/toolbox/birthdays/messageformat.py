@@ -1,6 +1,7 @@
-from typing import Sequence
+from typing import Any, Callable, Sequence
 
 from app import settings
+from app.db.managers import DateRecord
 from app.db.models import Birthday
 
 string_to_int_mapping = {
@@ -52,42 +53,106 @@ def decline_month(month: str) -> str:
     return month[:-1] + "я"
 
 
+declined_months = {
+    i: decline_month(month) for month, i in string_to_int_mapping.items()
+}
+
+
 def birthday_to_message(birthday: Birthday) -> str:
     """
     Returns birthday attributes in a formatted string.
 
-    :param birthday: An instance of `db.models.Birthday`.
+    :param birthday: An instance of `db.models.Birthday`
+        or a row with `name` and `date` attributes.
 
     :returns: Birthday instance data in a formatted string.
         e.g. `20 мая, Иван Иванов`.
     """
-    _, name, date = birthday.to_dict().values()
+    name, date = birthday.name, birthday.date
     day, month = date.day, date.month
     declined_month = decline_month(convert_month(month))
     return f"{day} {declined_month}, {name}"
 
 
-def format_birthday_sequence(birthdays: Sequence[Birthday]) -> str:
+def record_to_message(record: DateRecord) -> str:
+    """
+    Same as `birthday_to_message` for `DateRecord` projections.
+
+    :param record: `DateRecord` with name, month and day of birthday.
+
+    :returns: Birthday data in a formatted string.
+        e.g. `20 мая, Иван Иванов`.
+    """
+    return f"{record.day} {declined_months[record.month]}, {record.name}"
+
+
+def format_birthday_sequence(
+    birthdays: Sequence[Birthday | DateRecord],
+    formatter: Callable[[Any], str] = birthday_to_message,
+) -> str:
     """Converts a sequence of `db.models.Birthday` instances into
     a long string of formatted birthday strings separated by new line char.
 
-    :param birthdays: A sequnce of `db.models.Birthday` instances.
+    :param birthdays: A sequnce of `db.models.Birthday` instances
+        or `DateRecord`s.
+    :param formatter: Function that formats one birthday.
+        Use `record_to_message` for `DateRecord`s.
 
     :returns: A string that contains formatted strings for birthday instances.
         e.g. 20 мая, Иван Иванов\n
              15 сентября, Сергей Сергеев\n
              7 ноября, Екатерина Абрамова."""
-    return "\n".join(birthday_to_message(birthday) for birthday in birthdays)
+    return "\n".join(formatter(birthday) for birthday in birthdays)
+
+
+def plural_days(days: int) -> str:
+    """Returns Russian word for `days` in correct plural form.
+    e.g. 1 -> 'день'; 3 -> 'дня'; 7 -> 'дней'.
+    """
+    if days % 10 == 1 and days % 100 != 11:
+        return "день"
+    if 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        return "дня"
+    return "дней"
+
+
+def future_header(days: int = settings.FUTURE_SCOPE) -> str:
+    """Returns header for birthdays of the next `days` days."""
+    match days:
+        case 1:
+            return "#деньрождения завтра:\n"
+        case 2:
+            return "#деньрождения завтра и послезавтра:\n"
+        case 3:
+            return "#деньрождения завтра и следующие два дня:\n"
+    return f"#деньрождения в ближайшие {days} {plural_days(days)}:\n"
+
+
+def no_birthdays_message(days: int = settings.FUTURE_SCOPE) -> str:
+    """Returns message to be sent if there are no birthdays
+    today and in the next `days` days."""
+    if days == settings.FUTURE_SCOPE:
+        return "Сегодня и ближайшие пару дней #деньрождения не предвидится."
+    return (
+        f"Сегодня и в ближайшие {days} {plural_days(days)} "
+        "#деньрождения не предвидится."
+    )
 
 
 def get_formatted_messages(
-    birthdays: Sequence[Birthday], today: bool = True
+    birthdays: Sequence[Birthday | DateRecord],
+    today: bool = True,
+    formatter: Callable[[Any], str] = birthday_to_message,
+    days: int = settings.FUTURE_SCOPE,
 ) -> str | None:
     """Creates a joined formatted string of `birthdays`.
     Adds an appropriate header to the formatted string.
 
-    :param birthdays: Sequnce of `db.models.Birthday` instances.
+    :param birthdays: Sequnce of `db.models.Birthday` instances
+        or `DateRecord`s.
     :param today: Switch to choose a header for today or future messages.
+    :param formatter: Function that formats one birthday.
+    :param days: Number of days future message covers.
 
     :returns: Complete string to be send as a message to telegram chat.
         None, if birthdays is empty.
@@ -95,10 +160,6 @@ def get_formatted_messages(
     if not birthdays:
         return
 
-    birthday_messages = format_birthday_sequence(birthdays)
-    header = (
-        "#деньрождения сегодня:\n"
-        if today
-        else "#деньрождения завтра и следующие два дня:\n"
-    )
+    birthday_messages = format_birthday_sequence(birthdays, formatter)
+    header = "#деньрождения сегодня:\n" if today else future_header(days)
     return f"{header}{birthday_messages}"
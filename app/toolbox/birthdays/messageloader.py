@@ -1,29 +1,54 @@
+import datetime as dt
 import logging
+import os
 from logging.config import fileConfig
-from typing import Any, Iterator, Self
+from typing import Any, Iterator, Self, Sequence
 
 from aiogram import Bot
-from sqlalchemy import Engine
+from sqlalchemy import Engine, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app import settings
-from app.db.models import Birthday
+from app.db.cache import QueryCache
+from app.db.index import LEAP_YEAR, DayIndex, NameIndex
+from app.db.managers import DateQueryManager, DateRecord
+from app.db.models import Birthday, MessageSnapshot
 from app.db.shared import db_engine as prod_db_engine
 from app.db.shared import get_session
+from app.metrics import REGISTRY
+from app.profiling import Profiling
 from app.toolbox.yandex_disk import YandexDisk
+from app.tracing import Trace, TraceLog, format_seconds, span
 from app.utils import (
     BirthdayStorage,
+    Clock,
     DownloadKwargs,
     YadiskKwargs,
+    file_md5,
     get_bot,
-    get_current_date,
     set_inline_button,
 )
 
-from .excelparser import ExcelParser, df_row_to_birthday_mapping
-from .messageformat import get_formatted_messages
+from .excelparser import (
+    BIRTHDAY_PARSER_OPTIONS,
+    ExcelParser,
+    df_row_to_birthday_mapping,
+)
+from .messageformat import (
+    get_formatted_messages,
+    no_birthdays_message,
+    record_to_message,
+)
+from .pages import BirthdayPages, month_key, range_key
+from .upcoming import UpcomingBirthdays
 
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
+MessageCacheRequests = REGISTRY.counter(
+    "bot_message_cache_requests_total",
+    "Requests of formatted birthday messages by cache result.",
+    ("result",),
+)
 
 
 class BirthdayMessageLoader:
@@ -44,6 +69,8 @@ class BirthdayMessageLoader:
     :param bot: An instance of `Bot` from `aiogram`.
         Used for sending notifications to `BOT_MANAGER` telegram chat.
     :param db_engine: SQLAlchemy db connector.
+    :param queries: Query manager for birthdays.
+        `Birthday.queries` is used if not provided.
     """
 
     def __init__(
@@ -52,16 +79,31 @@ class BirthdayMessageLoader:
         download_kwargs: DownloadKwargs,
         bot: Bot,
         db_engine: Engine = None,
+        queries: DateQueryManager = None,
     ) -> None:
         self.yadisk_kwargs = yadisk_kwargs
         self.download_kwargs = download_kwargs
         self.bot = bot
         self.message_store = BirthdayStorage()
+        # Fingerprint of remote file db was last refreshed from.
+        self.fingerprint: str = None
+        # Version of `MessageSnapshot` messages and caches reflect.
+        self.version: int = None
+        self._upcoming: UpcomingBirthdays = None
+        # Formatted messages keyed by number of upcoming days.
+        self._window_messages: dict[int, dict[str, str | None]] = {}
+        # Names of all partners for search as user types.
+        self.names = NameIndex()
+        # Rendered pages of month and range overviews.
+        self.pages = BirthdayPages()
+        # Stage timings of the last loads.
+        self.traces = TraceLog("load")
 
         if db_engine is None:
             db_engine = prod_db_engine
 
         self.db_engine = db_engine
+        self.queries = queries or Birthday.queries
 
     def __iter__(self) -> Iterator[str]:
         """Concisely iterate over loaded messages.
@@ -77,6 +119,75 @@ class BirthdayMessageLoader:
         """
         return iter(self.message_store.messages)
 
+    def messages(self, window: int = settings.FUTURE_SCOPE) -> list[str]:
+        """Birthday messages with birthdays of the next `window` days.
+
+        Messages for default window are served from `self.message_store`.
+        Messages for other windows are computed once
+        per day and data update. Messages saved by other processes
+        are picked up first, see `sync`.
+
+        :param window: Number of days after today to include.
+        """
+        self.sync()
+        if window == settings.FUTURE_SCOPE:
+            return self.message_store.messages
+        messages = self._format_messages(Clock.today(), window)
+        warning = self.message_store.get("warning")
+        return [
+            message
+            for message in (warning, messages["today"], messages["future"])
+            if message
+        ]
+
+    def search(
+        self, query: str, limit: int = settings.SEARCH_LIMIT
+    ) -> list[DateRecord]:
+        """Birthdays with names containing all words of `query`.
+
+        Served from memory by `self.names`, which is rebuilt
+        from db after each data update, see `sync`.
+        """
+        self.sync()
+        self._build_calendar()
+        return self.names.search(query, limit)
+
+    def month_pages(self, month: int) -> str:
+        """Render pages of birthdays of `month` if needed.
+
+        :returns: Key of pages for `self.page`.
+        """
+        self.sync()
+        self._build_calendar()
+        return month_key(month)
+
+    def range_pages(self, start: dt.date, end: dt.date) -> str | None:
+        """Render pages of birthdays between `start` and `end`
+        inclusive if needed. Pages are kept until data update
+        or until too many other ranges are requested.
+
+        :returns: Key of pages for `self.page`
+            or None if birthdays couldn't be fetched.
+        """
+        self.sync()
+        self._build_calendar()
+        key = range_key(start, end)
+        if key in self.pages:
+            return key
+        records = None
+        with get_session(self.db_engine) as session:
+            records = self.queries.between_records(session, start, end)
+        if records is not None:
+            return self.pages.add_range(start, end, records)
+
+    def page(self, key: str, number: int = 0) -> tuple[str, int] | None:
+        """Page `number` of pages rendered under `key`.
+
+        :returns: Page text and total number of pages
+            or None if pages are gone, e.g. after data update.
+        """
+        return self.pages.get(key, number)
+
     def is_empty(self) -> bool:
         """Show if `self.message_store` is empty."""
         return self.message_store.is_empty()
@@ -95,34 +206,77 @@ class BirthdayMessageLoader:
     async def load(self) -> None:
         """Load birthday messages into `self.message_store`.
         Loaded messages are then dispatched to telegram chats.
+
+        Every stage of the load is traced, see `self.traces`.
+        Slow loads are reported to `BOT_MANAGER` telegram chat.
+        Loads are profiled while profiling window is open,
+        see `app.profiling`.
         """
-        await self._generate_mappings()
-        with get_session(self.db_engine) as session:
-            num_inserted = Birthday.operations.refresh_table(
-                self.model_mappings, session
-            )
-        if num_inserted == 0:
-            logger.error(f"Database update failure: ")
-            self.message_store["warning"] = (
-                "Не удалось обновить базу данных. "
-                "Ответ может не содержать наиболее актуальных данных."
-            )
+        with Profiling.section(), self.traces.trace() as trace:
+            await self._load()
+        logger.info(f"birthdays loaded in {trace.duration:.2f}s")
+        if trace.duration > settings.SLOW_LOAD_THRESHOLD:
+            await self._report_slow_load(trace)
 
+    async def _load(self) -> None:
+        fingerprint = await self._generate_mappings()
+        if fingerprint is not None and self._is_loaded(fingerprint):
+            logger.info("Remote file is unchanged, database refresh skipped.")
         else:
-            self.message_store.pop("warning", None)
+            num_inserted = 0
+            with span(
+                "refresh_table", rows_in=len(self.model_mappings)
+            ) as stage, get_session(self.db_engine) as session:
+                num_inserted = Birthday.operations.refresh_table(
+                    self.model_mappings, session
+                )
+                stage.count(rows_out=num_inserted)
+            if num_inserted == 0:
+                logger.error(f"Database update failure: ")
+                self.message_store["warning"] = (
+                    "Не удалось обновить базу данных. "
+                    "Ответ может не содержать наиболее актуальных данных."
+                )
 
-        await self._load_formatted_messages()
+            else:
+                self.message_store.pop("warning", None)
+                self.fingerprint = fingerprint
+            self._invalidate_index()
 
-    async def _generate_mappings(self) -> None:
+        with span("format_messages"):
+            await self._load_formatted_messages()
+        with span("build_calendar"):
+            self._build_calendar()
+        with span("save_snapshot"):
+            self.save()
+
+    async def _report_slow_load(self, trace: Trace) -> None:
+        try:
+            await self.bot.send_message(
+                settings.BOT_MANAGER_TELEGRAM_ID,
+                "🐢 Загрузка дней рождения заняла "
+                f"{format_seconds(trace.duration)}.\n{trace.summary()}",
+                disable_notification=True,
+            )
+        except Exception as e:
+            logger.error(f"<report_slow_load> [FAILURE!]: {e}")
+
+    async def _generate_mappings(self) -> str | None:
         """Generate mappings (namely dicts of birthday data)
         from file downloaded form `Yandex.Disk`
         for insertion into SQL table.
 
         Processed data than stored in `self.model_mappings` variable.
+        File equal to the one db was refreshed from is not parsed.
+
+        :returns: Fingerprint of downloaded file or None if download failed.
         """
         self.model_mappings = []
+        fingerprint = None
         async with YandexDisk(**self.yadisk_kwargs) as disk:
-            if not await disk.check_token():
+            with span("check_token"):
+                token_valid = await disk.check_token()
+            if not token_valid:
                 kbd = set_inline_button(
                     text="Получить код", callback_data="confirm_code"
                 )
@@ -140,16 +294,24 @@ class BirthdayMessageLoader:
                 logger.error(
                     "Could not download file from YaDisk - token expired!"
                 )
+                return fingerprint
+
+            local_filepath = self.download_kwargs.get("local_filepath")
+            with span("download") as stage:
+                downloaded = await disk.download_file(**self.download_kwargs)
+                if downloaded and os.path.exists(local_filepath):
+                    stage.count(bytes=os.path.getsize(local_filepath))
+            if downloaded:
+                try:
+                    with span("fingerprint"):
+                        fingerprint = file_md5(local_filepath)
+                except OSError as e:
+                    logger.error(f"<load_messages> fingerprint [FAILURE!]: {e}")
+                if fingerprint is not None and self._is_loaded(fingerprint):
+                    return fingerprint
 
-            elif await disk.download_file(**self.download_kwargs):
                 parser = ExcelParser(
-                    self.download_kwargs.get("local_filepath"),
-                    columns=settings.COLUMNS,
-                    unique_fields=("ФИО",),
-                    filter_set={
-                        "Дата": ["> 0", "< 32"],
-                        "месяц": [f"in {settings.MONTHS}"],
-                    },
+                    local_filepath, **BIRTHDAY_PARSER_OPTIONS
                 )
                 try:
                     self.model_mappings = parser.run(
@@ -159,26 +321,200 @@ class BirthdayMessageLoader:
                     logger.error(
                         f"ExcelParser in <load_messages> [FAILURE!]: {e}"
                     )
+        return fingerprint
+
+    async def add(self, mappings: Sequence[dict[str, Any]]) -> None:
+        """Insert new birthdays straight into db and recompute
+        birthday messages without a full load.
+
+        Remote file is not downloaded and timestamp of
+        `self.message_store` is left as is, so the next
+        scheduled full load reconciles db with remote file.
+        Snapshot is saved anyway, so other processes
+        pick new birthdays up, see `sync`.
+
+        :param mappings: Sequence of birthday mappings,
+            e.g. {'name': 'Иван Иванов', 'date': date(2023, 5, 20)}.
+        """
+        # Patch messages saved by other processes, not the stale ones.
+        self.sync()
+        with get_session(self.db_engine) as session:
+            num_upserted = Birthday.operations.upsert_mappings(
+                mappings, session
+            )
+        if num_upserted == 0:
+            return
+
+        self._invalidate_index()
+        self._build_calendar()
+        # Rebuilt from the index of upcoming birthdays, which knows
+        # windows crossing new year, unlike plain date comparison.
+        self.message_store.patch(**self._format_messages(Clock.today()))
+        logger.info("recompute birthday messages after local insert")
+        self.save()
+
+    def save(self) -> None:
+        """Persist `self.message_store` and source fingerprint to db.
+        Snapshot version is bumped, so other processes drop
+        their caches built from older data, see `sync`."""
+        values = {
+            "ts": self.message_store.get("ts"),
+            "fingerprint": self.fingerprint,
+            **{
+                key: self.message_store.get(key)
+                for key in BirthdayStorage.message_keys
+            },
+        }
+        query = sqlite_insert(MessageSnapshot).values(id=1, **values)
+        query = query.on_conflict_do_update(
+            index_elements=["id"],
+            set_={**values, "version": MessageSnapshot.version + 1},
+        )
+        with get_session(self.db_engine) as session:
+            session.execute(query)
+            self.version = session.scalar(
+                select(MessageSnapshot.version).filter_by(id=1)
+            )
+            session.commit()
+
+    def restore(self) -> bool:
+        """Fill `self.message_store` with messages saved
+        before restart, so they are served without a full load.
+        Saved timestamp is kept, so `self.is_fresh` still works.
+
+        :returns: True if saved messages were found.
+        """
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return False
+
+        self.message_store.restore(snapshot.ts, **self._messages(snapshot))
+        self.fingerprint = snapshot.fingerprint
+        self.version = snapshot.version
+        logger.info(f"Birthday messages restored from {snapshot}.")
+        return True
+
+    def sync(self) -> bool:
+        """Pick up messages and birthdays which another bot instance
+        or worker saved into shared db, instead of downloading
+        remote file. Messages missing from the snapshot are dropped
+        as well, e.g. yesterday's birthdays or resolved warning.
+
+        Snapshot version is compared first, so the call
+        is cheap enough to be made before serving cached data.
+
+        :returns: True if newer messages were found.
+        """
+        version = None
+        with get_session(self.db_engine) as session:
+            version = session.scalar(
+                select(MessageSnapshot.version).filter_by(id=1)
+            )
+        if version is None or version == self.version:
+            return False
+        snapshot = self._get_snapshot()
+        if snapshot is None:
+            return False
+
+        self.message_store.replace(snapshot.ts, **self._messages(snapshot))
+        self.fingerprint = snapshot.fingerprint
+        self.version = snapshot.version
+        # Birthday table was changed by another process.
+        QueryCache.invalidate(Birthday.__tablename__)
+        self._invalidate_index()
+        return True
+
+    def _get_snapshot(self) -> MessageSnapshot | None:
+        snapshot = None
+        with get_session(self.db_engine) as session:
+            snapshot = session.get(MessageSnapshot, 1)
+        return snapshot
+
+    @staticmethod
+    def _messages(snapshot: MessageSnapshot) -> dict[str, str | None]:
+        return {
+            key: getattr(snapshot, key) for key in BirthdayStorage.message_keys
+        }
 
     async def _load_formatted_messages(self) -> None:
         """Save formatted messages into `self.message_store`."""
-        today = await get_current_date(settings.TIME_API_URL)
+        today = Clock.today()
+        for key, message in self._format_messages(today).items():
+            self.message_store[key] = message
 
-        with get_session(self.db_engine) as session:
-            today_birthdays = Birthday.queries.today(session, today)
-            future_birthdays = Birthday.queries.future(session, today)
+    def _format_messages(
+        self, today: dt.date, window: int = settings.FUTURE_SCOPE
+    ) -> dict[str, str | None]:
+        """Format today birthdays and birthdays of the next `window` days.
 
-        today_message = get_formatted_messages(today_birthdays)
-        future_message = get_formatted_messages(future_birthdays, today=False)
+        :returns: Mapping of `BirthdayStorage` keys to messages.
+        """
+        upcoming = self._get_upcoming(today)
+        if (messages := self._window_messages.get(window)) is not None:
+            MessageCacheRequests.inc(result="hit")
+            return messages
+        MessageCacheRequests.inc(result="miss")
+
+        messages = {
+            "today": get_formatted_messages(
+                upcoming.today(), formatter=record_to_message
+            ),
+            "future": get_formatted_messages(
+                upcoming.future(window),
+                today=False,
+                formatter=record_to_message,
+                days=window,
+            ),
+        }
+        if not any(messages.values()):
+            messages["future"] = no_birthdays_message(window)
+        self._window_messages[window] = messages
+        return messages
 
-        self.message_store["today"] = today_message
-        self.message_store["future"] = future_message
+    def _get_upcoming(self, today: dt.date) -> UpcomingBirthdays:
+        """Index of upcoming birthdays starting from `today`.
+        Rebuilt from db on day change or after data update."""
+        if self._upcoming is None or self._upcoming.start != today:
+            with get_session(self.db_engine) as session:
+                self._upcoming = UpcomingBirthdays.fetch(
+                    session, self.queries, today
+                )
+            self._window_messages.clear()
+        return self._upcoming
 
-        if self.message_store.is_empty():
-            self.message_store["future"] = (
-                "Сегодня и ближайшие пару дней"
-                " #деньрождения не предвидится."
+    def _build_calendar(self) -> None:
+        """Rebuild name index and month pages of all birthdays
+        from db if the table changed since last build."""
+        generation = QueryCache.generation(Birthday.__tablename__)
+        if (
+            self.names.generation == generation
+            and self.pages.generation == generation
+        ):
+            return
+        records = None
+        with get_session(self.db_engine) as session:
+            records = self.queries.between_records(
+                session,
+                dt.date(LEAP_YEAR, 1, 1),
+                dt.date(LEAP_YEAR, 12, 31),
             )
+        if records is not None:
+            self.names.build(records, generation)
+            self.pages.build(records, generation)
+
+    def _is_loaded(self, fingerprint: str) -> bool:
+        """Check if db is already refreshed from file with `fingerprint`.
+        Empty table is always refreshed, e.g. after db upgrade."""
+        if fingerprint != self.fingerprint:
+            return False
+        num_birthdays = 0
+        with get_session(self.db_engine) as session:
+            num_birthdays = Birthday.queries.count(session)
+        return num_birthdays > 0
+
+    def _invalidate_index(self) -> None:
+        self._upcoming = None
+        self._window_messages.clear()
 
     @classmethod
     def create(cls) -> Self:
@@ -190,4 +526,9 @@ class BirthdayMessageLoader:
             "local_filepath": local_file.as_posix(),
         }
         bot = get_bot()
-        return cls(yadisk_kwargs, download_kwargs, bot)
+        queries = DateQueryManager(
+            Birthday, cache=QueryCache(), index=DayIndex()
+        )
+        loader = cls(yadisk_kwargs, download_kwargs, bot, queries=queries)
+        loader.restore()
+        return loader
@@ -0,0 +1,125 @@
+import datetime as dt
+from collections import OrderedDict
+from typing import Iterable
+
+from app import settings
+from app.db.index import DateRecord
+
+from .messageformat import convert_month, declined_months, record_to_message
+
+
+def month_key(month: int) -> str:
+    return f"m{month}"
+
+
+def range_key(start: dt.date, end: dt.date) -> str:
+    return f"r{start:%m%d}{end:%m%d}"
+
+
+def date_to_text(date: dt.date) -> str:
+    """e.g. `20 мая`."""
+    return f"{date.day} {declined_months[date.month]}"
+
+
+def render_pages(
+    header: str,
+    records: Iterable[DateRecord],
+    page_size: int = settings.PAGE_SIZE,
+) -> list[str]:
+    """Split formatted birthday lines into pages.
+
+    :param header: First line of every page.
+
+    :returns: List of page texts, at least one page long.
+    """
+    lines = [record_to_message(record) for record in records]
+    if not lines:
+        return [f"{header}\nДней рождения нет."]
+    num_pages = (len(lines) - 1) // page_size + 1
+    pages = []
+    for number in range(num_pages):
+        page = "\n".join(lines[number * page_size : (number + 1) * page_size])
+        if num_pages > 1:
+            page += f"\n\nСтраница {number + 1} из {num_pages}"
+        pages.append(f"{header}\n{page}")
+    return pages
+
+
+class BirthdayPages:
+    """
+    Rendered pages of birthday lists stored by key,
+    so flipping a page is a dict lookup.
+
+    Pages of every month are rendered in advance by `build`.
+    Pages of date ranges are rendered on first request and kept
+    until the next `build`, least recently used ones are dropped
+    once there are more than `max_ranges` of them.
+
+    :param page_size: Number of birthdays on one page.
+    :param max_ranges: Number of date ranges pages are kept for.
+    """
+
+    def __init__(
+        self,
+        page_size: int = settings.PAGE_SIZE,
+        max_ranges: int = settings.RANGE_PAGES_KEPT,
+    ) -> None:
+        self.generation: int = None
+        self.page_size = page_size
+        self.max_ranges = max_ranges
+        self._months: dict[str, list[str]] = {}
+        self._ranges: OrderedDict[str, list[str]] = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._months or key in self._ranges
+
+    def build(self, records: Iterable[DateRecord], generation: int) -> None:
+        """Replace all pages with month pages of `records`.
+
+        :param records: Birthday records ordered by date and name.
+        """
+        months: dict[int, list[DateRecord]] = {i: [] for i in range(1, 13)}
+        for record in records:
+            months[record.month].append(record)
+        self._ranges.clear()
+        self._months = {
+            month_key(month): render_pages(
+                f"🗓 Дни рождения, {convert_month(month)}:",
+                month_records,
+                self.page_size,
+            )
+            for month, month_records in months.items()
+        }
+        self.generation = generation
+
+    def add_range(
+        self, start: dt.date, end: dt.date, records: Iterable[DateRecord]
+    ) -> str:
+        """Render pages of birthdays between `start` and `end`.
+
+        :returns: Key of rendered pages.
+        """
+        key = range_key(start, end)
+        self._ranges[key] = render_pages(
+            f"🗓 Дни рождения с {date_to_text(start)} "
+            f"по {date_to_text(end)}:",
+            records,
+            self.page_size,
+        )
+        self._ranges.move_to_end(key)
+        while len(self._ranges) > self.max_ranges:
+            self._ranges.popitem(last=False)
+        return key
+
+    def get(self, key: str, number: int = 0) -> tuple[str, int] | None:
+        """Page `number` of pages stored by `key`.
+
+        :returns: Page text and total number of pages
+            or None if there are no such pages.
+        """
+        pages = self._months.get(key)
+        if pages is None and (pages := self._ranges.get(key)) is not None:
+            self._ranges.move_to_end(key)
+        if pages is None or not 0 <= number < len(pages):
+            return
+        return pages[number], len(pages)
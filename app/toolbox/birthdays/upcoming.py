@@ -0,0 +1,67 @@
+import datetime as dt
+from itertools import chain
+from typing import Iterable, Self
+
+from sqlalchemy.orm import Session
+
+from app import settings
+from app.db.managers import DateQueryManager, DateRecord
+
+
+class UpcomingBirthdays:
+    """
+    Birthdays of `start` day and the next `scope` days
+    grouped by day, so birthdays of any window not longer
+    than `scope` days are just a slice of `self.days`.
+
+    :param start: First day of the index, usually today.
+    :param records: Birthday records ordered by date and name.
+    :param scope: Number of days after `start` covered by the index.
+    """
+
+    def __init__(
+        self,
+        start: dt.date,
+        records: Iterable[DateRecord],
+        scope: int = settings.MAX_FUTURE_SCOPE,
+    ) -> None:
+        self.start = start
+        self.scope = scope
+        self.days: list[list[DateRecord]] = [[] for _ in range(scope + 1)]
+        for record in records:
+            offset = self._offset(record)
+            if offset is not None and offset <= scope:
+                self.days[offset].append(record)
+
+    def today(self) -> list[DateRecord]:
+        """Birthdays of `self.start` day."""
+        return self.days[0]
+
+    def future(self, days: int = settings.FUTURE_SCOPE) -> list[DateRecord]:
+        """Birthdays of the next `days` days after `self.start`."""
+        return list(chain.from_iterable(self.days[1 : days + 1]))
+
+    def _offset(self, record: DateRecord) -> int | None:
+        """Number of days from `self.start` to the next birthday
+        of `record`. Birthdays earlier in the year are moved
+        to the next year to support windows crossing new year."""
+        try:
+            date = dt.date(self.start.year, record.month, record.day)
+            if date < self.start:
+                date = date.replace(year=self.start.year + 1)
+        except ValueError:
+            # 29 of February in a non leap year.
+            return None
+        return (date - self.start).days
+
+    @classmethod
+    def fetch(
+        cls,
+        session: Session,
+        queries: DateQueryManager,
+        start: dt.date,
+        scope: int = settings.MAX_FUTURE_SCOPE,
+    ) -> Self:
+        """Build the index from db."""
+        end = start + dt.timedelta(days=scope)
+        return cls(start, queries.between_records(session, start, end), scope)
@@ -0,0 +1,170 @@
+import asyncio
+import dataclasses
+import logging
+from logging.config import fileConfig
+from typing import Any, Awaitable, Callable, Sequence
+
+from app import settings
+
+fileConfig(fname="log_config.conf", disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+Row = list[str | int]
+Writer = Callable[[Sequence[Row], Sequence[int]], Awaitable[bool]]
+Callback = Callable[[bool], Awaitable[Any]]
+
+
+@dataclasses.dataclass
+class QueuedRow:
+    """Row waiting in `BirthdayWriteQueue` to be written."""
+
+    row: Row
+    user_id: int
+    future: asyncio.Future
+    on_done: Callback = None
+    on_written: Callable[[], Any] = None
+
+
+class BirthdayWriteQueue:
+    """
+    Collect new birthday rows submitted by users and write them
+    to remote excel file in batches.
+
+    Rows submitted within `window` seconds are written by one
+    `writer` call, followed by one `after_write` call,
+    after which callers of the batch get the result.
+    Batches are written strictly one after another,
+    so concurrent additions never overwrite each other.
+
+    :param writer: Coroutine function that recieves a sequence of rows
+        and a sequence of ids of users who submitted them
+        and returns boolean result of writing.
+    :param after_write: Coroutine function to be called with rows
+        of each successfully written batch, e.g. to update messages.
+    :param window: Number of seconds to collect rows for one batch.
+    """
+
+    def __init__(
+        self,
+        writer: Writer,
+        after_write: Callable[[Sequence[Row]], Awaitable[Any]] = None,
+        window: float = settings.WRITE_QUEUE_WINDOW,
+    ) -> None:
+        self.writer = writer
+        self.after_write = after_write
+        self.window = window
+        self._pending: list[QueuedRow] = []
+        self._worker: asyncio.Task = None
+
+    def __len__(self) -> int:
+        """Number of rows waiting to be written."""
+        return len(self._pending)
+
+    def enqueue(
+        self,
+        row: Row,
+        user_id: int = None,
+        on_done: Callback = None,
+        on_written: Callable[[], Any] = None,
+    ) -> asyncio.Future:
+        """Put row into the queue without waiting for it to be written.
+
+        :param row: List of values to be appended to excel file columns.
+        :param user_id: Telegram id of user who added the row.
+        :param on_done: Coroutine function to be called with
+            boolean result of writing the batch containing the row.
+        :param on_written: Function to be called right after
+            the row is written, before anything else is awaited,
+            e.g. to mark the row as written.
+
+        :returns: Future resolved with boolean result of writing.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(
+            QueuedRow(row, user_id, future, on_done, on_written)
+        )
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._work())
+        return future
+
+    async def submit(self, row: Row, user_id: int = None) -> bool:
+        """Put row into the queue and wait until its batch is written.
+
+        :returns: Boolean result of writing the batch containing the row.
+        """
+        return await self.enqueue(row, user_id)
+
+    async def submit_many(
+        self, rows: Sequence[Row], user_id: int = None
+    ) -> bool:
+        """Put several rows into the queue at once,
+        so all of them get into the same batch.
+
+        :returns: True if all rows were written.
+        """
+        futures = [self.enqueue(row, user_id) for row in rows]
+        return all(await asyncio.gather(*futures))
+
+    async def join(self) -> None:
+        """Wait until all queued rows are written."""
+        if self._worker is not None:
+            await asyncio.shield(self._worker)
+
+    async def _work(self) -> None:
+        """Write collected batches until the queue is empty."""
+        while self._pending:
+            await asyncio.sleep(self.window)
+            batch, self._pending = self._pending, []
+            await self._write(batch)
+
+    async def _write(self, batch: list[QueuedRow]) -> None:
+        rows = [item.row for item in batch]
+        user_ids = [item.user_id for item in batch]
+        try:
+            written = await self.writer(rows, user_ids)
+        except Exception as e:
+            logger.error(f"<BirthdayWriteQueue> write batch [FAILURE!]: {e}")
+            written = False
+
+        if written:
+            for item in batch:
+                if item.on_written is None:
+                    continue
+                try:
+                    item.on_written()
+                except Exception as e:
+                    logger.error(
+                        "<BirthdayWriteQueue> on_written callback "
+                        f"[FAILURE!]: {e}"
+                    )
+
+        if written:
+            logger.info(f"<BirthdayWriteQueue> {len(rows)} rows written.")
+        else:
+            logger.error(
+                f"<BirthdayWriteQueue> {len(rows)} rows were not written."
+            )
+
+        # Rows are shown by the bot before users are told they're added.
+        if written and self.after_write is not None:
+            try:
+                await self.after_write(rows)
+            except Exception as e:
+                logger.error(
+                    f"<BirthdayWriteQueue> after write hook [FAILURE!]: {e}"
+                )
+
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(written)
+        await self._notify(batch, written)
+
+    @staticmethod
+    async def _notify(batch: list[QueuedRow], written: bool) -> None:
+        """Run `on_done` callbacks of all rows in the batch."""
+        callbacks = [item.on_done(written) for item in batch if item.on_done]
+        for result in await asyncio.gather(*callbacks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"<BirthdayWriteQueue> on_done callback [FAILURE!]: {result}"
+                )
@@ -2,19 +2,72 @@ import logging
 from logging.config import fileConfig
 
 from yadisk_async import YaDisk
+from yadisk_async.session import SessionWithHeaders
+
+from app import settings
+from app.metrics import REGISTRY, timed
 
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+YADISK_DEFAULT_API_URL = "https://cloud-api.yandex.net"
+YadiskDuration = REGISTRY.histogram(
+    "yadisk_request_duration_seconds",
+    "Time spent in Yandex.Disk operations.",
+    ("operation",),
+)
+
+
+class RedirectedSession(SessionWithHeaders):
+    """
+    Session that sends requests addressed to Yandex.Disk API
+    to another host, e.g. a local stand-in server.
+    """
+
+    def __init__(self, api_url: str, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.api_url = api_url.rstrip("/")
+
+    def _request(self, method: str, str_or_url, *args, **kwargs):
+        url = str(str_or_url)
+        if url.startswith(YADISK_DEFAULT_API_URL):
+            url = self.api_url + url.removeprefix(YADISK_DEFAULT_API_URL)
+        return super()._request(method, url, *args, **kwargs)
+
 
 class YandexDisk(YaDisk):
     """
     A wrapper class with `YaDisk.download` and `YaDisk.upload`
     methods that handle errors and close sessions.
+
+    :param api_url: Base url of Yandex.Disk API.
+        default: `settings.YADISK_API_URL`.
     """
 
-    __doc__ = YaDisk.__doc__
+    __doc__ += YaDisk.__doc__
+
+    def __init__(self, *args, api_url: str = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.api_url = api_url or settings.YADISK_API_URL
 
+    def make_session(self, token: str = None) -> SessionWithHeaders:
+        """Prepare session, redirected to `self.api_url` if it is
+        not the default Yandex.Disk API url."""
+        if self.api_url.rstrip("/") == YADISK_DEFAULT_API_URL:
+            return super().make_session(token)
+
+        if token is None:
+            token = self.token
+        session = RedirectedSession(self.api_url)
+        if token:
+            session.headers["Authorization"] = "OAuth " + token
+        return session
+
+    @timed(YadiskDuration, operation="check_token")
+    async def check_token(self, *args, **kwargs) -> bool:
+        return await super().check_token(*args, **kwargs)
+
+    @timed(YadiskDuration, operation="download")
     async def download_file(
         self, remote_filepath: str, local_filepath: str, **kwargs
     ) -> bool:
@@ -38,6 +91,7 @@ class YandexDisk(YaDisk):
             await self.close()
             return downloaded
 
+    @timed(YadiskDuration, operation="upload")
     async def upload_file(
         self, local_filepath: str, remote_filepath: str, **kwargs
     ) -> bool:
@@ -63,3 +117,18 @@ class YandexDisk(YaDisk):
         finally:
             await self.close()
             return uploaded
+
+    @timed(YadiskDuration, operation="get_md5")
+    async def get_md5(self, remote_filepath: str, **kwargs) -> str | None:
+        """Asynchronously fetch MD5 checksum of a file on Yandex.Disk.
+
+        :param remote_filepath: Path to remote file on `Yandex Disk`
+        :param kwargs: Valid `YaDisk.get_meta` method keyword arguments.
+        :returns: Checksum string or `None` if request failed.
+        """
+        try:
+            meta = await self.get_meta(remote_filepath, **kwargs)
+        except Exception as e:
+            logger.error(f"<YandexDisk.get_md5> [FAILURE!]: {e}")
+            return None
+        return meta.md5
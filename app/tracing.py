@@ -0,0 +1,162 @@
+"""
+Lightweight tracing of multi-stage pipelines, e.g. loading
+birthdays from remote file.
+
+A `Trace` is started for one run of a pipeline and made current,
+code of every stage wraps its work into `span`, which records
+duration and counters like number of rows into the current trace.
+Outside of a trace `span` costs next to nothing, so shared code,
+e.g. `ExcelParser`, is instrumented unconditionally.
+"""
+import dataclasses
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from app import settings
+from app.metrics import REGISTRY
+
+StageDuration = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent in pipeline stages.",
+    ("pipeline", "stage"),
+)
+LastStageDuration = REGISTRY.gauge(
+    "pipeline_last_stage_duration_seconds",
+    "Duration of the stage in the last pipeline run.",
+    ("pipeline", "stage"),
+)
+PipelineDuration = REGISTRY.histogram(
+    "pipeline_duration_seconds",
+    "Time spent in whole pipeline runs.",
+    ("pipeline",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+CurrentTrace: ContextVar["Trace | None"] = ContextVar(
+    "CurrentTrace", default=None
+)
+
+
+@dataclasses.dataclass
+class Span:
+    """
+    One stage of a pipeline run.
+
+    :param name: Name of the stage.
+    :param duration: Number of seconds the stage took.
+    :param counters: Numbers describing stage work,
+        e.g. `rows_in`, `rows_out`, `bytes`.
+    """
+
+    name: str
+    duration: float = 0
+    counters: dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def count(self, **counters: int) -> None:
+        self.counters.update(counters)
+
+    def __str__(self) -> str:
+        text = f"{self.name} {format_seconds(self.duration)}"
+        if self.counters:
+            counters = ", ".join(f"{k}={v}" for k, v in self.counters.items())
+            text += f" ({counters})"
+        return text
+
+
+class Trace:
+    """
+    Spans of one pipeline run in order of their start.
+
+    :param pipeline: Name of the pipeline, e.g. `load`.
+    """
+
+    def __init__(self, pipeline: str) -> None:
+        self.pipeline = pipeline
+        self.started = time.time()
+        self.duration: float = 0
+        self.spans: list[Span] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, **counters: int) -> Iterator[Span]:
+        """Measure the stage wrapped into the context.
+        Duration is recorded even if the stage raises."""
+        span = Span(name, counters=counters)
+        self.spans.append(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            StageDuration.observe(
+                span.duration, pipeline=self.pipeline, stage=name
+            )
+            LastStageDuration.set(
+                span.duration, pipeline=self.pipeline, stage=name
+            )
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        PipelineDuration.observe(self.duration, pipeline=self.pipeline)
+
+    def summary(self) -> str:
+        """Compact breakdown of the run, slowest stages first."""
+        spans = sorted(self.spans, key=lambda s: s.duration, reverse=True)
+        lines = [f"{self.pipeline} {format_seconds(self.duration)}:"]
+        lines.extend(f"  {span}" for span in spans)
+        return "\n".join(lines)
+
+
+class TraceLog:
+    """
+    Keep last traces of a pipeline in memory.
+
+    :param pipeline: Name of the pipeline.
+    :param size: Number of traces kept.
+    """
+
+    def __init__(
+        self, pipeline: str, size: int = settings.TRACES_KEPT
+    ) -> None:
+        self.pipeline = pipeline
+        self.traces: deque[Trace] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.traces)
+
+    def last(self) -> Trace | None:
+        return self.traces[-1] if self.traces else None
+
+    @contextmanager
+    def trace(self) -> Iterator[Trace]:
+        """Start a trace, make it current for spans
+        inside the context and keep it once finished."""
+        trace = Trace(self.pipeline)
+        token = CurrentTrace.set(trace)
+        try:
+            yield trace
+        finally:
+            CurrentTrace.reset(token)
+            trace.finish()
+            self.traces.append(trace)
+
+
+@contextmanager
+def span(name: str, **counters: int) -> Iterator[Span]:
+    """Measure the stage in the current trace.
+    Without current trace counters are just dropped."""
+    trace = CurrentTrace.get()
+    if trace is None:
+        yield Span(name)
+        return
+    with trace.span(name, **counters) as current:
+        yield current
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.0f} мс"
+    return f"{seconds:.1f} с"
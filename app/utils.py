@@ -1,11 +1,16 @@
+import asyncio
 import datetime as dt
+import functools
+import hashlib
+import json
 import logging
+import time
 from logging.config import fileConfig
 from typing import Any, NotRequired, TypedDict, TypeVar
 
 from aiogram import Bot, types
 from aiogram.dispatcher import FSMContext
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientTimeout
 
 from app import settings
 
@@ -23,23 +28,30 @@ class YadiskKwargs(TypedDict):
     token: str
     id: NotRequired[str]
     secret: NotRequired[str]
+    api_url: NotRequired[str]
+
+
+CANCEL_BUTTON = "❌ отмена"
+RESTART_BUTTON = "🔄 начать заново"
+SAVE_BUTTON = "💾 сохранить"
+DAYS_IN_MONTH = {
+    "январь": 31,
+    "февраль": 29,
+    "март": 31,
+    "апрель": 30,
+    "май": 31,
+    "июнь": 30,
+    "июль": 31,
+    "август": 31,
+    "сентябрь": 30,
+    "октябрь": 31,
+    "ноябрь": 30,
+    "декабрь": 31,
+}
 
 
 def days_in_month(month: str, default: int = 30) -> int:
-    return {
-        "январь": 31,
-        "февраль": 29,
-        "март": 31,
-        "апрель": 30,
-        "май": 31,
-        "июнь": 30,
-        "июль": 31,
-        "август": 31,
-        "сентябрь": 30,
-        "октябрь": 31,
-        "ноябрь": 30,
-        "декабрь": 31,
-    }.get(month, default)
+    return DAYS_IN_MONTH.get(month, default)
 
 
 def set_inline_button(**options):
@@ -49,6 +61,31 @@ def set_inline_button(**options):
     return kb
 
 
+def pages_inline_kb(
+    key: str, number: int, total: int
+) -> types.InlineKeyboardMarkup | None:
+    """Generate inline keyboard to flip pages stored by `key`.
+
+    :returns: None if there is only one page.
+    """
+    if total < 2:
+        return
+    kb = types.InlineKeyboardMarkup(row_width=2)
+    if number > 0:
+        kb.insert(
+            types.InlineKeyboardButton(
+                "⬅️ назад", callback_data=f"page:{key}:{number - 1}"
+            )
+        )
+    if number < total - 1:
+        kb.insert(
+            types.InlineKeyboardButton(
+                "вперед ➡️", callback_data=f"page:{key}:{number + 1}"
+            )
+        )
+    return kb
+
+
 def months_grid_reply_kb(
     row_width: int = 4, **kwargs
 ) -> types.ReplyKeyboardMarkup:
@@ -60,7 +97,7 @@ def months_grid_reply_kb(
     )
     for month in settings.MONTHS:
         kb.insert(month)
-    kb.row("❌ отмена")
+    kb.row(CANCEL_BUTTON)
     return kb
 
 
@@ -76,11 +113,38 @@ def days_grid_reply_kb(
     )
     for i in range(1, days + 1):
         kb.insert(str(i))
-    kb.row("❌ отмена", "🔄 начать заново")
+    kb.row(CANCEL_BUTTON, RESTART_BUTTON)
     return kb
 
 
+def buttons_row_reply_kb(*buttons: str) -> types.ReplyKeyboardMarkup:
+    """Generate reply keyboard with one row of buttons."""
+    kb = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    kb.row(*buttons)
+    return kb
+
+
+def serialize_markup(kb: types.base.TelegramObject) -> str:
+    """JSON payload of a keyboard. Bot passes strings to telegram
+    as they are, so the keyboard isn't serialized on every message."""
+    return json.dumps(kb.to_python())
+
+
+# Keyboards of AddBirthday dialogue, built once and sent as JSON.
+MONTHS_KB = serialize_markup(months_grid_reply_kb())
+DAYS_KB = {
+    month: serialize_markup(days_grid_reply_kb(month))
+    for month in settings.MONTHS
+}
+NAME_KB = serialize_markup(buttons_row_reply_kb(CANCEL_BUTTON, RESTART_BUTTON))
+COMPLETE_KB = serialize_markup(
+    buttons_row_reply_kb(CANCEL_BUTTON, RESTART_BUTTON, SAVE_BUTTON)
+)
+REMOVE_KB = serialize_markup(types.ReplyKeyboardRemove())
+
+
 def message_or_call(f):
+    @functools.wraps(f)
     async def inner(
         message: types.Message | types.CallbackQuery, state: FSMContext
     ):
@@ -112,38 +176,124 @@ def update_envar(path, varname: str, value: str) -> bool:
     return written > 0
 
 
+def file_md5(path: str) -> str:
+    """Calculate MD5 checksum of a local file."""
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def normalize_name(name: str) -> str:
+    """Convert name to a form used for search and duplicate detection:
+    lower case, `ё` replaced with `е`, single spaces between words.
+    e.g. ' Артём  ИВАНОВ ' -> 'артем иванов'.
+    """
+    return " ".join(name.casefold().replace("ё", "е").split())
+
+
 def today() -> dt.date:
-    return dt.date.today()
+    return Clock.today()
 
 
-async def get_current_date(url: str) -> dt.date:
-    """Try to fetch current date from external API.
-    Use system date if fails.
+class ClockService:
     """
-    today = dt.date.today()
-    try:
-        async with ClientSession() as session:
-            async with session.get(url) as response:
-                resp_data = await response.json()
-                logger.info(f"Получен ответ от стороннего API: {url}.")
-    except Exception:
-        logger.warning(
-            "Не удалось получить ответ от стороннего API. "
-            "Текущая дата будет задана операционной системой."
+    Provides current date and time in `settings.TIME_ZONE`.
+
+    External time API is asked once in a while (see `sync`),
+    current time is then computed from local monotonic clock
+    and the time received from API. Until the first successful
+    sync system time is used. Reading time never waits on network:
+    the clock is synced in background, see `start`.
+
+    :param url: External time API url.
+    :param timeout: Number of seconds to wait for API response.
+    :param sync_interval: Number of seconds after which
+        the clock is considered stale.
+    """
+
+    def __init__(
+        self,
+        url: str = settings.TIME_API_URL,
+        timeout: float = settings.TIME_API_TIMEOUT,
+        sync_interval: float = settings.TIME_SYNC_INTERVAL,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.sync_interval = sync_interval
+        self._base_timestamp = time.time()
+        self._base_monotonic = time.monotonic()
+        self._synced_at: float = None
+        self._sync_task: asyncio.Task = None
+
+    def timestamp(self) -> float:
+        """Current unix timestamp."""
+        return self._base_timestamp + time.monotonic() - self._base_monotonic
+
+    def now(self) -> dt.datetime:
+        """Current time in `settings.TIME_ZONE`."""
+        return dt.datetime.fromtimestamp(self.timestamp(), settings.TIME_ZONE)
+
+    def today(self) -> dt.date:
+        """Current date in `settings.TIME_ZONE`."""
+        return self.now().date()
+
+    def is_stale(self) -> bool:
+        """Show if the clock wasn't synced for `sync_interval` seconds."""
+        return (
+            self._synced_at is None
+            or time.monotonic() - self._synced_at > self.sync_interval
         )
-        return today
 
-    if datetime := resp_data.get("datetime"):
-        # `datetime` is <str> with format `2022-12-15T00:03:42.431581+03:00`
-        # we need only first 10 chars to create a date
+    async def start(self) -> None:
+        """Sync the clock and keep syncing it
+        every `sync_interval` seconds in background."""
+        await self.sync()
+        self._sync_task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._sync_task is not None and not self._sync_task.done():
+            self._sync_task.cancel()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def sync(self) -> bool:
+        """Fetch current time from external API and use it
+        as a new base for the clock. Keep the old base if fails.
+
+        :returns: True if the clock was synced.
+        """
+        timeout = ClientTimeout(total=self.timeout)
         try:
-            today = dt.date.fromisoformat(datetime[:10])
-        except (TypeError, ValueError):
+            async with ClientSession(timeout=timeout) as session:
+                async with session.get(self.url) as response:
+                    resp_data = await response.json()
+            timestamp = self._parse_timestamp(resp_data)
+        except Exception as e:
             logger.warning(
-                "Не удалось преобразовать ответ стороннего API в дату. "
-                "Формат ответа был изменен."
+                "Не удалось получить время от стороннего API. "
+                f"Используется прежнее время часов: {e}"
             )
-    return today
+            return False
+
+        self._base_timestamp = timestamp
+        self._base_monotonic = self._synced_at = time.monotonic()
+        logger.info(f"Получен ответ от стороннего API: {self.url}.")
+        return True
+
+    @staticmethod
+    def _parse_timestamp(resp_data: dict[str, Any]) -> float:
+        if (unixtime := resp_data.get("unixtime")) is not None:
+            return float(unixtime)
+        # `datetime` is <str> with format `2022-12-15T00:03:42.431581+03:00`
+        return dt.datetime.fromisoformat(resp_data["datetime"]).timestamp()
+
+
+Clock = ClockService()
 
 
 def set_timestamp():
@@ -193,6 +343,32 @@ class BirthdayStorage(dict):
         self.update(ts=set_timestamp())
         return super().__setitem__(__key, __value)
 
+    def patch(self, **messages: str | None) -> None:
+        """Update messages without renewing timestamp.
+        Used for partial updates, which shouldn't postpone
+        the next full load of messages."""
+        for key, value in messages.items():
+            if key in self.message_keys:
+                super().__setitem__(key, value)
+
+    def restore(self, ts: float | None, **messages: str | None) -> None:
+        """Fill storage with previously saved messages
+        and keep their original timestamp."""
+        self.patch(**{k: v for k, v in messages.items() if v is not None})
+        if ts is not None:
+            super().__setitem__("ts", ts)
+
+    def replace(self, ts: float | None, **messages: str | None) -> None:
+        """Make storage hold exactly provided messages with their
+        original timestamp. Messages which are None are removed."""
+        for key in self.message_keys:
+            if (message := messages.get(key)) is None:
+                self.pop(key, None)
+            else:
+                super().__setitem__(key, message)
+        if ts is not None:
+            super().__setitem__("ts", ts)
+
     def is_empty(self) -> bool:
         """If there is no birthday messages, then it's no use
         sending messages with warning.
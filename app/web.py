@@ -0,0 +1,97 @@
+"""
+Local aiohttp server of the bot: telegram webhook,
+health check and metrics endpoints.
+"""
+import asyncio
+import time
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY, WebhookRequestHandler
+from aiohttp import web
+
+from app import settings
+from app.metrics import REGISTRY
+from app.utils import Clock
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+STARTED_AT = time.monotonic()
+EventLoopLag = REGISTRY.histogram(
+    "event_loop_lag_seconds",
+    "Delay of event loop waking up a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+
+class SecretWebhookHandler(WebhookRequestHandler):
+    """Webhook handler which accepts only updates signed
+    with `settings.WEBHOOK_SECRET`, if it's set."""
+
+    async def post(self) -> web.Response:
+        secret = settings.WEBHOOK_SECRET
+        if secret and self.request.headers.get(SECRET_HEADER) != secret:
+            raise web.HTTPForbidden()
+        return await super().post()
+
+
+async def health(_: web.Request) -> web.Response:
+    return web.json_response(
+        {
+            "status": "ok",
+            "uptime": round(time.monotonic() - STARTED_AT),
+            # False while dates are computed from unsynced system time.
+            "clock_synced": not Clock.is_stale(),
+        }
+    )
+
+
+async def metrics(_: web.Request) -> web.Response:
+    return web.Response(
+        text=REGISTRY.render(), content_type="text/plain", charset="utf-8"
+    )
+
+
+def create_web_app(
+    dispatcher: Dispatcher = None,
+    webhook_path: str = settings.WEBHOOK_PATH,
+) -> web.Application:
+    """Create application with `/health` and `/metrics` endpoints.
+
+    :param dispatcher: If provided, application also receives
+        telegram updates at `webhook_path` and passes them to it.
+    """
+    app = web.Application()
+    app.add_routes([web.get("/health", health), web.get("/metrics", metrics)])
+    if dispatcher is not None:
+        app.router.add_route(
+            "*", webhook_path, SecretWebhookHandler, name="webhook_handler"
+        )
+        app[BOT_DISPATCHER_KEY] = dispatcher
+    return app
+
+
+def webhook_url() -> str:
+    return settings.WEBHOOK_HOST.rstrip("/") + settings.WEBHOOK_PATH
+
+
+async def start_metrics_server(
+    host: str = settings.WEBAPP_HOST, port: int = settings.WEBAPP_PORT
+) -> web.AppRunner:
+    """Serve `/health` and `/metrics` endpoints without webhook,
+    e.g. while the bot is polling for updates."""
+    runner = web.AppRunner(create_web_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def watch_event_loop(
+    interval: float = settings.LOOP_LAG_INTERVAL,
+) -> None:
+    """Measure how late the event loop wakes up a task
+    sleeping for `interval` seconds. Lag grows when
+    blocking code holds the loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EventLoopLag.observe(max(loop.time() - start - interval, 0))
@@ -1,15 +1,46 @@
+import asyncio
 import logging
+import multiprocessing
 from logging.config import fileConfig
+from typing import Any, Awaitable, Callable
 
 from aiogram import Bot, Dispatcher, executor, types
 
+from app import settings
 from app.bot import dispatcher as dp
+from app.db.lease import Leader
+from app.db.models import (
+    upgrade_birthday_table,
+    upgrade_message_snapshot_table,
+    upgrade_pending_birthday_table,
+)
 from app.db.shared import Base, db_engine
-from app.handlers import register_birthday_handlers, register_common_handlers
-from app.scheduler import Scheduler
+from app.handlers import (
+    register_birthday_handlers,
+    register_common_handlers,
+    register_manager_handlers,
+)
+from app.scheduler import Scheduler, on_leader_change
+from app.sharding import (
+    RoutingDispatcher,
+    ShardRouter,
+    start_workers,
+    wait_for_workers,
+    worker_url,
+)
+from app.utils import Clock
+from app.web import (
+    create_web_app,
+    start_metrics_server,
+    watch_event_loop,
+    webhook_url,
+)
 
 fileConfig(fname="log_config.conf", disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
+Callback = Callable[[Dispatcher], Awaitable[Any]]
+# Worker processes of multi-worker mode.
+Workers: list[multiprocessing.Process] = []
 
 
 async def set_bot_commands(bot: Bot):
@@ -17,28 +48,135 @@ async def set_bot_commands(bot: Bot):
         types.BotCommand("addchat", "добавить чат в рассылку"),
         types.BotCommand("removechat", "удалить чат из рассылки"),
         types.BotCommand("sendbdays", "получить список ближайших ДР"),
+        types.BotCommand("setwindow", "на сколько дней вперед показывать ДР"),
         types.BotCommand("newbirthday", "добавить новый ДР"),
+        types.BotCommand("find", "найти ДР партнера по ФИО"),
+        types.BotCommand("month", "список ДР за месяц"),
+        types.BotCommand("range", "список ДР между двумя датами"),
+        types.BotCommand("export", "выгрузить все ДР в файл"),
         types.BotCommand("cancel", "отменить команду"),
     ]
     await bot.set_my_commands(commands)
 
 
+def prepare_db():
+    if upgrade_birthday_table(db_engine):
+        logger.info("birthday table is recreated with search index")
+    if upgrade_pending_birthday_table(db_engine):
+        logger.info("pending_birthday table is upgraded with owner columns")
+    if upgrade_message_snapshot_table(db_engine):
+        logger.info("message_snapshot table is recreated with version")
+    Base.metadata.create_all(db_engine)
+
+
 async def on_startup(dp: Dispatcher):
     """Execute before Bot start polling."""
     await set_bot_commands(dp.bot)
-    Base.metadata.create_all(db_engine)
-    Scheduler.start()
+    await Clock.start()
+    prepare_db()
+    # Scheduler is resumed once this instance is elected leader.
+    Scheduler.start(paused=True)
+    await Leader.start(on_leader_change)
 
 
 async def on_shutdown(_: Dispatcher):
-    """Execute before Bot stops polling."""
-    Scheduler.remove_all_jobs()
+    """Execute before Bot stops polling or web server stops."""
+    # Jobs stay in the shared jobstore for the next leader.
+    await Leader.stop()
     Scheduler.shutdown()
+    await Clock.stop()
+
+
+async def on_startup_front(dp: RoutingDispatcher):
+    """Execute before front process of multi-worker mode
+    starts receiving updates."""
+    await set_bot_commands(dp.bot)
+    prepare_db()
+    Workers.extend(start_workers(settings.WORKERS))
+    if not await wait_for_workers(dp.router.worker_urls):
+        raise RuntimeError("Workers failed to start.")
+
+
+async def on_shutdown_front(dp: RoutingDispatcher):
+    await dp.router.close()
+    for process in Workers:
+        process.terminate()
+        process.join()
+
+
+def with_webhook(startup: Callback) -> Callback:
+    """Extend startup hook with setting telegram webhook."""
+
+    async def on_startup_webhook(dp: Dispatcher):
+        await startup(dp)
+        # Updates sent while the bot was down are delivered after restart.
+        await dp.bot.set_webhook(
+            webhook_url(), secret_token=settings.WEBHOOK_SECRET or None
+        )
+        logger.info(f"webhook is set to {webhook_url()}")
+
+    return on_startup_webhook
+
+
+def with_metrics(startup: Callback, serve: bool) -> Callback:
+    """Extend startup hook with measuring event loop lag
+    and, if `serve` is set, serving `/health` and `/metrics`
+    endpoints on `settings.WEBAPP_PORT`."""
+
+    async def on_startup_metrics(dp: Dispatcher):
+        await startup(dp)
+        dp["loop_watcher"] = asyncio.create_task(watch_event_loop())
+        if serve:
+            dp["metrics_server"] = await start_metrics_server()
+
+    return on_startup_metrics
+
+
+def without_metrics(shutdown: Callback) -> Callback:
+    """Extend shutdown hook with stopping what `with_metrics` started."""
+
+    async def on_shutdown_metrics(dp: Dispatcher):
+        if (watcher := dp.get("loop_watcher")) is not None:
+            watcher.cancel()
+        if (server := dp.get("metrics_server")) is not None:
+            await server.cleanup()
+        await shutdown(dp)
+
+    return on_shutdown_metrics
+
+
+def start(dp: Dispatcher, on_startup: Callback, on_shutdown: Callback):
+    """Receive updates with webhook if `settings.WEBHOOK_HOST` is set,
+    otherwise with polling. Both modes serve `/health` and `/metrics`
+    endpoints on local port, webhook mode with the same web server."""
+    if not settings.WEBHOOK_HOST:
+        executor.start_polling(
+            dp,
+            skip_updates=True,
+            on_startup=with_metrics(on_startup, serve=True),
+            on_shutdown=without_metrics(on_shutdown),
+        )
+        return
+    # Webhook route is added by `create_web_app`.
+    executor.set_webhook(
+        dp,
+        webhook_path=None,
+        on_startup=with_metrics(with_webhook(on_startup), serve=False),
+        on_shutdown=without_metrics(on_shutdown),
+        web_app=create_web_app(dp),
+    ).run_app(host=settings.WEBAPP_HOST, port=settings.WEBAPP_PORT)
 
 
 if __name__ == "__main__":
-    register_common_handlers(dp)
-    register_birthday_handlers(dp)
-    executor.start_polling(
-        dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown
-    )
+    if settings.WORKERS > 1:
+        router = ShardRouter(map(worker_url, range(settings.WORKERS)))
+        start(
+            RoutingDispatcher(dp.bot, router),
+            on_startup_front,
+            on_shutdown_front,
+        )
+    else:
+        register_common_handlers(dp)
+        register_manager_handlers(dp)
+        register_birthday_handlers(dp)
+        start(dp, on_startup, on_shutdown)
@@ -0,0 +1,335 @@
+import asyncio
+import hashlib
+import time
+from collections import Counter, defaultdict, deque
+from io import BytesIO
+from itertools import cycle
+
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from openpyxl import Workbook, load_workbook
+from yarl import URL
+
+from app import settings
+
+FAKE_YADISK_TOKEN = "mock"
+
+
+def make_workbook(rows: int) -> bytes:
+    """Build excel file with `rows` valid birthday rows.
+    The bigger `rows` is, the bigger the file gets."""
+    days = cycle(range(1, 29))
+    months = cycle(settings.MONTHS)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(list(settings.COLUMNS.keys()))
+    for i in range(rows):
+        ws.append([next(days), next(months), f"partner{i}"])
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+class FakeYandexDisk:
+    """
+    Local stand-in for Yandex.Disk REST API.
+    Serves token check, meta, download and upload endpoints
+    for files kept in memory.
+
+    :param token: The only OAuth token accepted by the server.
+    :param latency: Delay in seconds added to every request.
+
+    `after_download` may be set to a function of file path,
+    called after each served download, e.g. to simulate
+    the file being edited by someone else.
+    """
+
+    def __init__(self, token: str = FAKE_YADISK_TOKEN, latency: float = 0):
+        self.token = token
+        self.latency = latency
+        self.files: dict[str, bytes] = {}
+        self.revisions: dict[str, int] = {}
+        self.revision = 0
+        self.requests = Counter()
+        self.after_download = None
+        self.app = web.Application(middlewares=[self.delay])
+        self.app.add_routes(
+            [
+                web.get("/v1/disk/operations/{operation_id}", self.operation),
+                web.get("/v1/disk/resources", self.meta),
+                web.get("/v1/disk/resources/download", self.download_link),
+                web.get("/v1/disk/resources/upload", self.upload_link),
+                web.get("/files", self.download),
+                web.put("/files", self.upload),
+            ]
+        )
+
+    def put_file(self, path: str, content: bytes) -> None:
+        """Store a file as if it was uploaded to disk."""
+        path = self._normalize(path)
+        self.revision += 1
+        self.files[path] = content
+        self.revisions[path] = self.revision
+
+    def put_workbook(self, path: str, rows: int) -> None:
+        """Store an excel file with `rows` valid birthday rows."""
+        self.put_file(path, make_workbook(rows))
+
+    def get_file(self, path: str) -> bytes | None:
+        return self.files.get(self._normalize(path))
+
+    def append_row(self, path: str, row: list) -> None:
+        """Append row to a stored excel file, as if edited by hand."""
+        wb = load_workbook(BytesIO(self.get_file(path)))
+        wb.active.append(row)
+        output = BytesIO()
+        wb.save(output)
+        self.put_file(path, output.getvalue())
+
+    def read_rows(self, path: str) -> list[tuple]:
+        """Read data rows (without header) of a stored excel file."""
+        wb = load_workbook(BytesIO(self.get_file(path)), read_only=True)
+        rows = list(wb.active.iter_rows(min_row=2, values_only=True))
+        wb.close()
+        return rows
+
+    def count_rows(self, path: str) -> int:
+        return len(self.read_rows(path))
+
+    @web.middleware
+    async def delay(self, request: web.Request, handler):
+        self.requests[request.path] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return await handler(request)
+
+    async def operation(self, request: web.Request) -> web.Response:
+        if (error := self._check_auth(request)) is not None:
+            return error
+        return self._error(404, "DiskOperationNotFoundError")
+
+    async def meta(self, request: web.Request) -> web.Response:
+        if (error := self._check_auth(request)) is not None:
+            return error
+        path = self._normalize(request.query.get("path", ""))
+        if (content := self.files.get(path)) is None:
+            return self._error(404, "DiskNotFoundError")
+        return web.json_response(
+            {
+                "type": "file",
+                "name": path.rsplit("/", 1)[-1],
+                "path": f"disk:{path}",
+                "size": len(content),
+                "md5": hashlib.md5(content).hexdigest(),
+                "revision": self.revisions[path],
+                "mime_type": "application/vnd.openxmlformats-"
+                "officedocument.spreadsheetml.sheet",
+            }
+        )
+
+    async def download_link(self, request: web.Request) -> web.Response:
+        if (error := self._check_auth(request)) is not None:
+            return error
+        path = self._normalize(request.query.get("path", ""))
+        if path not in self.files:
+            return self._error(404, "DiskNotFoundError")
+        return self._link(request, path, "GET")
+
+    async def upload_link(self, request: web.Request) -> web.Response:
+        if (error := self._check_auth(request)) is not None:
+            return error
+        path = self._normalize(request.query.get("path", ""))
+        overwrite = request.query.get("overwrite") == "true"
+        if path in self.files and not overwrite:
+            return self._error(409, "DiskResourceAlreadyExistsError")
+        return self._link(request, path, "PUT")
+
+    async def download(self, request: web.Request) -> web.Response:
+        path = request.query.get("path", "")
+        content = self.files.get(path)
+        if content is None:
+            return self._error(404, "DiskNotFoundError")
+        if self.after_download is not None:
+            self.after_download(path)
+        return web.Response(body=content)
+
+    async def upload(self, request: web.Request) -> web.Response:
+        self.put_file(request.query.get("path", ""), await request.read())
+        return web.Response(status=201)
+
+    def _check_auth(self, request: web.Request) -> web.Response | None:
+        if request.headers.get("Authorization") != f"OAuth {self.token}":
+            return self._error(401, "UnauthorizedError")
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        path = path.removeprefix("disk:")
+        return path if path.startswith("/") else f"/{path}"
+
+    @staticmethod
+    def _link(request: web.Request, path: str, method: str) -> web.Response:
+        href = URL(f"{request.scheme}://{request.host}/files").with_query(
+            path=path
+        )
+        return web.json_response(
+            {"href": str(href), "method": method, "templated": False}
+        )
+
+    @staticmethod
+    def _error(status: int, error: str) -> web.Response:
+        return web.json_response(
+            {"error": error, "message": error, "description": error},
+            status=status,
+        )
+
+
+class FakeBotAPI:
+    """
+    Local stand-in for Telegram Bot API.
+    Accepts `sendMessage` and a few other methods the bot uses,
+    keeps sent messages in memory and answers with
+    `429 Too Many Requests` when flood limits are exceeded.
+
+    :param rate_limit: Number of messages allowed per second for all chats.
+    :param chat_rate_limit: Number of messages allowed per second for one chat.
+    :param retry_after: Value of `retry_after` parameter in 429 responses.
+    :param latency: Delay in seconds added to every request.
+    """
+
+    def __init__(
+        self,
+        rate_limit: int = 30,
+        chat_rate_limit: int = None,
+        retry_after: int = 1,
+        latency: float = 0,
+    ):
+        self.rate_limit = rate_limit
+        self.chat_rate_limit = chat_rate_limit
+        self.retry_after = retry_after
+        self.latency = latency
+        self.messages: list[dict] = []
+        self.calls = Counter()
+        self.throttled = 0
+        self._sent = deque()
+        self._sent_per_chat = defaultdict(deque)
+        self._message_id = 0
+        self.app = web.Application()
+        self.app.add_routes([web.post("/bot{token}/{method}", self.dispatch)])
+
+    async def dispatch(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        data = dict(await request.post())
+
+        if method == "getme":
+            return self._ok(
+                {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "makobot",
+                    "username": "makobot",
+                }
+            )
+        if method in ("sendmessage", "senddocument", "editmessagetext"):
+            if self._is_flooded(data.get("chat_id")):
+                self.throttled += 1
+                return web.json_response(
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": "Too Many Requests: "
+                        f"retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    },
+                    status=429,
+                )
+            return self._ok(self._store_message(method, data))
+        return self._ok(True)
+
+    def _is_flooded(self, chat_id: str) -> bool:
+        now = time.monotonic()
+        windows = [(self._sent, self.rate_limit)]
+        if self.chat_rate_limit:
+            windows.append(
+                (self._sent_per_chat[chat_id], self.chat_rate_limit)
+            )
+        for sent, limit in windows:
+            while sent and now - sent[0] > 1:
+                sent.popleft()
+            if limit and len(sent) >= limit:
+                return True
+        for sent, _ in windows:
+            sent.append(now)
+        return False
+
+    def _store_message(self, method: str, data: dict) -> dict:
+        if method == "editmessagetext":
+            message_id = int(data["message_id"])
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+        chat_id = int(data.get("chat_id"))
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", ""),
+        }
+        self.messages.append({"method": method, **message})
+        return message
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeTimeAPI:
+    """Stand-in for worldtimeapi.org, which answers with `unixtime`
+    after `latency` seconds."""
+
+    def __init__(self, unixtime: float = None, latency: float = 0) -> None:
+        self.unixtime = unixtime
+        self.latency = latency
+        self.requests = 0
+        self.url = None
+        self.app = web.Application()
+        self.app.router.add_get("/{tail:.*}", self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        unixtime = self.unixtime if self.unixtime is not None else time.time()
+        return web.json_response({"unixtime": int(unixtime)})
+
+
+@pytest_asyncio.fixture
+async def fake_yadisk():
+    disk = FakeYandexDisk()
+    server = TestServer(disk.app)
+    await server.start_server()
+    disk.url = str(server.make_url(""))
+    yield disk
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def fake_bot_api():
+    api = FakeBotAPI()
+    server = TestServer(api.app)
+    await server.start_server()
+    api.url = str(server.make_url(""))
+    yield api
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def fake_time_api():
+    api = FakeTimeAPI()
+    server = TestServer(api.app)
+    await server.start_server()
+    api.url = str(server.make_url(""))
+    yield api
+    await server.close()
@@ -0,0 +1,343 @@
+"""
+Offline load test for the bot.
+
+Runs the real `BirthdayMessageLoader`, `BotScheduler` and message handlers
+against local stand-ins of Yandex.Disk and Telegram Bot API
+(see `tests/fixtures/servers.py`) and reports throughput and latency.
+
+Usage:
+    python -m tests.loadtest --rows 2000 --chats 50 --users 10
+"""
+import argparse
+import asyncio
+import datetime as dt
+import statistics
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from aiohttp.test_utils import TestServer
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from sqlalchemy import create_engine
+
+from app import settings
+from app.bot import bot
+from app.db.fsm import SQLiteStorage
+from app.db.shared import Base, get_session
+from app.handlers import (
+    birthdays,
+    register_birthday_handlers,
+    register_common_handlers,
+)
+from app.scheduler import BotScheduler
+from app.toolbox import birthdays as toolbox
+from app.toolbox.birthdays import Messages, WriteQueue
+from tests.fixtures.servers import FAKE_YADISK_TOKEN, FakeBotAPI, FakeYandexDisk
+
+
+@dataclass
+class Stats:
+    """Latency samples and errors of one load test scenario."""
+
+    name: str
+    durations: list[float] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+    elapsed: float = 0
+
+    @contextmanager
+    def measure(self):
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+    @property
+    def throughput(self) -> float:
+        return len(self.durations) / self.elapsed if self.elapsed else 0
+
+    def percentile(self, q: int) -> float:
+        if len(self.durations) < 2:
+            return self.durations[0] if self.durations else 0
+        return statistics.quantiles(
+            self.durations, n=100, method="inclusive"
+        )[q - 1]
+
+    def summary(self) -> str:
+        return (
+            f"{self.name:<10} n={len(self.durations):<5} "
+            f"errors={len(self.errors):<4} "
+            f"p50={self.percentile(50) * 1000:8.1f}ms "
+            f"p95={self.percentile(95) * 1000:8.1f}ms "
+            f"max={max(self.durations, default=0) * 1000:8.1f}ms "
+            f"throughput={self.throughput:8.1f}/s"
+        )
+
+    def error_summary(self) -> str:
+        return ", ".join(
+            f"{error} x{count}"
+            for error, count in Counter(self.errors).most_common()
+        )
+
+
+# Number of dialogue steps of each user in storage benchmarks.
+STORAGE_STEPS = 100
+
+
+@dataclass
+class LoadTestConfig:
+    rows: int = 500
+    loads: int = 5
+    chats: int = 20
+    users: int = 5
+    disk_latency: float = 0.0
+    api_latency: float = 0.0
+    rate_limit: int = 30
+
+
+@contextmanager
+def patched_app(disk: FakeYandexDisk, api: FakeBotAPI, workdir: Path):
+    """Point the bot, its message loader and handlers
+    to local stand-in servers and a temporary database."""
+    engine = create_engine(f"sqlite:///{workdir / 'app.db'}")
+    Base.metadata.create_all(engine)
+    (workdir / "excel_backup").mkdir(exist_ok=True)
+    local_file = workdir / settings.OUTPUT_FILE_NAME
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(settings, "BASE_DIR", workdir)
+        mp.setattr(settings, "YADISK_TOKEN", FAKE_YADISK_TOKEN)
+        mp.setattr(settings, "YADISK_API_URL", disk.url)
+        mp.setattr(bot, "server", TelegramAPIServer.from_base(api.url))
+        mp.setattr(birthdays, "get_session", partial(get_session, engine))
+        mp.setattr(toolbox, "get_session", partial(get_session, engine))
+        mp.setattr(Messages, "db_engine", engine)
+        mp.setattr(
+            Messages,
+            "yadisk_kwargs",
+            {"token": FAKE_YADISK_TOKEN, "api_url": disk.url},
+        )
+        mp.setattr(
+            Messages,
+            "download_kwargs",
+            {
+                "remote_filepath": settings.YADISK_FILEPATH,
+                "local_filepath": local_file.as_posix(),
+            },
+        )
+        yield
+    engine.dispose()
+
+
+def make_update(update_id: int, user_id: int, text: str) -> types.Update:
+    return types.Update(
+        update_id=update_id,
+        message={
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "user"},
+            "text": text,
+        },
+    )
+
+
+async def run_loads(config: LoadTestConfig) -> Stats:
+    """Run full ingest from Yandex.Disk one after another."""
+    stats = Stats("load")
+    start = time.perf_counter()
+    for _ in range(config.loads):
+        with stats.measure():
+            await Messages.load()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+async def run_mailing(config: LoadTestConfig) -> Stats:
+    """Fire daily mailing jobs for all chats at the same moment.
+    Duration is counted from the scheduled fire time."""
+    stats = Stats("mailing")
+    done = asyncio.Event()
+    scheduler = BotScheduler(
+        jobstores={"default": MemoryJobStore()},
+        timezone=settings.TIME_ZONE,
+        executors={"default": AsyncIOExecutor()},
+        job_defaults={"misfire_grace_time": 30, "coalesce": True},
+    )
+
+    def listener(event):
+        now = dt.datetime.now(settings.TIME_ZONE)
+        stats.durations.append((now - event.scheduled_run_time).total_seconds())
+        if event.exception:
+            stats.errors.append(f"{type(event.exception).__name__}")
+        if len(stats.durations) == config.chats:
+            done.set()
+
+    scheduler.add_listener(listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+    scheduler.start(paused=True)
+    fire_time = dt.datetime.now(settings.TIME_ZONE)
+    for chat_id in range(1, config.chats + 1):
+        scheduler.add_chat_to_birthday_mailing(chat_id).modify(
+            next_run_time=fire_time
+        )
+    start = time.perf_counter()
+    scheduler.resume()
+    await done.wait()
+    stats.elapsed = time.perf_counter() - start
+    scheduler.shutdown(wait=False)
+    return stats
+
+
+async def run_dialogs(config: LoadTestConfig) -> Stats:
+    """Run `/newbirthday` dialogues of several users concurrently.
+    Each update is measured separately, total time includes
+    writing all new birthdays to disk."""
+    stats = Stats("dialogs")
+    dp = Dispatcher(bot, storage=SQLiteStorage(Messages.db_engine))
+    register_common_handlers(dp)
+    register_birthday_handlers(dp)
+    Dispatcher.set_current(dp)
+    Bot.set_current(bot)
+
+    async def dialog(user_id: int) -> None:
+        steps = (
+            "/newbirthday",
+            settings.MONTHS[user_id % 12],
+            str(user_id % 28 + 1),
+            f"Loadtest Partner {user_id}",
+            "💾 сохранить",
+            "/sendbdays",
+        )
+        for i, text in enumerate(steps):
+            update = make_update(user_id * 100 + i, user_id, text)
+            with stats.measure():
+                # Like polling, handle each update in its own task,
+                # so context variables do not leak between updates.
+                await asyncio.create_task(dp.process_update(update))
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(dialog(user_id) for user_id in range(1, config.users + 1))
+    )
+    await WriteQueue.join()
+    stats.elapsed = time.perf_counter() - start
+    await dp.storage.close()
+    return stats
+
+
+async def bench_storage(name: str, storage: BaseStorage, users: int) -> Stats:
+    """Measure storage operations done by FSM for one dialogue step:
+    read state and data, update data and set next state."""
+    stats = Stats(name)
+    start = time.perf_counter()
+    for step in range(STORAGE_STEPS):
+        for user in range(1, users + 1):
+            with stats.measure():
+                await storage.get_state(chat=user, user=user)
+                await storage.get_data(chat=user, user=user)
+                await storage.update_data(chat=user, user=user, step=step)
+                await storage.set_state(
+                    chat=user, user=user, state=f"AddBirthday:{step}"
+                )
+    await storage.close()
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+async def run_memory_storage(config: LoadTestConfig) -> Stats:
+    return await bench_storage("memory", MemoryStorage(), config.users)
+
+
+async def run_sqlite_storage(config: LoadTestConfig) -> Stats:
+    return await bench_storage(
+        "sqlite", SQLiteStorage(Messages.db_engine), config.users
+    )
+
+
+SCENARIOS = (
+    run_loads,
+    run_mailing,
+    run_dialogs,
+    run_memory_storage,
+    run_sqlite_storage,
+)
+
+
+async def run(config: LoadTestConfig) -> dict[str, Stats]:
+    """Start stand-in servers and run all scenarios against them."""
+    disk = FakeYandexDisk(latency=config.disk_latency)
+    disk.put_workbook(settings.YADISK_FILEPATH, config.rows)
+    api = FakeBotAPI(rate_limit=config.rate_limit, latency=config.api_latency)
+    disk_server, api_server = TestServer(disk.app), TestServer(api.app)
+    await disk_server.start_server()
+    await api_server.start_server()
+    disk.url = str(disk_server.make_url(""))
+    api.url = str(api_server.make_url(""))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        with patched_app(disk, api, Path(workdir)):
+            try:
+                for scenario in SCENARIOS:
+                    stats = await scenario(config)
+                    results[stats.name] = stats
+                    # Let flood limits of previous scenario expire.
+                    await asyncio.sleep(api.retry_after)
+            finally:
+                await (await bot.get_session()).close()
+                await disk_server.close()
+                await api_server.close()
+    results["api"] = api
+    results["disk"] = disk
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=LoadTestConfig.rows)
+    parser.add_argument("--loads", type=int, default=LoadTestConfig.loads)
+    parser.add_argument("--chats", type=int, default=LoadTestConfig.chats)
+    parser.add_argument("--users", type=int, default=LoadTestConfig.users)
+    parser.add_argument(
+        "--disk-latency", type=float, default=LoadTestConfig.disk_latency
+    )
+    parser.add_argument(
+        "--api-latency", type=float, default=LoadTestConfig.api_latency
+    )
+    parser.add_argument(
+        "--rate-limit", type=int, default=LoadTestConfig.rate_limit
+    )
+    config = LoadTestConfig(**vars(parser.parse_args()))
+
+    results = asyncio.run(run(config))
+    for name in ("load", "mailing", "dialogs", "memory", "sqlite"):
+        print(results[name].summary())
+        if results[name].errors:
+            print(f"{'':<10} {results[name].error_summary()}")
+    print(
+        f"bot api: {len(results['api'].messages)} messages delivered, "
+        f"{results['api'].throttled} throttled with 429"
+    )
+    disk = results["disk"]
+    added = disk.count_rows(settings.YADISK_FILEPATH) - config.rows
+    print(
+        f"yandex disk: {sum(disk.requests.values())} requests, "
+        f"{added} of {config.users} rows added by users persisted"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import datetime as dt
+from functools import partial
+
+import pytest
+from aiogram.bot.api import TelegramAPIServer
+
+from app import settings
+from app.bot import bot
+from app.db.models import ChatSettings
+from app.db.shared import get_session
+from app.toolbox import birthdays as toolbox
+from app.toolbox.birthdays import (
+    UploadConflicts,
+    add_birthdays,
+    get_chat_window,
+    set_chat_window,
+)
+
+from .fixtures.db import create_tables, engine
+from .fixtures.servers import FAKE_YADISK_TOKEN, fake_bot_api, fake_yadisk
+
+new_rows = [[1, "май", "", "new_partner1"], [2, "июнь", "", "new_partner2"]]
+
+
+@pytest.fixture
+def app_on_fake_servers(monkeypatch, tmp_path, fake_yadisk, fake_bot_api):
+    (tmp_path / "excel_backup").mkdir()
+    monkeypatch.setattr(settings, "BASE_DIR", tmp_path)
+    monkeypatch.setattr(settings, "YADISK_TOKEN", FAKE_YADISK_TOKEN)
+    monkeypatch.setattr(settings, "YADISK_API_URL", fake_yadisk.url)
+    monkeypatch.setattr(
+        bot, "server", TelegramAPIServer.from_base(fake_bot_api.url)
+    )
+    fake_yadisk.put_workbook(settings.YADISK_FILEPATH, 10)
+    UploadConflicts.clear()
+
+
+@pytest.mark.asyncio
+async def test_add_birthdays_appends_all_rows_in_one_upload(
+    app_on_fake_servers, fake_yadisk
+):
+    assert await add_birthdays(new_rows, [1, 2]) == True
+
+    rows = fake_yadisk.read_rows(settings.YADISK_FILEPATH)
+    assert len(rows) == 12
+    assert [row[3] for row in rows[-2:]] == ["new_partner1", "new_partner2"]
+    assert fake_yadisk.requests["/files"] == 2  # one download, one upload
+
+
+@pytest.mark.asyncio
+async def test_add_birthdays_retries_on_fresh_copy_if_remote_file_changed(
+    app_on_fake_servers, fake_yadisk
+):
+    path = settings.YADISK_FILEPATH
+    edits = [[3, "март", "", "edited_by_hand"]]
+
+    def edit_by_hand(_):
+        if edits:
+            fake_yadisk.append_row(path, edits.pop())
+
+    fake_yadisk.after_download = edit_by_hand
+
+    assert await add_birthdays(new_rows, [1, 2]) == True
+
+    names = [row[-1] for row in fake_yadisk.read_rows(path)]
+    assert names[-3:] == ["edited_by_hand", "new_partner1", "new_partner2"]
+    assert UploadConflicts.get() == 1
+
+
+@pytest.mark.asyncio
+async def test_add_birthdays_gives_up_if_remote_file_keeps_changing(
+    app_on_fake_servers, fake_yadisk, fake_bot_api
+):
+    path = settings.YADISK_FILEPATH
+    fake_yadisk.after_download = lambda _: fake_yadisk.append_row(
+        path, [3, "март", "", "edited_by_hand"]
+    )
+
+    assert await add_birthdays(new_rows, [1, 2]) == False
+
+    names = [row[-1] for row in fake_yadisk.read_rows(path)]
+    assert "new_partner1" not in names
+    assert UploadConflicts.get() == settings.UPLOAD_CONFLICT_RETRIES
+    assert fake_bot_api.messages[-1]["chat"]["id"] == int(
+        settings.BOT_MANAGER_TELEGRAM_ID
+    )
+
+
+@pytest.mark.asyncio
+async def test_add_birthdays_reports_failed_checksum_request_as_api_error(
+    app_on_fake_servers, fake_yadisk, fake_bot_api
+):
+    def revoke_token(_):
+        fake_yadisk.token = "revoked"
+
+    fake_yadisk.after_download = revoke_token
+
+    assert await add_birthdays(new_rows, [1, 2]) == False
+
+    assert UploadConflicts.get() == 0
+    assert fake_yadisk.requests["/files"] == 1  # no retries, no upload
+    assert "не удалось проверить файл" in fake_bot_api.messages[-1]["text"]
+
+
+def test_chat_window_defaults_to_future_scope_and_can_be_changed(
+    monkeypatch, engine, create_tables
+):
+    monkeypatch.setattr(toolbox, "get_session", partial(get_session, engine))
+
+    assert get_chat_window(1) == settings.FUTURE_SCOPE
+    assert set_chat_window(1, 7) == True
+    assert get_chat_window(1) == 7
+    assert get_chat_window(2) == settings.FUTURE_SCOPE
+
+    # Window saved by another worker is seen at once.
+    with get_session(engine) as session:
+        session.merge(ChatSettings(chat_id=1, window=3))
+        session.commit()
+    assert get_chat_window(1) == 3
+
+
+@pytest.mark.asyncio
+async def test_import_birthdays_writes_new_rows_in_one_batch(
+    monkeypatch, engine, create_tables, tmp_path
+):
+    import pandas as pd
+
+    from app.toolbox.birthdays import import_birthdays
+    from app.toolbox.birthdays.writequeue import BirthdayWriteQueue
+
+    batches = []
+
+    async def write(rows, user_ids):
+        batches.append(rows)
+        return True
+
+    monkeypatch.setattr(toolbox, "get_session", partial(get_session, engine))
+    monkeypatch.setattr(
+        toolbox, "WriteQueue", BirthdayWriteQueue(write, window=0.01)
+    )
+    with get_session(engine) as session:
+        toolbox.Birthday.operations.refresh_table(
+            [{"name": "Иванов Иван", "date": dt.date(2023, 5, 1)}], session
+        )
+    filename = (tmp_path / "import.csv").as_posix()
+    pd.DataFrame(
+        {
+            "Дата": [1, 2, 3],
+            "месяц": ["май", "июнь", "июль"],
+            "ФИО": ["иванов иван", "Петров Пётр", "Ким Анна"],
+        }
+    ).to_csv(filename, index=False)
+
+    report = await import_birthdays(filename, 1)
+
+    assert report.written
+    assert list(report.accepted) == [3, 4]
+    assert report.rejected == {2: "партнер уже есть в базе"}
+    assert batches == [
+        [[2, "июнь", "", "Петров Пётр"], [3, "июль", "", "Ким Анна"]]
+    ]
+
+
+def test_claim_pending_birthdays_skips_birthdays_enqueued_by_live_instances(
+    monkeypatch, engine, create_tables
+):
+    import time
+
+    from sqlalchemy import delete
+
+    from app.db.models import PendingBirthday
+    from app.toolbox.birthdays import claim_pending_birthdays
+
+    monkeypatch.setattr(toolbox, "get_session", partial(get_session, engine))
+    now = time.time()
+    stale = now - settings.PENDING_CLAIM_TTL - 1
+    claims = {
+        "legacy": (None, None),
+        "mine": ("me", now),
+        "mine_before_restart": ("me", toolbox.STARTED_AT - 1),
+        "other": ("other", now),
+        "other_gone": ("other", stale),
+    }
+    with get_session(engine) as session:
+        session.add_all(
+            PendingBirthday(
+                day=1,
+                month="май",
+                name=name,
+                user_id=1,
+                chat_id=1,
+                message_id=1,
+                owner=owner,
+                claimed=claimed,
+            )
+            for name, (owner, claimed) in claims.items()
+        )
+        session.commit()
+
+    claimed = claim_pending_birthdays("me")
+
+    assert sorted(pending.name for pending in claimed) == [
+        "legacy",
+        "mine_before_restart",
+        "other_gone",
+    ]
+    # Claimed birthdays are not resumed twice, e.g. after lease loss.
+    assert claim_pending_birthdays("me") == []
+    assert claim_pending_birthdays("another") == []
+
+    with get_session(engine) as session:
+        session.execute(delete(PendingBirthday))
+        session.commit()
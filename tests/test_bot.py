@@ -0,0 +1,51 @@
+import pytest
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils.exceptions import RetryAfter
+
+from app.bot import (
+    ApiThrottled,
+    InstrumentedBot,
+    MessagesFailed,
+    MessagesSent,
+    chat_class,
+)
+
+from .fixtures.servers import fake_bot_api
+
+
+def test_chat_class_by_chat_id():
+    assert chat_class(7) == "private"
+    assert chat_class(-42) == "group"
+    assert chat_class("-1001234") == "supergroup"
+    assert chat_class("@channel") == "channel"
+    assert chat_class(None) == "unknown"
+
+
+@pytest.mark.asyncio
+async def test_instrumented_bot_counts_sent_and_throttled_messages(
+    fake_bot_api,
+):
+    fake_bot_api.rate_limit = 2
+    bot = InstrumentedBot(
+        token="42:fake",
+        server=TelegramAPIServer.from_base(fake_bot_api.url),
+    )
+    private = MessagesSent.get(chat_class="private")
+    supergroup = MessagesSent.get(chat_class="supergroup")
+    failed = MessagesFailed.get(chat_class="group", error="RetryAfter")
+    throttled = ApiThrottled.get(method="sendMessage")
+
+    await bot.get_me()
+    await bot.send_message(7, "hi")
+    await bot.send_message(-1001234, "hi")
+    with pytest.raises(RetryAfter):
+        await bot.send_message(-42, "hi")
+    await (await bot.get_session()).close()
+
+    assert MessagesSent.get(chat_class="private") == private + 1
+    assert MessagesSent.get(chat_class="supergroup") == supergroup + 1
+    assert (
+        MessagesFailed.get(chat_class="group", error="RetryAfter")
+        == failed + 1
+    )
+    assert ApiThrottled.get(method="sendMessage") == throttled + 1
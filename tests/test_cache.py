@@ -0,0 +1,37 @@
+from app.db.cache import QueryCache
+
+
+def test_query_cache_counts_hits_and_misses():
+    cache = QueryCache(maxsize=2)
+
+    assert cache.get("table", "key") is None
+    cache.set("table", "key", ())
+    assert cache.get("table", "key") == ()
+
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+
+def test_query_cache_evicts_least_recently_used_result():
+    cache = QueryCache(maxsize=2)
+    cache.set("table", "first", 1)
+    cache.set("table", "second", 2)
+    cache.get("table", "first")
+
+    cache.set("table", "third", 3)
+
+    assert len(cache) == 2
+    assert cache.get("table", "second") is None
+    assert cache.get("table", "first") == 1
+    assert cache.get("table", "third") == 3
+
+
+def test_query_cache_invalidate_makes_only_given_table_stale():
+    cache = QueryCache()
+    cache.set("invalidated", "key", 1)
+    cache.set("other", "key2", 2)
+
+    QueryCache.invalidate("invalidated")
+
+    assert cache.get("invalidated", "key") is None
+    assert cache.get("other", "key2") == 2
+    assert len(cache) == 1
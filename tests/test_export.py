@@ -0,0 +1,101 @@
+import csv
+import datetime as dt
+import time
+
+import pytest
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from openpyxl import load_workbook
+
+from app import settings
+from app.db.models import Birthday
+from app.db.shared import get_session
+from app.handlers.birthdays import cmd_export_birthdays
+from app.toolbox.birthdays.export import export_birthdays
+
+from .fixtures.db import create_tables, db_session, engine
+from .fixtures.servers import fake_bot_api
+
+birthdays = [
+    {"name": "Петров Пётр", "date": dt.date(2023, 5, 20)},
+    {"name": "Иванов Иван", "date": dt.date(2023, 1, 1)},
+    {"name": "Алексеев Олег", "date": dt.date(2023, 5, 20)},
+]
+expected = [
+    ["Дата", "месяц", "ФИО"],
+    [1, "январь", "Иванов Иван"],
+    [20, "май", "Алексеев Олег"],
+    [20, "май", "Петров Пётр"],
+]
+
+
+@pytest.fixture
+def stored_birthdays(db_session, engine):
+    with get_session(engine) as session:
+        Birthday.operations.refresh_table(birthdays, session)
+
+
+def test_export_birthdays_to_xlsx_streams_rows_in_date_order(
+    stored_birthdays, engine, tmp_path
+):
+    filename = (tmp_path / "birthdays.xlsx").as_posix()
+    assert export_birthdays(filename, db_engine=engine, chunk_size=1) == 3
+
+    ws = load_workbook(filename).active
+    assert [list(row) for row in ws.iter_rows(values_only=True)] == expected
+
+
+def test_export_birthdays_to_csv(stored_birthdays, engine, tmp_path):
+    filename = (tmp_path / "birthdays.csv").as_posix()
+    assert export_birthdays(filename, "csv", db_engine=engine) == 3
+
+    with open(filename, encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert rows == [[str(value) for value in row] for row in expected]
+
+
+def test_export_birthdays_returns_none_if_file_cant_be_written(
+    stored_birthdays, engine, tmp_path
+):
+    filename = (tmp_path / "missing" / "birthdays.csv").as_posix()
+    assert export_birthdays(filename, "csv", db_engine=engine) is None
+
+
+def test_export_birthdays_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        export_birthdays("birthdays.json", "json")
+
+
+@pytest.mark.asyncio
+async def test_export_command_is_refused_to_users_not_allowed(
+    monkeypatch, fake_bot_api
+):
+    monkeypatch.setattr(settings, "EXPORT_USER_IDS", [1])
+    bot = Bot(
+        token="42:fake",
+        server=TelegramAPIServer.from_base(fake_bot_api.url),
+    )
+    dp = Dispatcher(bot)
+    dp.register_message_handler(cmd_export_birthdays, commands=["export"])
+    update = types.Update.to_object(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": -42, "type": "group"},
+                "from": {"id": 7, "is_bot": False, "first_name": "user"},
+                "text": "/export",
+                "entities": [
+                    {"type": "bot_command", "offset": 0, "length": 7}
+                ],
+            },
+        }
+    )
+
+    Bot.set_current(bot)
+    await dp.process_update(update)
+    await (await bot.get_session()).close()
+
+    assert [m["method"] for m in fake_bot_api.messages] == ["sendmessage"]
+    assert "нет прав" in fake_bot_api.messages[0]["text"]
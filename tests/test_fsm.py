@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from app.db.fsm import SQLiteStorage
+from app.db.models import FSMState
+from app.db.shared import get_session
+
+from .fixtures.db import create_tables, engine
+
+
+@pytest.fixture
+def storage(engine, create_tables):
+    storage = SQLiteStorage(engine, flush_interval=0.01)
+    yield storage
+    with get_session(engine) as session:
+        session.query(FSMState).delete()
+        session.commit()
+
+
+def stored_states(engine) -> dict:
+    states = {}
+    with get_session(engine) as session:
+        states = {
+            (row.chat, row.user): (row.state, row.data)
+            for row in session.query(FSMState)
+        }
+    return states
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_writes_changes_in_batches(storage, engine):
+    await storage.set_state(chat=1, user=1, state="AddBirthday:month")
+    await storage.update_data(chat=1, user=1, month="май")
+    await storage.set_state(chat=1, user=2, state="AddBirthday:day")
+    assert stored_states(engine) == {}
+
+    await storage._flusher
+    assert stored_states(engine) == {
+        ("1", "1"): ("AddBirthday:month", '{"month": "\\u043c\\u0430\\u0439"}'),
+        ("1", "2"): ("AddBirthday:day", "{}"),
+    }
+
+    await storage.reset_state(chat=1, user=1)
+    await storage.close()
+    assert list(stored_states(engine)) == [("1", "2")]
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_restores_states_after_restart(storage, engine):
+    await storage.set_state(chat=1, user=1, state="AddBirthday:name")
+    await storage.set_data(chat=1, user=1, data={"month": "май", "day": 1})
+    await storage.close()
+
+    restarted = SQLiteStorage(engine)
+    assert await restarted.get_state(chat=1, user=1) == "AddBirthday:name"
+    assert await restarted.get_data(chat=1, user=1) == {
+        "month": "май",
+        "day": 1,
+    }
+    assert await restarted.get_state(chat=1, user=3, default="x") == "x"
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_drops_idle_states(storage, engine):
+    await storage.set_state(chat=1, user=1, state="AddBirthday:month")
+    storage._entries[("1", "1")].updated = time.time() - storage.ttl - 1
+    await storage.close()
+    assert stored_states(engine) == {}
+    assert len(storage) == 0
+
+    await storage.set_state(chat=1, user=2, state="AddBirthday:day")
+    storage._entries[("1", "2")].updated = time.time() - storage.ttl - 1
+    assert await storage.get_state(chat=1, user=2) is None
+
+
+@pytest.mark.asyncio
+async def test_sqlite_storage_keeps_memory_bounded(storage, engine):
+    storage.max_entries = 10
+    for user in range(30):
+        await storage.set_state(chat=1, user=user, state="AddBirthday:day")
+    # Unwritten states are never evicted.
+    assert len(storage) == 30
+
+    storage.flush()
+    assert len(storage) == 10
+    assert len(stored_states(engine)) == 30
+    assert await storage.get_state(chat=1, user=0) == "AddBirthday:day"
+    assert len(storage) == 10
@@ -0,0 +1,68 @@
+import datetime as dt
+
+import pandas as pd
+
+from app.toolbox.birthdays.importer import ImportReport, parse_import_file
+
+rows = {
+    "Дата": [1, 40, 3, "x", 5, 5],
+    "месяц": ["май", "май", "мартобрь", "май", "июнь", "июнь"],
+    "ФИО": [
+        "Иванов Иван",
+        "Петров Пётр",
+        "Сидоров Олег",
+        "Орлов Олег",
+        "Ким Анна",
+        "ким  анна",
+    ],
+}
+
+
+def test_parse_import_file_reports_every_row(tmp_path):
+    filename = (tmp_path / "import.csv").as_posix()
+    pd.DataFrame(rows).to_csv(filename, index=False)
+
+    report = parse_import_file(filename)
+
+    assert {number: m["name"] for number, m in report.accepted.items()} == {
+        2: "Иванов Иван",
+        6: "Ким Анна",
+    }
+    assert report.rejected == {
+        3: "недопустимое значение в колонке `Дата`",
+        4: "недопустимое значение в колонке `месяц`",
+        5: "пустая ячейка или не число",
+        7: "повтор в колонке `ФИО`",
+    }
+
+
+def test_parse_import_file_reads_xlsx(tmp_path):
+    filename = (tmp_path / "import.xlsx").as_posix()
+    pd.DataFrame(rows).iloc[:1].to_excel(filename, index=False)
+
+    report = parse_import_file(filename)
+
+    assert list(report.accepted) == [2]
+    assert report.rows() == [
+        [1, "май", "", "Иванов Иван"],
+    ]
+
+
+def test_import_report_message_lists_rejected_rows():
+    report = ImportReport(
+        accepted={2: {"name": "Иванов Иван", "date": dt.date(2023, 5, 1)}},
+        written=True,
+    )
+    report.reject_names(["иванов иван"], "партнер уже есть в базе")
+    report.reject(3, "повтор в колонке `ФИО`")
+
+    assert report.to_message() == (
+        "Ни одна строка не добавлена.\n"
+        "❌ Отклонено строк: 2\n"
+        "строка 2: партнер уже есть в базе\n"
+        "строка 3: повтор в колонке `ФИО`"
+    )
+
+
+def test_import_report_message_for_unreadable_file():
+    assert ImportReport().to_message().startswith("❗Не удалось прочитать")
@@ -0,0 +1,109 @@
+import datetime as dt
+
+import pytest
+
+from app.db.index import DateRecord, DayIndex, NameIndex
+from app.db.managers import DateQueryManager
+from app.db.models import Birthday
+
+from .fixtures.db import create_tables, db_session, engine
+
+birthdays = [
+    {"name": "new_year", "date": dt.date(2023, 1, 1)},
+    {"name": "march", "date": dt.date(2023, 3, 8)},
+    {"name": "may_b", "date": dt.date(2023, 5, 20)},
+    {"name": "may_a", "date": dt.date(2023, 5, 20)},
+    {"name": "december", "date": dt.date(2023, 12, 31)},
+]
+windows = [
+    (dt.date(2023, 5, 20), dt.date(2023, 5, 20)),
+    (dt.date(2023, 3, 1), dt.date(2023, 6, 1)),
+    (dt.date(2023, 12, 30), dt.date(2024, 1, 2)),
+    (dt.date(2023, 5, 21), dt.date(2024, 5, 20)),
+    (dt.date(2023, 1, 1), dt.date(2023, 12, 31)),
+    (dt.date(2023, 6, 1), dt.date(2023, 5, 1)),
+]
+
+
+def test_day_index_between_handles_new_year_and_sorts_by_name():
+    index = DayIndex()
+    index.build(
+        [
+            DateRecord("december", 12, 31),
+            DateRecord("new_year", 1, 1),
+            DateRecord("b", 5, 20),
+            DateRecord("a", 5, 20),
+        ],
+        generation=0,
+    )
+
+    assert index.between(dt.date(2023, 5, 20), dt.date(2023, 5, 20)) == [
+        DateRecord("a", 5, 20),
+        DateRecord("b", 5, 20),
+    ]
+    records = index.between(dt.date(2023, 12, 1), dt.date(2024, 1, 1))
+    assert [record.name for record in records] == ["december", "new_year"]
+
+
+@pytest.mark.parametrize("start, end", windows)
+def test_date_query_manager_index_matches_sql_fallback(db_session, start, end):
+    Birthday.operations.refresh_table(birthdays, db_session)
+    indexed = DateQueryManager(Birthday, index=DayIndex())
+
+    assert indexed.between_records(
+        db_session, start, end
+    ) == Birthday.queries.between_records(db_session, start, end)
+
+
+def test_date_query_manager_rebuilds_index_after_table_refresh(db_session):
+    index = DayIndex()
+    queries = DateQueryManager(Birthday, index=index)
+    Birthday.operations.refresh_table(birthdays, db_session)
+    queries.today_records(db_session, dt.date(2023, 3, 8))
+    generation = index.generation
+
+    Birthday.operations.refresh_table(birthdays[:1], db_session)
+    records = queries.today_records(db_session, dt.date(2023, 1, 1))
+
+    assert records == [DateRecord("new_year", 1, 1)]
+    assert index.generation > generation
+    assert len(index) == 1
+
+
+partners = [
+    DateRecord("Сидоров Артём", 6, 1),
+    DateRecord("Иванов Иван", 5, 20),
+    DateRecord("Иван Ли", 1, 2),
+]
+
+
+@pytest.mark.parametrize(
+    "query, names",
+    [
+        ("иван", ["Иван Ли", "Иванов Иван"]),
+        ("ИВ", ["Иван Ли", "Иванов Иван"]),
+        ("ли", ["Иван Ли"]),
+        ("артем сид", ["Сидоров Артём"]),
+        ("ванов", ["Иванов Иван"]),
+        ("ов", []),
+        ("  ", []),
+    ],
+)
+def test_name_index_search_matches_all_query_words(query, names):
+    index = NameIndex()
+    index.build(partners, generation=0)
+    assert [record.name for record in index.search(query)] == names
+
+
+def test_name_index_caches_results_until_rebuild():
+    index = NameIndex(cache_size=1)
+    index.build(partners, generation=0)
+
+    found = index.search("иван", limit=1)
+    assert found == [DateRecord("Иван Ли", 1, 2)]
+    assert index.search("Иван ", limit=1) is found
+    index.search("ли")
+    assert index.search("иван", limit=1) is not found
+
+    index.build(partners[:2], generation=1)
+    assert index.search("иван", limit=1) == [DateRecord("Иванов Иван", 5, 20)]
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import pytest
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+import main
+from app import settings
+from app.db.lease import LeaderElection
+from app.db.models import LeaderLease
+from app.db.shared import get_session
+from app.scheduler import BotScheduler
+
+from .fixtures.db import create_tables, engine
+
+
+@pytest.fixture
+def election(engine, create_tables):
+    def create(holder: str, **kwargs) -> LeaderElection:
+        return LeaderElection(engine, name="test", holder=holder, **kwargs)
+
+    yield create
+    with get_session(engine) as session:
+        session.query(LeaderLease).delete()
+        session.commit()
+
+
+def test_only_one_instance_holds_the_lease(election):
+    first, second = election("first"), election("second")
+
+    assert first.acquire() == True
+    assert second.acquire() == False
+    # Holder renews its lease.
+    assert first.acquire() == True
+
+
+def test_expired_lease_is_taken_over(election):
+    first, second = election("first", ttl=0.05), election("second")
+    first.acquire()
+
+    time.sleep(0.06)
+
+    assert second.acquire() == True
+    assert first.acquire() == False
+
+
+def test_released_lease_is_taken_over_at_once(election):
+    first, second = election("first"), election("second")
+    first.acquire()
+
+    first.release()
+
+    assert second.acquire() == True
+
+
+@pytest.mark.asyncio
+async def test_leadership_moves_to_another_instance_on_stop(election):
+    changes = []
+
+    def on_change(name: str):
+        async def callback(leading: bool) -> None:
+            changes.append((name, leading))
+
+        return callback
+
+    first = election("first", heartbeat=0.01)
+    second = election("second", heartbeat=0.01)
+    await first.start(on_change("first"))
+    await second.start(on_change("second"))
+    assert first.is_leader == True
+    assert second.is_leader == False
+
+    await first.stop()
+    await asyncio.sleep(0.05)
+
+    assert changes == [("first", True), ("second", True)]
+    assert second.is_leader == True
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_new_leader_keeps_jobs_of_leader_stopped_cleanly(
+    election, engine, monkeypatch
+):
+    def scheduler() -> BotScheduler:
+        scheduler = BotScheduler(
+            jobstores={"default": SQLAlchemyJobStore(engine=engine)},
+            executors={"default": AsyncIOExecutor()},
+            timezone=settings.TIME_ZONE,
+        )
+        scheduler.start(paused=True)
+        return scheduler
+
+    async def on_change(leading: bool) -> None:
+        pass
+
+    first, second = election("first"), election("second")
+    old_scheduler = scheduler()
+    await first.start(on_change)
+    old_scheduler.add_chat_to_birthday_mailing(42)
+    monkeypatch.setattr(main, "Scheduler", old_scheduler)
+    monkeypatch.setattr(main, "Leader", first)
+
+    await main.on_shutdown(main.dp)
+
+    new_scheduler = scheduler()
+    assert second.acquire() == True
+    assert [job.id for job in new_scheduler.get_jobs()] == ["42"]
+    new_scheduler.remove_all_jobs()
+    new_scheduler.shutdown()
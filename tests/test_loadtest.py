@@ -0,0 +1,77 @@
+import pytest
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.utils.exceptions import RetryAfter
+
+from app.toolbox.yandex_disk import YandexDisk
+
+from .common import constants
+from .fixtures.files import temp_file
+from .fixtures.servers import (
+    FAKE_YADISK_TOKEN,
+    fake_bot_api,
+    fake_yadisk,
+    make_workbook,
+)
+from .loadtest import LoadTestConfig, run
+
+
+@pytest.mark.asyncio
+async def test_fake_yadisk_checks_token(fake_yadisk):
+    disk = YandexDisk(token=FAKE_YADISK_TOKEN, api_url=fake_yadisk.url)
+    assert await disk.check_token() == True
+    await disk.close()
+
+    disk = YandexDisk(token="invalid", api_url=fake_yadisk.url)
+    assert await disk.check_token() == False
+    await disk.close()
+
+
+@pytest.mark.asyncio
+async def test_fake_yadisk_serves_download_and_upload(fake_yadisk, temp_file):
+    fake_yadisk.put_workbook("/birthdays.xlsx", 10)
+    local_filepath = constants["TEMP_FILE"].as_posix()
+
+    disk = YandexDisk(token=FAKE_YADISK_TOKEN, api_url=fake_yadisk.url)
+    assert await disk.download_file("/birthdays.xlsx", local_filepath)
+    assert await disk.upload_file(local_filepath, "/copy.xlsx")
+
+    assert fake_yadisk.get_file("/copy.xlsx") == make_workbook(10)
+    assert fake_yadisk.count_rows("/copy.xlsx") == 10
+
+
+@pytest.mark.asyncio
+async def test_fake_yadisk_download_of_missing_file_fails(
+    fake_yadisk, temp_file
+):
+    disk = YandexDisk(token=FAKE_YADISK_TOKEN, api_url=fake_yadisk.url)
+    downloaded = await disk.download_file(
+        "/missing.xlsx", constants["TEMP_FILE"].as_posix()
+    )
+    assert downloaded == False
+
+
+@pytest.mark.asyncio
+async def test_fake_bot_api_returns_retry_after_when_flooded(fake_bot_api):
+    fake_bot_api.rate_limit = 2
+    bot = Bot("123:mock", server=TelegramAPIServer.from_base(fake_bot_api.url))
+
+    await bot.send_message(1, "first")
+    await bot.send_message(2, "second")
+    with pytest.raises(RetryAfter):
+        await bot.send_message(3, "third")
+    await (await bot.get_session()).close()
+
+    assert [m["text"] for m in fake_bot_api.messages] == ["first", "second"]
+    assert fake_bot_api.throttled == 1
+
+
+@pytest.mark.asyncio
+async def test_loadtest_runs_all_scenarios():
+    config = LoadTestConfig(rows=50, loads=1, chats=3, users=2)
+    results = await run(config)
+
+    assert len(results["load"].durations) == config.loads
+    assert len(results["mailing"].durations) == config.chats
+    assert results["load"].errors == results["mailing"].errors == []
+    assert results["api"].messages
@@ -8,7 +8,10 @@ from app.toolbox.birthdays.messageformat import (
     convert_month,
     decline_month,
     format_birthday_sequence,
+    future_header,
     get_formatted_messages,
+    plural_days,
+    record_to_message,
 )
 
 from .common import constants
@@ -120,3 +123,30 @@ def test_get_formatted_messages_return_None_for_empty_birthdays(
     fmt_string = get_formatted_messages(birthdays)
 
     assert fmt_string is None
+
+
+def test_record_to_message_matches_birthday_to_message(
+    db_session, create_birthday_range
+):
+    birthdays = Birthday.queries.today(db_session)
+    records = Birthday.queries.today_records(db_session)
+
+    assert [record.name for record in records] == [
+        birthday.name for birthday in birthdays
+    ]
+    assert format_birthday_sequence(
+        records, formatter=record_to_message
+    ) == format_birthday_sequence(birthdays)
+
+
+@pytest.mark.parametrize(
+    "days, word",
+    [(1, "день"), (2, "дня"), (5, "дней"), (11, "дней"), (21, "день")],
+)
+def test_plural_days_returns_correct_word_form(days, word):
+    assert plural_days(days) == word
+
+
+def test_future_header_depends_on_number_of_days():
+    assert future_header(3) == "#деньрождения завтра и следующие два дня:\n"
+    assert future_header(7) == "#деньрождения в ближайшие 7 дней:\n"
@@ -127,3 +127,290 @@ async def test_load_store_warnign_message_with_empty_db(
     )
     await msgloader.load()
     assert "warning" in msgloader.message_store
+
+
+@pytest.mark.asyncio
+async def test_add_inserts_birthdays_and_patches_messages_without_timestamp(
+    db_session, engine
+):
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await msgloader._load_formatted_messages()
+    ts = msgloader.message_store["ts"]
+
+    await msgloader.add([{"name": "partner_001", "date": today()}])
+
+    assert Birthday.queries.count(db_session) == 1
+    assert "partner_001" in msgloader.message_store["today"]
+    assert msgloader.message_store["ts"] == ts
+
+
+@pytest.mark.asyncio
+async def test_add_leaves_messages_alone_if_birthday_is_out_of_scope(
+    db_session, engine
+):
+    from datetime import timedelta
+
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await msgloader._load_formatted_messages()
+    messages = msgloader.message_store.messages
+
+    date = today() + timedelta(days=settings.FUTURE_SCOPE + 2)
+    await msgloader.add([{"name": "partner_001", "date": date}])
+
+    assert Birthday.queries.count(db_session) == 1
+    assert msgloader.message_store.messages == messages
+
+
+@pytest.mark.asyncio
+async def test_add_recomputes_messages_for_window_crossing_new_year(
+    db_session, engine, monkeypatch
+):
+    from datetime import date
+
+    from app.utils import Clock
+
+    monkeypatch.setattr(Clock, "today", lambda: date(2023, 12, 30))
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await msgloader._load_formatted_messages()
+
+    await msgloader.add([{"name": "partner_001", "date": date(2023, 1, 2)}])
+
+    assert "partner_001" in msgloader.message_store["future"]
+
+
+@pytest.mark.asyncio
+async def test_restore_brings_back_saved_messages_with_timestamp(
+    db_session, engine
+):
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await msgloader._load_formatted_messages()
+    msgloader.fingerprint = "fingerprint"
+    msgloader.save()
+
+    restarted = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    assert restarted.restore() == True
+    assert restarted.message_store.messages == msgloader.message_store.messages
+    assert restarted.message_store["ts"] == msgloader.message_store["ts"]
+    assert restarted.fingerprint == "fingerprint"
+    assert restarted.is_fresh(minutes=1) == True
+
+
+@pytest.mark.asyncio
+async def test_load_skips_db_refresh_if_remote_file_is_unchanged(
+    yadisk_returns_true, stored_excel_file, db_session, engine, monkeypatch
+):
+    download_kwargs = {
+        "remote_filepath": "mock/path",
+        "local_filepath": constants["EXCEL_FILE"].as_posix(),
+    }
+    msgloader = BirthdayMessageLoader(
+        {"token": "mock"}, download_kwargs, get_bot(), engine
+    )
+    await msgloader.load()
+    assert msgloader.fingerprint is not None
+
+    refreshes = []
+    monkeypatch.setattr(
+        Birthday.operations, "refresh_table", lambda *args: refreshes.append(1)
+    )
+    await msgloader.load()
+
+    assert refreshes == []
+    assert msgloader.model_mappings == []
+    assert "today" in msgloader.message_store
+
+
+@pytest.mark.asyncio
+async def test_messages_for_custom_window_are_computed_once(
+    db_session, engine, monkeypatch
+):
+    from datetime import timedelta
+
+    from app.toolbox.birthdays.upcoming import UpcomingBirthdays
+
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    Birthday.operations.refresh_table(
+        [{"name": "partner_in_week", "date": today() + timedelta(days=6)}],
+        db_session,
+    )
+
+    assert "partner_in_week" not in "".join(msgloader.messages())
+    messages = msgloader.messages(7)
+    assert "#деньрождения в ближайшие 7 дней" in messages[0]
+    assert "partner_in_week" in messages[0]
+
+    monkeypatch.setattr(UpcomingBirthdays, "fetch", None)
+    assert msgloader.messages(7) == messages
+
+
+@pytest.mark.asyncio
+async def test_search_rebuilds_name_index_after_table_refresh(
+    db_session, engine
+):
+    from datetime import date
+
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    Birthday.operations.refresh_table(
+        [{"name": "Петров Пётр", "date": date(2023, 5, 20)}], db_session
+    )
+    assert [record.name for record in msgloader.search("петр")] == [
+        "Петров Пётр"
+    ]
+
+    Birthday.operations.refresh_table(
+        [{"name": "Сидоров Олег", "date": date(2023, 6, 1)}], db_session
+    )
+    assert msgloader.search("петр") == []
+    assert [record.day for record in msgloader.search("олег")] == [1]
+
+
+@pytest.mark.asyncio
+async def test_range_pages_are_rendered_once_until_data_update(
+    db_session, engine, monkeypatch
+):
+    from datetime import date
+
+    from app.db.shared import get_session
+
+    msgloader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    with get_session(engine) as session:
+        Birthday.operations.refresh_table(
+            [
+                {"name": "new_year", "date": date(2023, 1, 1)},
+                {"name": "may", "date": date(2023, 5, 20)},
+            ],
+            session,
+        )
+    key = msgloader.range_pages(date(1999, 12, 30), date(2000, 1, 2))
+    text, total = msgloader.page(key)
+    assert "new_year" in text and "may" not in text
+    assert "may" in msgloader.page(msgloader.month_pages(5))[0]
+
+    monkeypatch.setattr(msgloader.pages, "add_range", None)
+    assert msgloader.range_pages(date(1999, 12, 30), date(2000, 1, 2)) == key
+
+    with get_session(engine) as session:
+        Birthday.operations.refresh_table(
+            [{"name": "may", "date": date(2023, 5, 20)}], session
+        )
+    assert msgloader.page(msgloader.month_pages(1))[0].endswith(
+        "Дней рождения нет."
+    )
+
+
+@pytest.mark.asyncio
+async def test_sync_picks_up_messages_saved_by_another_instance(
+    db_session, engine
+):
+    from datetime import date
+
+    from app.db.shared import get_session
+
+    leader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    follower = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    with get_session(engine) as session:
+        Birthday.operations.refresh_table(
+            [{"name": "Иванов Иван", "date": date(2023, 5, 20)}], session
+        )
+    await leader._load_formatted_messages()
+    leader.save()
+
+    assert follower.sync() == True
+    assert follower.message_store.messages == leader.message_store.messages
+    assert [record.name for record in follower.search("иван")] == [
+        "Иванов Иван"
+    ]
+    assert follower.sync() == False
+
+    leader.message_store["warning"] = "warning"
+    leader.message_store["today"] = "today"
+    leader.save()
+    assert follower.sync() == True
+    leader.message_store.pop("warning")
+    leader.message_store["today"] = None
+    leader.save()
+
+    assert follower.sync() == True
+    assert "warning" not in follower.message_store
+    assert follower.message_store.get("today") is None
+    assert follower.message_store.messages == leader.message_store.messages
+
+
+@pytest.mark.asyncio
+async def test_search_picks_up_birthdays_added_by_another_worker(
+    db_session, engine, monkeypatch
+):
+    from datetime import date
+
+    from app.db.cache import QueryCache
+
+    adder = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    reader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await adder._load_formatted_messages()
+    adder.save()
+    assert reader.search("иван") == []
+    generation = QueryCache.generation(Birthday.__tablename__)
+
+    await adder.add([{"name": "Иванов Иван", "date": date(2023, 5, 20)}])
+    # Table generations are per process, another worker doesn't see them.
+    monkeypatch.setitem(
+        QueryCache._generations, Birthday.__tablename__, generation
+    )
+
+    assert [record.name for record in reader.search("иван")] == [
+        "Иванов Иван"
+    ]
+    assert reader.version == adder.version
+    assert "Иванов Иван" in reader.page(reader.month_pages(5))[0]
+
+
+@pytest.mark.asyncio
+async def test_default_messages_pick_up_birthdays_added_by_another_worker(
+    db_session, engine
+):
+    adder = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    reader = BirthdayMessageLoader({"token": "mock"}, {}, get_bot(), engine)
+    await adder._load_formatted_messages()
+    adder.save()
+    assert "partner_001" not in "".join(reader.messages())
+
+    await adder.add([{"name": "partner_001", "date": today()}])
+
+    assert "partner_001" in "".join(reader.messages())
+
+
+@pytest.mark.asyncio
+async def test_load_traces_stages_and_reports_slow_load(
+    yadisk_returns_true, stored_excel_file, db_session, engine, monkeypatch
+):
+    download_kwargs = {
+        "remote_filepath": "mock/path",
+        "local_filepath": constants["EXCEL_FILE"].as_posix(),
+    }
+    msgloader = BirthdayMessageLoader(
+        {"token": "mock"}, download_kwargs, get_bot(), engine
+    )
+    reports = []
+
+    async def report_slow_load(trace):
+        reports.append(trace)
+
+    monkeypatch.setattr(msgloader, "_report_slow_load", report_slow_load)
+    monkeypatch.setattr(settings, "SLOW_LOAD_THRESHOLD", 0)
+    await msgloader.load()
+
+    trace = msgloader.traces.last()
+    stages = {span.name: span for span in trace.spans}
+    assert list(stages)[:4] == [
+        "check_token",
+        "download",
+        "fingerprint",
+        "read_excel",
+    ]
+    assert stages["download"].counters["bytes"] > 0
+    assert (
+        stages["to_model_mappings"].counters["rows_out"]
+        == stages["refresh_table"].counters["rows_in"]
+    )
+    assert "save_snapshot" in stages
+    assert reports == [trace]
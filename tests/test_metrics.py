@@ -0,0 +1,82 @@
+import pytest
+
+from app.metrics import Counter, Gauge, Histogram, Registry, timed
+
+
+def test_counter_increments_values_per_label_set():
+    counter = Counter("requests_total", "Requests.", ("method",))
+    counter.inc(method="get")
+    counter.inc(2, method="get")
+    counter.inc(method="put")
+
+    assert counter.get(method="get") == 3
+    assert counter.get(method="put") == 1
+    assert counter.get(method="delete") == 0
+
+
+def test_registry_returns_already_registered_metric():
+    registry = Registry()
+    first = registry.counter("requests_total", "Requests.")
+    second = registry.counter("requests_total", "Requests.")
+    assert first is second
+
+
+def test_registry_renders_prometheus_text_format():
+    registry = Registry()
+    registry.counter("plain_total", "Plain counter.").inc()
+    registry.counter("labeled_total", "Labeled.", ("chat",)).inc(chat="group")
+
+    text = registry.render()
+
+    assert "# HELP plain_total Plain counter.\n" in text
+    assert "# TYPE plain_total counter\n" in text
+    assert "plain_total 1\n" in text
+    assert 'labeled_total{chat="group"} 1\n' in text
+
+
+def test_gauge_goes_up_and_down():
+    gauge = Gauge("running", "Running.", ("handler",))
+    gauge.inc(handler="a")
+    gauge.inc(handler="a")
+    gauge.dec(handler="a")
+    gauge.set(5, handler="b")
+
+    assert gauge.get(handler="a") == 1
+    assert gauge.get(handler="b") == 5
+
+
+def test_histogram_counts_values_in_buckets():
+    histogram = Histogram("duration", "Duration.", buckets=(0.1, 1))
+    for value in (0.05, 0.05, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.get() == 4
+    assert histogram.sum() == 3.6
+    # Median falls into the first bucket, 95th percentile beyond the last.
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.95) == 1
+
+    text = histogram.render()
+    assert 'duration_bucket{le="0.1"} 2' in text
+    assert 'duration_bucket{le="1"} 3' in text
+    assert 'duration_bucket{le="+Inf"} 4' in text
+    assert "duration_sum 3.6" in text
+    assert "duration_count 4" in text
+
+
+@pytest.mark.asyncio
+async def test_timed_observes_calls_which_raised():
+    histogram = Histogram("calls_seconds", "Calls.", ("op",))
+
+    @timed(histogram, op="get")
+    async def call(fail: bool) -> int:
+        if fail:
+            raise ValueError
+        return 1
+
+    assert await call(False) == 1
+    with pytest.raises(ValueError):
+        await call(True)
+
+    assert call.__name__ == "call"
+    assert histogram.get(op="get") == 2
@@ -0,0 +1,101 @@
+import time
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher import FSMContext
+
+from app.handlers.manager import format_handler_stats
+from app.middlewares import (
+    HandlerDuration,
+    HandlerErrors,
+    HandlerMetricsMiddleware,
+    HandlersInProgress,
+    handler_stats,
+)
+
+from .fixtures.servers import fake_bot_api
+
+
+def make_update(text: str) -> types.Update:
+    return types.Update.to_object(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": 7, "type": "private"},
+                "from": {"id": 7, "is_bot": False, "first_name": "user"},
+                "text": text,
+            },
+        }
+    )
+
+
+@pytest_asyncio.fixture
+async def dispatcher(fake_bot_api):
+    bot = Bot(
+        token="42:fake",
+        server=TelegramAPIServer.from_base(fake_bot_api.url),
+    )
+    dp = Dispatcher(bot, storage=MemoryStorage())
+    dp.middleware.setup(HandlerMetricsMiddleware())
+
+    async def metrics_echo(message: types.Message, state: FSMContext):
+        await state.set_state("Echo:repeat")
+        await bot.send_message(message.chat.id, message.text)
+
+    async def metrics_fail(message: types.Message):
+        raise ValueError("fail")
+
+    dp.register_message_handler(metrics_fail, text="fail", state="*")
+    dp.register_message_handler(metrics_echo, state="*")
+    yield dp
+    await (await bot.get_session()).close()
+
+
+@pytest.mark.asyncio
+async def test_middleware_records_handler_timing_per_state(dispatcher):
+    await dispatcher.process_update(make_update("hi"))
+    await dispatcher.process_update(make_update("hi"))
+
+    assert HandlerDuration.get(handler="metrics_echo", state="") == 1
+    assert (
+        HandlerDuration.get(handler="metrics_echo", state="Echo:repeat") == 1
+    )
+    assert HandlersInProgress.get(handler="metrics_echo") == 0
+    rows = [row for row in handler_stats() if row["handler"] == "metrics_echo"]
+    assert {row["state"] for row in rows} == {"", "Echo:repeat"}
+
+
+@pytest.mark.asyncio
+async def test_middleware_counts_handler_errors(dispatcher):
+    with pytest.raises(ValueError):
+        await dispatcher.process_update(make_update("fail"))
+
+    assert HandlerErrors.get(handler="metrics_fail", state="") == 1
+    assert HandlerDuration.get(handler="metrics_fail", state="") == 1
+    assert HandlersInProgress.get(handler="metrics_fail") == 0
+
+
+def test_format_handler_stats():
+    stats = [
+        {
+            "handler": "new_birthday_name",
+            "state": "AddBirthday:name",
+            "count": 3,
+            "errors": 1,
+            "running": 0,
+            "total": 0.3,
+            "mean": 0.1,
+            "p95": 0.25,
+        }
+    ]
+
+    assert format_handler_stats(stats).splitlines()[1] == (
+        "new_birthday_name [AddBirthday:name]: вызовов 3, ошибок 1, "
+        "сейчас 0, среднее 100 мс, p95 250 мс"
+    )
+    assert "не вызывались" in format_handler_stats([])
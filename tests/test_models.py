@@ -1,9 +1,11 @@
 import datetime as dt
 
 import pytest
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
 
 from app.db.models import Birthday
+from app.db.shared import QueryDuration
 
 from .common import constants, today
 from .fixtures.db import (
@@ -316,3 +318,115 @@ def test_birthday_sqlite_upsert_method_updates_instance_instead_of_creating(
     current_birthday_num = Birthday.queries.count(db_session)
 
     assert current_birthday_num == initial_birthday_num
+
+
+def test_birthday_upsert_mappings_inserts_new_and_updates_existing(
+    db_session,
+):
+    Birthday.operations.upsert_mappings(
+        [{"name": "valid_name", "date": today()}], db_session
+    )
+    tomorrow = today() + dt.timedelta(days=1)
+    num_upserted = Birthday.operations.upsert_mappings(
+        [
+            {"name": "valid_name", "date": tomorrow},
+            {"name": "new_name", "date": today()},
+        ],
+        db_session,
+    )
+
+    assert num_upserted == 2
+    assert Birthday.queries.count(db_session) == 2
+    assert Birthday.queries.get(db_session, name="valid_name").date == tomorrow
+
+
+def test_birthday_upsert_mappings_returns_zero_with_empty_mappings(
+    db_session,
+):
+    assert Birthday.operations.upsert_mappings([], db_session) == 0
+
+
+def test_cached_date_query_manager_serves_rows_until_table_refresh(
+    db_session,
+):
+    from app.db.cache import QueryCache
+    from app.db.managers import DateQueryManager
+
+    cache = QueryCache()
+    queries = DateQueryManager(Birthday, cache=cache)
+    Birthday.operations.refresh_table(
+        [{"name": "partner1", "date": today()}], db_session
+    )
+
+    assert [row.name for row in queries.today(db_session)] == ["partner1"]
+    assert [row.name for row in queries.today(db_session)] == ["partner1"]
+    assert cache.info()["hits"] == 1
+
+    Birthday.operations.refresh_table(
+        [{"name": "partner2", "date": today()}], db_session
+    )
+    assert [row.name for row in queries.today(db_session)] == ["partner2"]
+    assert cache.info()["misses"] == 2
+
+
+def test_cached_date_query_manager_returns_rows_instead_of_instances(
+    db_session,
+):
+    from sqlalchemy import Row
+
+    from app.db.cache import QueryCache
+    from app.db.managers import DateQueryManager
+
+    queries = DateQueryManager(Birthday, cache=QueryCache())
+    Birthday.operations.refresh_table(
+        [{"name": "partner1", "date": today()}], db_session
+    )
+
+    for rows in (queries.today(db_session), queries.future_all(db_session)):
+        assert all(isinstance(row, Row) for row in rows)
+    (row,) = queries.between(db_session, today(), today())
+    assert not isinstance(row, Birthday)
+    assert row._asdict() == {
+        "id": row.id,
+        "name": "partner1",
+        "date": today(),
+        "normalized_name": "partner1",
+    }
+
+
+def test_queries_are_timed_by_statement_kind(db_session):
+    selects = QueryDuration.get(statement="select")
+
+    db_session.scalars(select(Birthday)).all()
+
+    assert QueryDuration.get(statement="select") == selects + 1
+
+
+def test_failed_queries_leave_no_timer_behind(db_session):
+    connection = db_session.connection()
+    with pytest.raises(OperationalError):
+        connection.execute(text("SELECT * FROM missing_table"))
+    db_session.rollback()
+    selects = QueryDuration.get(statement="select")
+
+    connection = db_session.connection()
+    connection.execute(text("SELECT 1"))
+
+    assert QueryDuration.get(statement="select") == selects + 1
+    assert "query_start" not in connection.info
+
+
+def test_birthday_normalized_name_follows_name_updates(db_session):
+    birthday = Birthday(name="Артём Иванов", date=dt.date(1990, 1, 1))
+    db_session.add(birthday)
+    db_session.commit()
+
+    birthday.date = dt.date(1991, 2, 2)
+    db_session.commit()
+    assert birthday.normalized_name == "артем иванов"
+
+    birthday.name = "Пётр Петров"
+    db_session.commit()
+    db_session.refresh(birthday)
+    assert birthday.date == dt.date(1991, 2, 2)
+    assert birthday.normalized_name == "петр петров"
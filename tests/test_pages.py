@@ -0,0 +1,66 @@
+import datetime as dt
+
+from app.db.index import DateRecord
+from app.toolbox.birthdays.pages import BirthdayPages, month_key, render_pages
+
+records = [
+    DateRecord("Иванов Иван", 5, 1),
+    DateRecord("Петров Пётр", 5, 20),
+    DateRecord("Сидоров Олег", 6, 1),
+]
+
+
+def test_render_pages_splits_lines_and_numbers_pages():
+    pages = render_pages("Май:", records[:2], page_size=1)
+    assert pages == [
+        "Май:\n1 мая, Иванов Иван\n\nСтраница 1 из 2",
+        "Май:\n20 мая, Петров Пётр\n\nСтраница 2 из 2",
+    ]
+
+
+def test_render_pages_returns_one_page_if_there_are_no_birthdays():
+    assert render_pages("Май:", []) == ["Май:\nДней рождения нет."]
+
+
+def test_birthday_pages_build_renders_every_month():
+    pages = BirthdayPages()
+    pages.build(records, generation=0)
+
+    text, total = pages.get(month_key(5))
+    assert total == 1
+    assert text.startswith("🗓 Дни рождения, май:")
+    assert "Петров Пётр" in text and "Сидоров Олег" not in text
+    assert pages.get(month_key(1)) == (
+        "🗓 Дни рождения, январь:\nДней рождения нет.",
+        1,
+    )
+    assert pages.get(month_key(5), 1) is None
+
+
+def test_birthday_pages_ranges_are_dropped_on_build():
+    pages = BirthdayPages()
+    pages.build(records, generation=0)
+    key = pages.add_range(dt.date(2000, 5, 2), dt.date(2000, 6, 1), records[1:])
+
+    text, _ = pages.get(key)
+    assert text.startswith("🗓 Дни рождения с 2 мая по 1 июня:")
+
+    pages.build(records, generation=1)
+    assert key not in pages
+
+
+def test_birthday_pages_keep_recently_used_ranges_only():
+    pages = BirthdayPages(max_ranges=2)
+    pages.build(records, generation=0)
+    first, second, third = (
+        pages.add_range(dt.date(2000, 5, 1), dt.date(2000, 5, day), records)
+        for day in (10, 20, 30)
+    )
+    assert first not in pages
+
+    pages.get(second)
+    pages.add_range(dt.date(2000, 6, 1), dt.date(2000, 6, 2), records)
+
+    assert second in pages and third not in pages
+    # Month pages are never dropped.
+    assert all(month_key(month) in pages for month in range(1, 13))
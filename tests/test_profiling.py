@@ -0,0 +1,185 @@
+import asyncio
+import marshal
+import sys
+import time
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+
+from app.handlers.manager import parse_profile_args
+from app.middlewares import ProfilingMiddleware
+from app.profiling import (
+    Profiler,
+    Profiling,
+    fold_stack,
+    is_idle,
+    send_report,
+)
+
+from .fixtures.servers import fake_bot_api
+
+
+def busy(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest_asyncio.fixture
+async def bot(fake_bot_api):
+    bot = Bot(
+        token="42:fake",
+        server=TelegramAPIServer.from_base(fake_bot_api.url),
+    )
+    yield bot
+    await (await bot.get_session()).close()
+
+
+@pytest.mark.asyncio
+async def test_cpu_profile_reports_pstats_of_sections(bot):
+    profiler = Profiler()
+    profiler.start("cpu", 60, bot)
+
+    with profiler.section():
+        busy(0.01)
+    busy(0.01)
+    report = profiler.stop()
+
+    stats = marshal.loads(report.data)
+    assert report.filename.endswith(".prof")
+    assert any(func[2] == "busy" for func in stats)
+    assert not profiler.active
+
+
+@pytest.mark.asyncio
+async def test_sample_profile_reports_folded_stacks_of_sections(bot):
+    profiler = Profiler()
+    profiler.start("sample", 60, bot)
+
+    with profiler.section():
+        busy(0.1)
+    report = profiler.stop()
+
+    assert report.filename.endswith(".folded")
+    assert "busy (test_profiling.py" in report.data.decode()
+    assert "%" in report.summary
+
+
+@pytest.mark.asyncio
+async def test_memory_profile_reports_ingest_allocations(bot):
+    profiler = Profiler()
+    profiler.start("memory", 60, bot)
+
+    with profiler.ingest("excel"):
+        rows = [str(i) * 10 for i in range(10_000)]
+    report = profiler.stop()
+
+    assert rows
+    assert report.summary.startswith("excel: пик")
+    assert "test_profiling.py" in report.data.decode()
+
+
+@pytest.mark.asyncio
+async def test_profiler_runs_one_window_at_a_time(bot):
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        profiler.start("gpu", 60, bot)
+
+    profiler.start("cpu", 60, bot)
+    with pytest.raises(RuntimeError):
+        profiler.start("sample", 60, bot)
+    profiler.stop()
+
+    assert profiler.stop() is None
+
+
+@pytest.mark.asyncio
+async def test_profiler_sends_report_once_window_is_over(bot, fake_bot_api):
+    profiler = Profiler()
+    profiler.start("cpu", 0.05, bot)
+
+    with profiler.section():
+        busy(0.01)
+    await asyncio.sleep(0.2)
+
+    assert not profiler.active
+    assert [m["method"] for m in fake_bot_api.messages] == ["senddocument"]
+
+
+@pytest.mark.asyncio
+async def test_send_report_without_data_sends_message(bot, fake_bot_api):
+    profiler = Profiler()
+    profiler.start("sample", 60, bot)
+
+    await send_report(bot, profiler.stop())
+
+    assert fake_bot_api.messages[0]["method"] == "sendmessage"
+    assert "ничего не выполнялось" in fake_bot_api.messages[0]["text"]
+
+
+@pytest.mark.asyncio
+async def test_middleware_profiles_handlers(bot):
+    dp = Dispatcher(bot, storage=MemoryStorage())
+    dp.middleware.setup(ProfilingMiddleware())
+
+    async def profiled_handler(message: types.Message):
+        busy(0.01)
+
+    dp.register_message_handler(profiled_handler)
+    update = types.Update.to_object(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": 7, "type": "private"},
+                "from": {"id": 7, "is_bot": False, "first_name": "user"},
+                "text": "hi",
+            },
+        }
+    )
+    Profiling.start("cpu", 60, bot)
+    try:
+        await dp.process_update(update)
+    finally:
+        report = Profiling.stop()
+
+    stats = marshal.loads(report.data)
+    assert any(func[2] == "profiled_handler" for func in stats)
+
+
+def test_fold_stack_lists_callers_first():
+    def inner():
+        return fold_stack(sys._getframe())
+
+    stack = inner().split(";")
+    assert stack[-1].startswith("inner (test_profiling.py")
+    assert stack[-2].startswith("test_fold_stack_lists_callers_first")
+
+
+def test_parse_profile_args():
+    assert parse_profile_args("cpu") == ("cpu", 60)
+    assert parse_profile_args("memory 30") == ("memory", 30)
+    assert parse_profile_args("sample 0") is None
+    assert parse_profile_args("sample 10000") is None
+    assert parse_profile_args("cpu soon") is None
+    assert parse_profile_args("") is None
+
+
+@pytest.mark.asyncio
+async def test_sample_profile_leaves_idle_event_loop_out(bot):
+    profiler = Profiler()
+    profiler.start("sample", 60, bot)
+
+    with profiler.section():
+        await asyncio.sleep(0.1)
+    report = profiler.stop()
+
+    assert "selectors.py" not in report.summary
+    assert all(
+        not is_idle(line.rsplit(" ", 1)[0].rsplit(";", 1)[-1])
+        for line in report.data.decode().splitlines()
+    )
@@ -1,10 +1,13 @@
+import datetime as dt
+
 import pytest
+from apscheduler.events import EVENT_JOB_SUBMITTED, JobSubmissionEvent
 from apscheduler.executors.asyncio import AsyncIOExecutor
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from sqlalchemy import create_engine
 
 from app import settings
-from app.scheduler import BotScheduler
+from app.scheduler import BotScheduler, JobLag, observe_job_lag
 
 engine_ = create_engine("sqlite://", echo=True)
 job_store = SQLAlchemyJobStore(engine=engine_)
@@ -48,3 +51,38 @@ def test_scheduler_add_chat_to_birthday_mailing_replaces_existing_job(
     jobs = job_store.get_all_jobs()
 
     assert len(jobs) == 1
+
+
+def test_scheduler_without_jobs_checks_jobstore_periodically(scheduler):
+    scheduler.start()
+
+    scheduler._start_timer(None)
+
+    assert scheduler._timeout is not None
+
+
+def test_scheduler_runs_due_jobs_only_while_leading(scheduler, monkeypatch):
+    from app.db.lease import Leader
+
+    scheduler.start()
+    job_store.jobs_t.create(engine_, True)
+    scheduler.add_chat_to_birthday_mailing(23).modify(next_run_time=dt.datetime.now(settings.TIME_ZONE))
+    monkeypatch.setattr(Leader, "expires", 0)
+
+    scheduler._process_jobs()
+
+    # Due job is left for the leader instead of being run and rescheduled.
+    due = scheduler.get_job("23").next_run_time
+    assert due <= dt.datetime.now(settings.TIME_ZONE)
+
+
+def test_observe_job_lag_records_delay_after_scheduled_time():
+    count, total = JobLag.get(), JobLag.sum()
+    scheduled = dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=5)
+
+    observe_job_lag(
+        JobSubmissionEvent(EVENT_JOB_SUBMITTED, "job", "default", [scheduled])
+    )
+
+    assert JobLag.get() == count + 1
+    assert 5 <= JobLag.sum() - total < 6
@@ -0,0 +1,98 @@
+import datetime as dt
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from app.db.models import Birthday, upgrade_birthday_table
+from app.db.search import match_expression
+from app.utils import normalize_name
+
+from .common import today
+from .fixtures.db import create_tables, db_session, engine
+
+partners = [
+    {"name": "Иванов  Иван Петрович", "date": dt.date(2023, 5, 20)},
+    {"name": "Артём Сидоров", "date": dt.date(2023, 6, 1)},
+    {"name": "Пётр Ёлкин", "date": dt.date(2023, 7, 1)},
+]
+
+
+def test_normalize_name_ignores_case_spaces_and_yo():
+    assert normalize_name(" Артём  ИВАНОВ ") == "артем иванов"
+
+
+def test_match_expression_skips_too_short_words():
+    assert match_expression("Ли Иванов") == '"иванов"'
+    assert match_expression("Ли") is None
+    assert match_expression("Иван Ли Иванов", "OR") == '"иван" OR "иванов"'
+
+
+def test_birthday_normalized_name_is_filled_on_insert(db_session):
+    Birthday.operations.refresh_table(partners, db_session)
+    Birthday.operations.upsert_mappings(
+        [{"name": "ИВАНОВ Иван", "date": today()}], db_session
+    )
+
+    birthday = Birthday.queries.get(db_session, name="Пётр Ёлкин")
+    assert birthday.normalized_name == "петр елкин"
+    assert Birthday.queries.get(db_session, normalized_name="иванов иван")
+
+
+@pytest.mark.parametrize(
+    "query, names",
+    [
+        ("иван иванов", ["Иванов  Иван Петрович"]),
+        ("Артем", ["Артём Сидоров"]),
+        ("ёлк", ["Пётр Ёлкин"]),
+        ("ел", ["Пётр Ёлкин"]),
+        ("сидоров иван", []),
+        # Short words are applied along with full text match.
+        ("Иван Ли", []),
+        ("Иван Пе", ["Иванов  Иван Петрович"]),
+        ("", []),
+    ],
+)
+def test_birthday_search_finds_names_containing_all_words(
+    db_session, query, names
+):
+    Birthday.operations.refresh_table(partners, db_session)
+
+    found = Birthday.queries.search(db_session, query)
+    assert [birthday.name for birthday in found] == names
+
+
+@pytest.mark.parametrize(
+    "name, names",
+    [
+        # Existing name has patronymic, the new one has not.
+        ("Иван Иванов", ["Иванов  Иван Петрович"]),
+        # New name has patronymic, the existing one has not.
+        ("Сидоров Артем Ильич", ["Артём Сидоров"]),
+        ("Елкин Петр Минобрнауки", ["Пётр Ёлкин"]),
+        ("Сидоров Петр", []),
+        # Names of short words only are found by exact match.
+        ("Ли Ан Петрович", ["Ли Ан"]),
+    ],
+)
+def test_birthday_similar_matches_names_in_both_directions(
+    db_session, name, names
+):
+    Birthday.operations.refresh_table(
+        [*partners, {"name": "Ли Ан", "date": dt.date(2023, 8, 1)}],
+        db_session,
+    )
+
+    found = Birthday.queries.similar(db_session, name)
+    assert [birthday.name for birthday in found] == names
+
+
+def test_upgrade_birthday_table_drops_table_without_normalized_name():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(
+            text("CREATE TABLE birthday (id INTEGER PRIMARY KEY, name, date)")
+        )
+
+    assert upgrade_birthday_table(engine) == True
+    assert not inspect(engine).has_table("birthday")
+    assert upgrade_birthday_table(engine) == False
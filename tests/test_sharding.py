@@ -0,0 +1,213 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, types
+from aiohttp import web
+from aiohttp.test_utils import TestServer, unused_port
+
+from app.sharding import (
+    ForwardDropped,
+    HashRing,
+    RoutingDispatcher,
+    ShardRouter,
+    chat_of,
+)
+
+
+def make_update(update_id: int, chat_id: int) -> types.Update:
+    return types.Update.to_object(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+                "text": "hi",
+            },
+        }
+    )
+
+
+class FakeWorker:
+    """Worker which records received updates,
+    handling of chat 1 is slow."""
+
+    def __init__(self, port: int = None) -> None:
+        self.received: list[tuple[int, int]] = []
+        # Number of next requests answered with 503.
+        self.failures = 0
+        self.server = TestServer(self.app(), port=port)
+
+    def app(self) -> web.Application:
+        async def handle(request: web.Request) -> web.Response:
+            if self.failures:
+                self.failures -= 1
+                raise web.HTTPServiceUnavailable()
+            update = types.Update.to_object(await request.json())
+            if update.message.chat.id == 1:
+                await asyncio.sleep(0.05)
+            self.received.append((update.message.chat.id, update.update_id))
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_post("/update", handle)
+        return app
+
+
+@pytest_asyncio.fixture
+async def workers():
+    workers = [FakeWorker(), FakeWorker()]
+    for worker in workers:
+        await worker.server.start_server()
+    yield workers
+    for worker in workers:
+        await worker.server.close()
+
+
+def test_hash_ring_is_deterministic():
+    assert [HashRing(3).get(i) for i in range(100)] == [
+        HashRing(3).get(i) for i in range(100)
+    ]
+    assert {HashRing(3).get(i) for i in range(100)} == {0, 1, 2}
+
+
+def test_hash_ring_moves_few_keys_when_worker_is_added():
+    before, after = HashRing(4), HashRing(5)
+    keys = range(10_000)
+
+    moved = sum(before.get(key) != after.get(key) for key in keys)
+
+    # About 1/5 of keys move to the new worker.
+    assert moved < len(keys) * 0.3
+    assert all(
+        after.get(key) == 4 for key in keys if before.get(key) != after.get(key)
+    )
+
+
+def test_chat_of_updates_without_chat():
+    user = {"id": 5, "is_bot": False, "first_name": "u"}
+    inline = types.Update.to_object(
+        {
+            "update_id": 1,
+            "inline_query": {"id": "1", "from": user, "query": "", "offset": ""},
+        }
+    )
+    callback = types.Update.to_object(
+        {
+            "update_id": 2,
+            "callback_query": {"id": "1", "from": user, "chat_instance": "1"},
+        }
+    )
+
+    assert chat_of(make_update(1, -100)) == -100
+    assert chat_of(inline) == 5
+    assert chat_of(callback) == 5
+
+
+@pytest.mark.asyncio
+async def test_router_keeps_order_of_chat_updates(workers):
+    router = ShardRouter(
+        [str(worker.server.make_url("/update")) for worker in workers]
+    )
+    updates = [make_update(i, chat_id=1 + i % 3) for i in range(30)]
+
+    for update in updates:
+        router.route(update)
+    await router.close()
+
+    received = [item for worker in workers for item in worker.received]
+    assert sorted(received) == sorted(
+        (update.message.chat.id, update.update_id) for update in updates
+    )
+    for worker in workers:
+        chats = {chat_id for chat_id, _ in worker.received}
+        # Every chat is handled by one worker only.
+        assert {router.ring.get(chat_id) for chat_id in chats} <= {
+            workers.index(worker)
+        }
+        for chat_id in chats:
+            ids = [i for chat, i in worker.received if chat == chat_id]
+            assert ids == sorted(ids)
+
+
+@pytest.mark.asyncio
+async def test_router_does_not_wait_for_slow_chat(workers):
+    router = ShardRouter([str(workers[0].server.make_url("/update"))])
+
+    for i in range(5):
+        router.route(make_update(i, chat_id=1))
+    router.route(make_update(5, chat_id=2))
+    await asyncio.sleep(0.03)
+
+    # Chat 2 is handled while the first update of chat 1 is still running.
+    assert workers[0].received == [(2, 5)]
+    assert len(router) == 5
+    await router.close()
+    assert len(workers[0].received) == 6
+
+
+@pytest.mark.asyncio
+async def test_router_retries_forwards_until_worker_is_up():
+    port = unused_port()
+    router = ShardRouter(
+        [f"http://127.0.0.1:{port}/update"], retry_delay=0.01
+    )
+    for i in range(3):
+        router.route(make_update(i, chat_id=3))
+    await asyncio.sleep(0.02)
+    worker = FakeWorker(port)
+    await worker.server.start_server()
+
+    await router.close()
+    await worker.server.close()
+
+    assert worker.received == [(3, 0), (3, 1), (3, 2)]
+
+
+@pytest.mark.asyncio
+async def test_router_does_not_resend_updates_worker_failed_to_handle(
+    workers,
+):
+    router = ShardRouter(
+        [str(workers[0].server.make_url("/update"))], retry_delay=0.01
+    )
+    workers[0].failures = 2
+
+    for i in range(3):
+        router.route(make_update(i, chat_id=3))
+    await router.close()
+
+    assert workers[0].received == [(3, 2)]
+    assert workers[0].failures == 0
+
+
+@pytest.mark.asyncio
+async def test_router_drops_update_when_worker_stays_down():
+    router = ShardRouter(
+        [f"http://127.0.0.1:{unused_port()}/update"],
+        retries=3,
+        retry_delay=0.01,
+    )
+    dropped = ForwardDropped.get(worker=0)
+
+    router.route(make_update(1, chat_id=3))
+    await router.close()
+
+    assert ForwardDropped.get(worker=0) == dropped + 1
+    assert len(router) == 0
+
+
+@pytest.mark.asyncio
+async def test_routing_dispatcher_routes_updates(workers):
+    router = ShardRouter([str(workers[0].server.make_url("/update"))])
+    bot = Bot(token="42:fake")
+    dp = RoutingDispatcher(bot, router)
+
+    await dp.process_updates([make_update(1, 3), make_update(2, 3)])
+    await router.close()
+    await (await bot.get_session()).close()
+
+    assert workers[0].received == [(3, 1), (3, 2)]
@@ -0,0 +1,55 @@
+import pytest
+
+from app.tracing import CurrentTrace, StageDuration, TraceLog, span
+
+
+def test_span_without_trace_records_nothing():
+    with span("stage", rows_in=1) as stage:
+        stage.count(rows_out=1)
+
+    assert CurrentTrace.get() is None
+    assert StageDuration.get(pipeline="", stage="stage") == 0
+
+
+def test_trace_log_keeps_spans_of_last_runs():
+    log = TraceLog("test_pipeline", size=2)
+    for _ in range(3):
+        with log.trace():
+            with span("read", rows_in=0) as stage:
+                stage.count(rows_out=10)
+            with span("write"):
+                pass
+
+    assert len(log) == 2
+    trace = log.last()
+    assert [s.name for s in trace.spans] == ["read", "write"]
+    assert trace.spans[0].counters == {"rows_in": 0, "rows_out": 10}
+    assert trace.duration >= sum(s.duration for s in trace.spans)
+    assert StageDuration.get(pipeline="test_pipeline", stage="read") == 3
+    assert CurrentTrace.get() is None
+
+
+def test_span_is_recorded_if_stage_fails():
+    log = TraceLog("failing_pipeline")
+
+    with pytest.raises(ValueError):
+        with log.trace():
+            with span("parse"):
+                raise ValueError
+
+    assert [s.name for s in log.last().spans] == ["parse"]
+
+
+def test_trace_summary_lists_slowest_stages_first():
+    log = TraceLog("summary_pipeline")
+    with log.trace() as trace:
+        with span("fast"):
+            pass
+        with span("slow", bytes=1024):
+            pass
+    trace.spans[1].duration = 2.5
+
+    lines = trace.summary().splitlines()
+    assert lines[0].startswith("summary_pipeline ")
+    assert lines[1] == "  slow 2.5 с (bytes=1024)"
+    assert lines[2].startswith("  fast ")
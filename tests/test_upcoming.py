@@ -0,0 +1,31 @@
+import datetime as dt
+
+from app.db.managers import DateRecord
+from app.toolbox.birthdays.upcoming import UpcomingBirthdays
+
+
+def test_upcoming_birthdays_window_is_a_slice_of_days():
+    start = dt.date(2023, 5, 20)
+    records = [
+        DateRecord("today", 5, 20),
+        DateRecord("tomorrow", 5, 21),
+        DateRecord("in_a_week", 5, 27),
+        DateRecord("yesterday", 5, 19),
+    ]
+    upcoming = UpcomingBirthdays(start, records, scope=10)
+
+    assert [r.name for r in upcoming.today()] == ["today"]
+    assert [r.name for r in upcoming.future(1)] == ["tomorrow"]
+    assert [r.name for r in upcoming.future(7)] == ["tomorrow", "in_a_week"]
+
+
+def test_upcoming_birthdays_cross_new_year():
+    start = dt.date(2023, 12, 30)
+    records = [
+        DateRecord("new_year", 1, 1),
+        DateRecord("december", 12, 31),
+        DateRecord("leap_day", 2, 29),
+    ]
+    upcoming = UpcomingBirthdays(start, records, scope=3)
+
+    assert [r.name for r in upcoming.future(3)] == ["december", "new_year"]
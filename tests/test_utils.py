@@ -1,9 +1,22 @@
+import asyncio
 import datetime as dt
+import json
 from time import sleep
 
 import pytest
 
-from app.utils import BirthdayStorage, is_fresh
+from app import settings
+from app.utils import (
+    DAYS_KB,
+    MONTHS_KB,
+    BirthdayStorage,
+    ClockService,
+    days_grid_reply_kb,
+    is_fresh,
+    serialize_markup,
+)
+
+from .fixtures.servers import fake_time_api
 
 
 def test_birthday_storage_skips_irrelevant_keys():
@@ -76,6 +89,30 @@ def test_birthday_storage_messages_return_values_for_specific_keys():
     assert store.messages == expected
 
 
+def test_birthday_storage_patch_updates_messages_but_not_timestamp():
+    store = BirthdayStorage()
+    store["today"] = "hello world"
+    ts = store["ts"]
+
+    store.patch(today="updated", future="new", random="random")
+
+    assert store["ts"] == ts
+    assert store.messages == ["updated", "new"]
+    assert "random" not in store
+
+
+def test_birthday_storage_replace_drops_messages_missing_from_snapshot():
+    store = BirthdayStorage()
+    store["warning"] = "warning"
+    store["today"] = "yesterday"
+
+    store.replace(1.0, warning=None, today=None, future="future")
+
+    assert store["ts"] == 1.0
+    assert store.messages == ["future"]
+    assert "warning" not in store and "today" not in store
+
+
 def test_is_fresh_correctly_detect_fresh_data():
     now = dt.datetime.now().timestamp()
     assert is_fresh(now, {"minutes": 5}) == True
@@ -91,3 +128,54 @@ def test_is_fresh_return_false_for_invalid_args():
     assert is_fresh(now, {"hello": "world"}) == False
     assert is_fresh(now, {"seconds": "20"}) == False
     assert is_fresh("now", {}) == False
+
+
+@pytest.mark.asyncio
+async def test_clock_sync_uses_time_from_api(fake_time_api):
+    fake_time_api.unixtime = dt.datetime(
+        2023, 5, 20, 23, 30, tzinfo=dt.timezone.utc
+    ).timestamp()
+    clock = ClockService(url=fake_time_api.url)
+
+    assert await clock.sync() == True
+    assert clock.is_stale() == False
+    # It's already next day in Moscow.
+    assert clock.today() == dt.date(2023, 5, 21)
+    assert clock.now().tzinfo.zone == settings.TIME_ZONE.zone
+
+
+@pytest.mark.asyncio
+async def test_clock_sync_gives_up_after_timeout(fake_time_api):
+    fake_time_api.unixtime = 0
+    fake_time_api.latency = 1
+    clock = ClockService(url=fake_time_api.url, timeout=0.1)
+
+    assert await clock.sync() == False
+    assert clock.is_stale() == True
+    assert clock.today() == dt.datetime.now(settings.TIME_ZONE).date()
+
+
+@pytest.mark.asyncio
+async def test_clock_reads_time_without_network_and_syncs_in_background(
+    fake_time_api,
+):
+    clock = ClockService(url=fake_time_api.url, sync_interval=0.05)
+
+    clock.today()
+    assert fake_time_api.requests == 0
+
+    await clock.start()
+    assert fake_time_api.requests == 1
+    assert clock.is_stale() == False
+    await asyncio.sleep(0.08)
+    await clock.stop()
+    assert fake_time_api.requests == 2
+
+
+def test_prebuilt_keyboards_match_generated_ones():
+    february = json.loads(DAYS_KB["февраль"])
+    buttons = [button for row in february["keyboard"] for button in row]
+
+    assert DAYS_KB["май"] == serialize_markup(days_grid_reply_kb("май"))
+    assert buttons[-3:] == ["29", "❌ отмена", "🔄 начать заново"]
+    assert len(json.loads(MONTHS_KB)["keyboard"]) == 4
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from functools import partial
+
+import pytest
+import pytest_asyncio
+from aiogram import Bot, Dispatcher, types
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestClient, TestServer, unused_port
+
+import main
+from app import settings
+from app.metrics import REGISTRY
+from app.web import (
+    SECRET_HEADER,
+    EventLoopLag,
+    create_web_app,
+    start_metrics_server,
+    watch_event_loop,
+)
+
+from .fixtures.servers import fake_bot_api
+
+
+def make_update(text: str) -> dict:
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": 7, "type": "private"},
+            "from": {"id": 7, "is_bot": False, "first_name": "user"},
+            "text": text,
+        },
+    }
+
+
+@pytest_asyncio.fixture
+async def webhook_client(fake_bot_api):
+    bot = Bot(
+        token="42:fake",
+        server=TelegramAPIServer.from_base(fake_bot_api.url),
+    )
+    dp = Dispatcher(bot, storage=MemoryStorage())
+
+    async def echo(message: types.Message):
+        await message.answer(message.text)
+
+    dp.register_message_handler(echo)
+    client = TestClient(TestServer(create_web_app(dp, "/webhook")))
+    await client.start_server()
+    yield client
+    await client.close()
+    await (await bot.get_session()).close()
+
+
+@pytest.mark.asyncio
+async def test_webhook_passes_updates_to_dispatcher(
+    webhook_client, fake_bot_api
+):
+    response = await webhook_client.post("/webhook", json=make_update("hi"))
+
+    assert response.status == 200
+    assert [message["text"] for message in fake_bot_api.messages] == ["hi"]
+
+
+@pytest.mark.asyncio
+async def test_webhook_rejects_updates_without_secret(
+    webhook_client, fake_bot_api, monkeypatch
+):
+    monkeypatch.setattr(settings, "WEBHOOK_SECRET", "s3cret")
+
+    response = await webhook_client.post("/webhook", json=make_update("hi"))
+    assert response.status == 403
+
+    response = await webhook_client.post(
+        "/webhook", json=make_update("hi"), headers={SECRET_HEADER: "s3cret"}
+    )
+    assert response.status == 200
+    assert len(fake_bot_api.messages) == 1
+
+
+@pytest.mark.asyncio
+async def test_web_app_serves_health_and_metrics(webhook_client):
+    response = await webhook_client.get("/health")
+    body = await response.json()
+    assert body["status"] == "ok"
+    assert body["clock_synced"] == False
+
+    REGISTRY.counter("test_web_total", "Counter for web app test.").inc()
+    response = await webhook_client.get("/metrics")
+    assert response.status == 200
+    assert "test_web_total 1" in await response.text()
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_metrics_without_webhook():
+    port = unused_port()
+    runner = await start_metrics_server("127.0.0.1", port)
+    try:
+        async with ClientSession() as session:
+            url = f"http://127.0.0.1:{port}/metrics"
+            async with session.get(url) as response:
+                assert response.status == 200
+                assert "event_loop_lag_seconds" in await response.text()
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_watch_event_loop_records_lag_of_blocked_loop():
+    count, total = EventLoopLag.get(), EventLoopLag.sum()
+    watcher = asyncio.create_task(watch_event_loop(interval=0.01))
+    await asyncio.sleep(0)
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    watcher.cancel()
+
+    assert EventLoopLag.get() > count
+    assert EventLoopLag.sum() - total >= 0.03
+
+
+@pytest.mark.asyncio
+async def test_metrics_started_on_startup_are_stopped_on_shutdown(
+    monkeypatch,
+):
+    port = unused_port()
+    monkeypatch.setattr(
+        main,
+        "start_metrics_server",
+        partial(start_metrics_server, "127.0.0.1", port),
+    )
+    dp = Dispatcher(Bot(token="42:fake"))
+    stopped = []
+
+    async def startup(_):
+        pass
+
+    async def shutdown(_):
+        stopped.append(True)
+
+    await main.with_metrics(startup, serve=True)(dp)
+    watcher = dp["loop_watcher"]
+    await main.without_metrics(shutdown)(dp)
+    await asyncio.sleep(0)
+
+    assert stopped == [True]
+    assert watcher.cancelled()
+    async with ClientSession() as session:
+        with pytest.raises(OSError):
+            await session.get(f"http://127.0.0.1:{port}/metrics")
+    await (await dp.bot.get_session()).close()
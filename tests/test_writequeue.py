@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from app.toolbox.birthdays.writequeue import BirthdayWriteQueue
+
+
+class RecordingWriter:
+    """Writer that remembers every batch it was called with."""
+
+    def __init__(self, result: bool = True, delay: float = 0):
+        self.result = result
+        self.delay = delay
+        self.batches = []
+        self.reloads = 0
+
+    async def write(self, rows, user_ids):
+        self.batches.append((list(rows), list(user_ids)))
+        await asyncio.sleep(self.delay)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+    async def reload(self, rows):
+        self.reloads += 1
+
+
+@pytest.mark.asyncio
+async def test_write_queue_writes_concurrent_rows_in_one_batch():
+    writer = RecordingWriter()
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.05)
+
+    results = await asyncio.gather(
+        *(queue.submit([i, "май", "", f"partner{i}"], i) for i in range(5))
+    )
+
+    assert results == [True] * 5
+    assert len(writer.batches) == 1
+    rows, user_ids = writer.batches[0]
+    assert [row[-1] for row in rows] == [f"partner{i}" for i in range(5)]
+    assert user_ids == list(range(5))
+    assert writer.reloads == 1
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_write_queue_puts_rows_submitted_during_write_into_next_batch():
+    writer = RecordingWriter(delay=0.1)
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+
+    first = asyncio.create_task(queue.submit([1, "май", "", "first"], 1))
+    await asyncio.sleep(0.05)
+    second = asyncio.create_task(queue.submit([2, "май", "", "second"], 2))
+
+    assert await first == True
+    assert await second == True
+    assert [rows for rows, _ in writer.batches] == [
+        [[1, "май", "", "first"]],
+        [[2, "май", "", "second"]],
+    ]
+    assert writer.reloads == 2
+
+
+@pytest.mark.asyncio
+async def test_write_queue_reports_failure_to_every_submitter():
+    writer = RecordingWriter(result=False)
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+
+    results = await asyncio.gather(
+        queue.submit([1, "май", "", "first"]),
+        queue.submit([2, "май", "", "second"]),
+    )
+
+    assert results == [False, False]
+    assert writer.reloads == 0
+
+
+@pytest.mark.asyncio
+async def test_write_queue_treats_writer_exception_as_failure():
+    writer = RecordingWriter(result=RuntimeError("disk is down"))
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+
+    assert await queue.submit([1, "май", "", "first"]) == False
+    assert writer.reloads == 0
+
+
+@pytest.mark.asyncio
+async def test_write_queue_enqueue_returns_at_once_and_calls_on_done():
+    writer = RecordingWriter(delay=0.05)
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+    reports = []
+
+    async def on_done(written):
+        reports.append((written, writer.reloads))
+
+    future = queue.enqueue([1, "май", "", "first"], 1, on_done=on_done)
+    assert not future.done()
+    assert reports == []
+
+    await queue.join()
+    assert future.result() == True
+    # User is notified once new birthdays are shown by the bot.
+    assert reports == [(True, 1)]
+    assert writer.reloads == 1
+
+
+@pytest.mark.asyncio
+async def test_write_queue_calls_on_written_right_after_write():
+    writer = RecordingWriter()
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+    events = []
+
+    async def on_done(written):
+        events.append("done")
+
+    queue.enqueue(
+        [1, "май", "", "first"],
+        1,
+        on_done=on_done,
+        on_written=lambda: events.append(("written", writer.reloads)),
+    )
+    await queue.join()
+
+    assert events == [("written", 0), "done"]
+
+    writer.result = False
+    queue.enqueue(
+        [2, "май", "", "second"], 2, on_written=lambda: events.append(2)
+    )
+    await queue.join()
+    assert 2 not in events
+
+
+@pytest.mark.asyncio
+async def test_write_queue_survives_failing_on_done_callback():
+    writer = RecordingWriter()
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+
+    async def on_done(written):
+        raise RuntimeError("chat not found")
+
+    queue.enqueue([1, "май", "", "first"], 1, on_done=on_done)
+    assert await queue.submit([2, "май", "", "second"], 2) == True
+    await queue.join()
+    assert writer.reloads == 1
+
+
+@pytest.mark.asyncio
+async def test_write_queue_submit_many_writes_rows_in_one_batch():
+    writer = RecordingWriter()
+    queue = BirthdayWriteQueue(writer.write, writer.reload, window=0.01)
+
+    rows = [[i, "май", "", f"partner{i}"] for i in range(100)]
+    assert await queue.submit_many(rows, 1) == True
+    assert len(writer.batches) == 1
+    assert writer.batches[0] == (rows, [1] * 100)
+    assert writer.reloads == 1